@@ -0,0 +1,122 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""AST memory benchmark.
+
+Parses generated programs of growing size and reports the bytes held
+per AST node: the node, its token, the children list and any instance
+dictionaries, together with the parse time.  The last column is the
+bytes per node of the same tree in an ASTArena.
+
+Usage: python benchmarks/bench_ast.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.arena import ASTArena
+from tinypie.interpreter import Interpreter
+from tinypie.lexer import Lexer
+from tinypie.parser import TokenStreamParser
+
+FUNCTION = """
+def f%(index)d(n, m):
+    s = 'start'
+    while n < m:
+        n = n + %(index)d * (m - 1)
+    .
+    return n
+.
+print f%(index)d(%(index)d, 2)
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+def object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def tree_size(tree):
+    """Return (nodes, bytes) of the tree, shared objects counted once."""
+    seen = set()
+    nodes = total = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        for obj in (node, node.token, node.children):
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                total += object_size(obj)
+        stack.extend(node.children)
+    return nodes, total
+
+
+def arena_size(arena):
+    arrays = (arena.kinds, arena.texts, arena.first_child,
+              arena.next_sibling, arena.last_child)
+    return (sum(len(values) * values.itemsize for values in arrays) +
+            sum(sys.getsizeof(text) for text in arena.strings))
+
+
+def measure(text):
+    start = time.time()
+    tree = Interpreter().parse(text)
+    elapsed = time.time() - start
+    nodes, size = tree_size(tree)
+    arena = ASTArena()
+    TokenStreamParser(Lexer(text).tokenize(), interpreter=Interpreter(),
+                      arena=arena).parse()
+    return nodes, size, elapsed, arena_size(arena)
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print '%8s %12s %10s %10s %10s' % (
+        'nodes', 'bytes', 'per node', 'parse', 'arena')
+    for functions in (250, 500, 1000, 2000):
+        text = generate(functions)
+        results = [measure(text) for _ in range(repeat)]
+        nodes, size = results[0][:2]
+        print '%8d %12d %10.1f %9.3fs %10.1f' % (
+            nodes, size, float(size) / nodes,
+            min(result[2] for result in results),
+            float(results[0][3]) / nodes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""AST visualizer benchmark.
+
+Writes the DOT graph of generated programs of growing size to a null
+file object with ASTVisualizer.write.
+
+Usage: python benchmarks/bench_astviz.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.astviz import ASTVisualizer
+from tinypie.interpreter import Interpreter
+
+FUNCTION = """
+def f%(index)d(a, b, c):
+    x = (a + b * %(index)d - c) * (a - 1) + b * c * 2 - (c + %(index)d)
+    if x + a * b < c * (b - a) + 1 return a * a + b * b - c
+    return x == a + b + c + f(a - 1, b * 2, c + 3 * a)
+.
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+class NullOutput(object):
+
+    def write(self, text):
+        pass
+
+
+def count_nodes(tree):
+    stack = [tree]
+    count = 0
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
+
+
+def write(tree):
+    start = time.time()
+    ASTVisualizer(tree).write(NullOutput())
+    return time.time() - start
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print '%8s %10s %12s' % ('nodes', 'write', 'nodes/s')
+    for functions in (250, 500, 1000, 2000):
+        tree = Interpreter().parse(generate(functions))
+        nodes = count_nodes(tree)
+        elapsed = min(write(tree) for _ in range(repeat))
+        print '%8d %9.3fs %12d' % (nodes, elapsed, nodes / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+"""Function call overhead benchmark.
+
+Runs recursive TinyPie programs under every tree-based engine, with
+and without memoization, and reports the average time per TinyPie
+function call made by the program.
+
+Usage: python benchmarks/bench_calls.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+import StringIO
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.interpreter import Interpreter
+from tinypie.closure import ClosureInterpreter
+
+PROGRAMS = [
+    # name, number of calls, source
+    ('factorial', 20 * 300, """
+def factorial(x):
+    if x < 2 return 1
+    return x * factorial(x - 1)
+.
+i = 0
+while i < 300:
+    factorial(20)
+    i = i + 1
+.
+"""),
+    ('fib', 21891, """
+def fib(n):
+    if n < 2 return n
+    return fib(n - 1) + fib(n - 2)
+.
+print fib(20)
+"""),
+    ]
+
+ENGINES = [
+    ('tree', Interpreter),
+    ('closures', ClosureInterpreter),
+    ('tree-memo', partial(Interpreter, memoize=True)),
+    ('clos-memo', partial(ClosureInterpreter, memoize=True)),
+    ]
+
+
+def run(engine, source):
+    old, sys.stdout = sys.stdout, StringIO.StringIO()
+    try:
+        interp = engine()
+        tree = interp.parse(source)
+        start = time.time()
+        interp.execute(tree)
+        return time.time() - start
+    finally:
+        sys.stdout = old
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for name, calls, source in PROGRAMS:
+        for engine_name, engine in ENGINES:
+            best = min(run(engine, source) for _ in range(repeat))
+            print '%-10s %-10s %8.3fs %8.2fus/call' % (
+                name, engine_name, best, best / calls * 1e6)
+
+
+if __name__ == '__main__':
+    main()
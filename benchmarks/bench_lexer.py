@@ -0,0 +1,96 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""Lexer benchmark.
+
+Lexes generated sources of growing size token by token with
+Lexer.token() and in one pass with Lexer.tokenize(), and compares the
+time and the memory held by the resulting tokens.
+
+Usage: python benchmarks/bench_lexer.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.lexer import Lexer
+
+FUNCTION = """
+def f%(index)d(n, m):  # generated
+    s = 'start'
+    while n < m:
+        n = n + %(index)d * (m - 1)
+    .
+    return n
+.
+print f%(index)d(%(index)d, 2)
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+def token_size(tokens):
+    return sys.getsizeof(tokens) + sum(
+        sys.getsizeof(token) + sys.getsizeof(token.text)
+        for token in tokens)
+
+
+def stream_size(stream):
+    return sum(len(array) * array.itemsize
+               for array in (stream.kinds, stream.starts, stream.ends))
+
+
+def measure(text):
+    start = time.time()
+    tokens = list(Lexer(text))
+    lexed = time.time()
+    stream = Lexer(text).tokenize()
+    return (len(stream), lexed - start, time.time() - lexed,
+            token_size(tokens), stream_size(stream))
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print '%8s %10s %10s %12s %12s' % (
+        'tokens', 'token()', 'tokenize()', 'Token bytes', 'array bytes')
+    for functions in (500, 1000, 2000, 4000):
+        text = generate(functions)
+        results = [measure(text) for _ in range(repeat)]
+        count, _, _, objects, arrays = results[0]
+        print '%8d %9.3fs %9.3fs %12d %12d' % (
+            count, min(result[1] for result in results),
+            min(result[2] for result in results), objects, arrays)
+
+
+if __name__ == '__main__':
+    main()
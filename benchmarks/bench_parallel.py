@@ -0,0 +1,94 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""Parallel front-end benchmark.
+
+Times Interpreter.parse of a large generated program parsed in the
+calling process and by a ParallelParser with a growing number of worker
+processes.  The time includes sending the trees back, so it only drops
+with more processes when there are cores to run them.
+
+Usage: python benchmarks/bench_parallel.py [repeat] [functions]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.interpreter import Interpreter
+from tinypie.parallel import ParallelParser
+
+FUNCTION = """
+def f%(index)d(n, m):
+    s = 'start'
+    while n < m:
+        n = n + %(index)d * (m - 1)
+    .
+    return n
+.
+print f%(index)d(%(index)d, 2)
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    functions = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    text = generate(functions)
+    print '%d bytes, %d cores' % (len(text), multiprocessing.cpu_count())
+    print '%9s %10s' % ('processes', 'parse')
+    serial = min(timed(lambda: Interpreter().parse(text))
+                 for _ in range(repeat))
+    print '%9s %9.3fs' % ('-', serial)
+    for processes in (1, 2, 4, 8):
+        parser = ParallelParser(processes)
+        try:
+            # start the pool outside of the timing
+            Interpreter(parallel_parser=parser).parse(text)
+            parse = min(
+                timed(lambda: Interpreter(parallel_parser=parser).parse(text))
+                for _ in range(repeat))
+        finally:
+            parser.close()
+        print '%9d %9.3fs' % (processes, parse)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""Parse cache benchmark.
+
+Times Interpreter.parse of generated programs of growing size without a
+cache and with a warm ParseCache, which loads the pickled tree instead
+of lexing and parsing.
+
+Usage: python benchmarks/bench_parsecache.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.interpreter import Interpreter
+from tinypie.parsecache import ParseCache
+
+FUNCTION = """
+def f%(index)d(n, m):
+    s = 'start'
+    while n < m:
+        n = n + %(index)d * (m - 1)
+    .
+    return n
+.
+print f%(index)d(%(index)d, 2)
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    directory = tempfile.mkdtemp()
+    try:
+        cache = ParseCache(directory)
+        print '%8s %10s %10s' % ('bytes', 'parse', 'cached')
+        for functions in (250, 500, 1000, 2000):
+            text = generate(functions)
+            Interpreter(parse_cache=cache).parse(text)
+            parse = min(timed(lambda: Interpreter().parse(text))
+                        for _ in range(repeat))
+            cached = min(
+                timed(lambda: Interpreter(parse_cache=cache).parse(text))
+                for _ in range(repeat))
+            print '%8d %9.3fs %9.3fs' % (len(text), parse, cached)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
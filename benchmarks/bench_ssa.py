@@ -0,0 +1,104 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+"""SSA construction and optimization benchmark.
+
+Generates programs of growing size, one function with a loop and
+branches per block of statements, and times building the SSA form and
+running every pass. The time per instruction should stay flat as the
+program grows.
+
+Usage: python benchmarks/bench_ssa.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.compiler import global_indexes
+from tinypie.interpreter import Interpreter
+from tinypie.ssa import SSABuilder, SSAOptimizer
+from tinypie.typeinfer import TypeInference
+
+FUNCTION = """
+def f%(index)d(n, m):
+    i = 0
+    s = %(index)d
+    while i < n:
+        a = i * m + 2 * 3
+        b = i * m + 1
+        if a < b:
+            s = s + a
+        .
+        else:
+            s = s + b * 2
+        .
+        i = i + 1
+    .
+    return s + n * m
+.
+print f%(index)d(%(index)d, 2)
+"""
+
+
+def generate(functions):
+    return ''.join(FUNCTION % {'index': index} for index in range(functions))
+
+
+def measure(text):
+    interp = Interpreter()
+    tree = interp.parse(text)
+    TypeInference().infer(tree)
+
+    start = time.time()
+    functions = SSABuilder(interp.global_scope, global_indexes(tree)).build(
+        tree)
+    built = time.time()
+    size = sum(len(block.phis) + len(block.instructions)
+               for function in functions for block in function.blocks)
+    SSAOptimizer().optimize(functions)
+    return size, built - start, time.time() - built
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print '%8s %12s %12s %14s' % ('size', 'build', 'optimize', 'us/instr')
+    for functions in (100, 200, 400, 800):
+        text = generate(functions)
+        results = [measure(text) for _ in range(repeat)]
+        size = results[0][0]
+        build = min(result[1] for result in results)
+        optimize = min(result[2] for result in results)
+        print '%8d %11.3fs %11.3fs %14.1f' % (
+            size, build, optimize, (build + optimize) * 1e6 / size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+"""Register VM benchmark.
+
+Compiles TinyPie programs to bytecode and runs them in the VM with
+and without quickening. 'add' is called with strings too, so the
+compiler cannot prove the types of the loop variables and emits
+generic instructions.
+
+Usage: python benchmarks/bench_vm.py [repeat]
+"""
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import sys
+import time
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tinypie.lexer import AssemblerLexer
+from tinypie.assembler import BytecodeAssembler
+from tinypie.compiler import compile_source
+from tinypie.vm import VM
+
+PROGRAMS = [
+    ('loop', """
+def add(x, y) return x + y
+i = 0
+s = 0
+while i < 30000:
+    s = add(s, i * 2)
+    i = add(i, 1)
+.
+print s
+print add('a', 'b')
+"""),
+    ('fib', """
+def fib(n):
+    if n < 2 return n
+    return fib(n - 1) + fib(n - 2)
+.
+print fib(18)
+"""),
+    ]
+
+
+def run(asm, quicken):
+    assembler = BytecodeAssembler(AssemblerLexer(asm))
+    assembler.parse()
+    vm = VM(assembler, quicken=quicken)
+    old, sys.stdout = sys.stdout, StringIO.StringIO()
+    try:
+        start = time.time()
+        vm.execute()
+        return time.time() - start
+    finally:
+        sys.stdout = old
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for name, source in PROGRAMS:
+        asm = compile_source(source)
+        for quicken in (False, True):
+            best = min(run(asm, quicken) for _ in range(repeat))
+            print '%-10s %-12s %8.3fs' % (
+                name, 'quicken' if quicken else 'generic', best)
+
+
+if __name__ == '__main__':
+    main()
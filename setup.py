@@ -34,5 +34,5 @@ setup(
     classifiers=filter(None, classifiers.split('\n')),
     long_description=read('README.md') + '\n\n' + read('CHANGES.txt'),
     include_package_data=True,
-    extras_require={'test': ['Jinja2']}
+    extras_require={'test': []}
     )
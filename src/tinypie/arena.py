@@ -0,0 +1,315 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import struct
+from array import array
+
+from tinypie.ast import AST
+from tinypie.lexer import Token
+
+NO_NODE = -1
+
+# node count, type count, string count
+HEADER = struct.Struct('<3I')
+
+
+class ASTArena(object):
+    """AST stored as parallel arrays.
+
+    Node i has type types[kinds[i]], text strings[texts[i]], its first
+    child first_child[i] and its next sibling next_sibling[i], NO_NODE
+    when there is none.  Type names and texts are stored once.  Symbols
+    and scopes the parser attaches to nodes are kept in dictionaries
+    keyed by node index.
+
+    >>> from tinypie import tokens
+    >>> from tinypie.arena import ASTArena
+    >>> from tinypie.lexer import Token
+    >>> arena = ASTArena()
+    >>> call = arena.node(tokens.CALL)
+    >>> call.add_child(arena.node(Token(tokens.ID, 'foo')))
+    >>> call.add_child(arena.node(Token(tokens.INT, '3')))
+    >>> print call.to_string_tree()
+    (<'', CALL> <'foo', ID> <'3', INT>)
+    >>> list(arena.children(call.index))
+    [1, 2]
+    >>> arena.type(1), arena.text(1)
+    ('ID', 'foo')
+    >>> print ASTArena.loads(arena.dumps()).to_string_tree(call.index)
+    (<'', CALL> <'foo', ID> <'3', INT>)
+
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.texts = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.last_child = array('i')
+        self.types = []
+        self.type_index = {}
+        self.strings = []
+        self.string_index = {}
+        self.symbols = {}
+        self.scopes = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add(self, type, text=''):
+        """Add a node without children and return its index."""
+        kind = self.type_index.get(type)
+        if kind is None:
+            kind = self.type_index[type] = len(self.types)
+            self.types.append(type)
+        string = self.string_index.get(text)
+        if string is None:
+            string = self.string_index[text] = len(self.strings)
+            self.strings.append(text)
+        index = len(self.kinds)
+        self.kinds.append(kind)
+        self.texts.append(string)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        return index
+
+    def add_child(self, parent, child):
+        last = self.last_child[parent]
+        if last == NO_NODE:
+            self.first_child[parent] = child
+        else:
+            self.next_sibling[last] = child
+        self.last_child[parent] = child
+
+    def node(self, token=None):
+        """Add a node for the token, the same way as AST(token)."""
+        if not isinstance(token, Token):
+            token = Token(token)
+        return ArenaNode(self, self.add(token.type, token.text))
+
+    def children(self, index):
+        child = self.first_child[index]
+        next_sibling = self.next_sibling
+        while child != NO_NODE:
+            yield child
+            child = next_sibling[child]
+
+    def type(self, index):
+        return self.types[self.kinds[index]]
+
+    def text(self, index):
+        return self.strings[self.texts[index]]
+
+    def to_string_tree(self, index):
+        """Same output as AST.to_string_tree of the materialized node."""
+        node = str(Token(self.type(index), self.text(index)))
+        if self.first_child[index] == NO_NODE:
+            return node
+        return '(%s %s)' % (node, ' '.join(
+            self.to_string_tree(child) for child in self.children(index)))
+
+    def to_ast(self, index):
+        """Build AST objects for the node and its subtree.
+
+        Function symbols get the built block as their block_ast.
+        """
+        nodes = self.to_ast_nodes()
+        for symbol in self.symbols.itervalues():
+            block = getattr(symbol, 'block_ast', None)
+            if isinstance(block, ArenaNode) and block.arena is self:
+                symbol.block_ast = nodes[block.index]
+        return nodes[index]
+
+    def to_ast_nodes(self):
+        """Return a list with an AST node for every arena node.
+
+        The nodes are linked like the arena and get its symbols and
+        scopes.  Nodes with the same type and text share one Token.
+        """
+        types, strings = self.types, self.strings
+        first_child, next_sibling = self.first_child, self.next_sibling
+        tokens = {}
+        nodes = []
+        add_node = nodes.append
+        for key in zip(self.kinds, self.texts):
+            token = tokens.get(key)
+            if token is None:
+                kind, text = key
+                token = tokens[key] = Token(types[kind], strings[text])
+            add_node(AST(token))
+
+        for index, child in enumerate(first_child):
+            if child != NO_NODE:
+                children = []
+                while child != NO_NODE:
+                    children.append(nodes[child])
+                    child = next_sibling[child]
+                nodes[index].children = children
+        for index, symbol in self.symbols.iteritems():
+            nodes[index].symbol = symbol
+        for index, scope in self.scopes.iteritems():
+            nodes[index].scope = scope
+        return nodes
+
+    @classmethod
+    def from_ast(cls, tree, indexes=None):
+        """Return an arena with the tree, its root is node 0.
+
+        Symbols and scopes of the nodes are kept.  The indexes dict, if
+        given, maps id() of every node to its index.
+        """
+        arena = cls()
+        stack = [(tree, NO_NODE)]
+        while stack:
+            node, parent = stack.pop()
+            index = arena.add(node.type, node.text)
+            if indexes is not None:
+                indexes[id(node)] = index
+            symbol = getattr(node, 'symbol', None)
+            if symbol is not None:
+                arena.symbols[index] = symbol
+            scope = getattr(node, 'scope', None)
+            if scope is not None:
+                arena.scopes[index] = scope
+            if parent != NO_NODE:
+                arena.add_child(parent, index)
+            stack.extend((child, index) for child in reversed(node.children))
+        return arena
+
+    def dumps(self):
+        """Serialize the arena into a string, see loads.
+
+        Symbols and scopes are not serialized.
+        """
+        names = self.types + self.strings
+        lengths = array('i', [len(name) for name in names])
+        return ''.join([
+            HEADER.pack(len(self.kinds), len(self.types), len(self.strings)),
+            lengths.tostring(), ''.join(names),
+            self.kinds.tostring(), self.texts.tostring(),
+            self.first_child.tostring(), self.next_sibling.tostring(),
+            self.last_child.tostring()])
+
+    @classmethod
+    def loads(cls, data):
+        count, type_count, string_count = HEADER.unpack_from(data)
+        pos = HEADER.size
+        lengths = array('i')
+        end = pos + (type_count + string_count) * lengths.itemsize
+        lengths.fromstring(data[pos:end])
+        pos = end
+        names = []
+        for length in lengths:
+            names.append(data[pos:pos + length])
+            pos += length
+
+        arena = cls()
+        arena.types = names[:type_count]
+        arena.strings = names[type_count:]
+        arena.type_index = dict(
+            (name, kind) for kind, name in enumerate(arena.types))
+        arena.string_index = dict(
+            (text, index) for index, text in enumerate(arena.strings))
+        for values in (arena.kinds, arena.texts, arena.first_child,
+                       arena.next_sibling, arena.last_child):
+            end = pos + count * values.itemsize
+            values.fromstring(data[pos:end])
+            pos = end
+        return arena
+
+
+class ArenaNode(object):
+    """Node of an ASTArena with the AST interface.
+
+    Lets the parser build an arena and read-only walkers such as
+    ASTVisualizer traverse it.  Views are created on demand and hold
+    no node data.
+    """
+
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def type(self):
+        return self.arena.type(self.index)
+
+    @property
+    def text(self):
+        return self.arena.text(self.index)
+
+    @property
+    def token(self):
+        return Token(self.type, self.text)
+
+    @property
+    def children(self):
+        arena = self.arena
+        return [ArenaNode(arena, child)
+                for child in arena.children(self.index)]
+
+    def _get_symbol(self):
+        try:
+            return self.arena.symbols[self.index]
+        except KeyError:
+            raise AttributeError('symbol')
+
+    def _set_symbol(self, symbol):
+        self.arena.symbols[self.index] = symbol
+
+    symbol = property(_get_symbol, _set_symbol)
+
+    def _get_scope(self):
+        try:
+            return self.arena.scopes[self.index]
+        except KeyError:
+            raise AttributeError('scope')
+
+    def _set_scope(self, scope):
+        self.arena.scopes[self.index] = scope
+
+    scope = property(_get_scope, _set_scope)
+
+    def add_child(self, child):
+        self.arena.add_child(self.index, child.index)
+
+    def is_null(self):
+        return False
+
+    def to_string_tree(self):
+        return self.arena.to_string_tree(self.index)
+
+    def to_ast(self):
+        return self.arena.to_ast(self.index)
+
+    def __str__(self):
+        return str(self.token)
+
+    def __eq__(self, other):
+        return self.type == other.type and self.text == other.text
@@ -25,6 +25,11 @@
 __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
 from tinypie import bytecode
+from tinypie import tokens
+from tinypie.lexer import AssemblerLexer
+
+# Instructions after which control never reaches the next line
+UNCONDITIONAL = ('br', 'ret', 'halt')
 
 
 def get_int(code, address):
@@ -226,3 +231,216 @@ class DisAssembler(object):
             operands=', '.join(result))
 
         return index, output
+
+
+class DeadCodeStripper(object):
+    """Removes dead code from assembly text before it is assembled.
+
+    - functions 'main' cannot reach through calls, branches or by
+      running off its end into the next function
+    - instructions after br, ret and halt up to the next label that
+      some branch jumps to
+    - labels no branch jumps to and branches to the next instruction
+
+    Text without a 'main' function is returned unchanged.
+
+    >>> from tinypie.asmutils import DeadCodeStripper
+    >>>
+    >>> stripper = DeadCodeStripper()
+    >>> print stripper.strip('''
+    ... .def main: args=0, locals=1
+    ...     call foo, r0
+    ...     br end
+    ...     print r1
+    ... end:
+    ...     halt
+    ... .def foo: args=0, locals=0
+    ...     ret
+    ... .def unused: args=0, locals=0
+    ...     ret
+    ... ''')
+    <BLANKLINE>
+    .def main: args=0, locals=1
+        call foo, r0
+        halt
+    .def foo: args=0, locals=0
+        ret
+    <BLANKLINE>
+    >>> print stripper.report()
+    dead code stripping: 1 functions, 2 instructions, 1 labels removed
+
+    """
+
+    name = 'dead code stripping'
+
+    def __init__(self):
+        self.functions = 0
+        self.instructions = 0
+        self.labels = 0
+
+    def strip(self, text):
+        """Return assembly text without dead code."""
+        lines = text.split('\n')
+        prelude, functions = self._split(lines)
+        if 'main' not in [function[0] for function in functions]:
+            return text
+
+        # line index -> instruction name and branch or call target
+        live = {}
+        for _, items in functions:
+            for index, kind, name, target in items:
+                if kind == 'instruction':
+                    live[index] = (name, target)
+
+        while True:
+            reachable, entered = self._reachable_functions(functions, live)
+            before = len(live)
+            self._remove_unreachable_code(functions, reachable, entered,
+                                          live)
+            self._remove_redundant_jumps(functions, reachable, live)
+            if len(live) == before:
+                break
+
+        referenced = set(target for name, target in live.values()
+                         if name != 'call')
+        kept = set(prelude)
+        for name, items in functions:
+            if name not in reachable:
+                self.functions += 1
+                continue
+            for index, kind, _, target in items:
+                if kind == 'instruction' and index not in live:
+                    self.instructions += 1
+                elif kind == 'label' and target not in referenced:
+                    self.labels += 1
+                else:
+                    kept.add(index)
+
+        return '\n'.join(line for index, line in enumerate(lines)
+                         if index in kept)
+
+    def report(self):
+        return '%s: %d functions, %d instructions, %d labels removed' % (
+            self.name, self.functions, self.instructions, self.labels)
+
+    # Helper methods
+    def _split(self, lines):
+        """Return (prelude line indexes, [(name, items)]).
+
+        Items are (line index, kind, instruction name, target) where
+        kind is 'def', 'label', 'instruction' or 'blank' and target is
+        the name of a label or of the function a branch or call goes to.
+        """
+        prelude = []
+        functions = []
+        for index, line in enumerate(lines):
+            lexer = AssemblerLexer(line + '\n')
+            line_tokens = []
+            token = lexer.token()
+            while token.type not in (tokens.NL, tokens.EOF):
+                line_tokens.append(token)
+                token = lexer.token()
+
+            if line_tokens and line_tokens[0].type == tokens.DEF:
+                functions.append((line_tokens[1].text,
+                                  [(index, 'def', None, None)]))
+                continue
+
+            if not functions:
+                prelude.append(index)
+                continue
+
+            items = functions[-1][1]
+            if not line_tokens:
+                items.append((index, 'blank', None, None))
+            elif (len(line_tokens) == 2 and
+                  line_tokens[1].type == tokens.COLON):
+                items.append((index, 'label', None, line_tokens[0].text))
+            else:
+                name = line_tokens[0].text
+                operands = [token.text for token in line_tokens[1:]
+                            if token.type != tokens.COMMA]
+                target = None
+                if name in ('br', 'call'):
+                    target = operands[0]
+                elif name in ('brt', 'brf'):
+                    target = operands[-1]
+                items.append((index, 'instruction', name, target))
+
+        return prelude, functions
+
+    def _reachable_functions(self, functions, live):
+        owners = {}
+        for position, (_, items) in enumerate(functions):
+            for _, kind, _, target in items:
+                if kind == 'label':
+                    owners[target] = position
+        positions = dict((name, position)
+                         for position, (name, _) in enumerate(functions))
+
+        # functions entered at the top: called or fallen into
+        entered = set(['main'])
+        reachable = set()
+        worklist = [positions['main']]
+        while worklist:
+            position = worklist.pop()
+            name, items = functions[position]
+            if name in reachable:
+                continue
+            reachable.add(name)
+
+            last = None
+            for index, kind, _, _ in items:
+                if index not in live:
+                    continue
+                instruction, target = last = live[index]
+                if instruction == 'call' and target in positions:
+                    entered.add(target)
+                    worklist.append(positions[target])
+                elif target in owners:
+                    worklist.append(owners[target])
+
+            if (last is None or last[0] not in UNCONDITIONAL) and (
+                position + 1 < len(functions)):
+                # runs off its end into the next function
+                entered.add(functions[position + 1][0])
+                worklist.append(position + 1)
+
+        return reachable, entered
+
+    def _remove_unreachable_code(self, functions, reachable, entered, live):
+        for name, items in functions:
+            if name not in reachable:
+                for index, _, _, _ in items:
+                    live.pop(index, None)
+
+        referenced = set(target for name, target in live.values()
+                         if name != 'call')
+        for name, items in functions:
+            # a function only branched into starts at a label
+            reached = name in entered
+            for index, kind, _, target in items:
+                if kind == 'label':
+                    reached = reached or target in referenced
+                elif index in live:
+                    if not reached:
+                        del live[index]
+                    elif live[index][0] in UNCONDITIONAL:
+                        reached = False
+
+    def _remove_redundant_jumps(self, functions, reachable, live):
+        for name, items in functions:
+            if name not in reachable:
+                continue
+
+            # branch waiting to see if its label comes next
+            pending = None
+            for index, kind, _, target in items:
+                if kind == 'label':
+                    if pending is not None and live[pending][1] == target:
+                        del live[pending]
+                        pending = None
+                elif index in live:
+                    pending = None
+                    if live[index][0] in ('br', 'brt', 'brf'):
+                        pending = index
@@ -29,9 +29,14 @@ from tinypie.lexer import Token
 
 class AST(object):
 
+    # Attributes set by later passes are slots too, nodes have no __dict__
+    __slots__ = ('token', 'children', 'symbol', 'scope', 'slot',
+                 'global_slot', 'static_type')
+
     def __init__(self, token=None):
         self.token = token if isinstance(token, Token) else Token(token)
-        self.children = []
+        # leaves share the empty tuple, add_child makes a list
+        self.children = ()
 
     @property
     def type(self):
@@ -42,7 +47,10 @@ class AST(object):
         return self.token.text
 
     def add_child(self, child):
-        self.children.append(child)
+        if self.children:
+            self.children.append(child)
+        else:
+            self.children = [child]
 
     def is_null(self):
         return self.token is None
@@ -25,39 +25,58 @@
 __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
 import sys
+import optparse
+from cStringIO import StringIO
 
-from jinja2 import Template
-
-from tinypie.lexer import Lexer
-from tinypie.parser import Parser
+from tinypie import tokens
+from tinypie.lexer import Lexer, map_file
+from tinypie.parser import TokenStreamParser
 from tinypie.scope import GlobalScope
 
 
-DOT_TEMPLATE = """\
+DOT_HEADER = """\
 digraph astgraph {
    node [shape=plaintext, fontsize=12, fontname="Courier", height=.1];
    ranksep=.3;
    edge [arrowsize=.5]
 
-{% for node in nodes %}\
-   {{ node }}
-{% endfor %}
-{% for edge in edges %}\
-   {{ edge }}
-{% endfor %}\
-}
 """
 
-NODE_TEMPLATE = '{{ name }} [label="{{ text }}"];'
+NODE_FORMAT = '   node%d [label="%s"];\n'
+
+EDGE_FORMAT = '   node%d -> node%d\n'
+
+
+def label(node):
+    """Return the DOT label of the node, its type and text."""
+    payload, text = node.type, node.text
+    if text:
+        payload = '%s (%s)' % (payload, text)
+    return payload.replace('\\', '\\\\').replace('"', '\\"')
 
-EDGE_TEMPLATE = '{{ from }} -> {{ to }}'
+
+def find_function(tree, name):
+    """Return the FUNC_DEF node of the function name or None.
+
+    Functions are only defined at the top level of the tree, the last
+    definition of the name wins.
+    """
+    found = None
+    for node in tree.children:
+        if node.type == tokens.FUNC_DEF and node.children[0].text == name:
+            found = node
+    return found
 
 
 class ASTVisualizer(object):
     """DOT generator.
 
-    Generates DOT commands by walking the AST tree and using
-    Jinja2 templates as a DSL for output generation.
+    Generates DOT commands by walking the AST tree and writing nodes
+    and edges to a file object as they are visited.  The tree is walked
+    with an explicit stack, its depth is not limited by the recursion
+    limit, and only nodes up to max_depth levels below the root are
+    drawn when it is given.  The tree can also be the root
+    arena.ArenaNode of an ASTArena or any subtree.
 
     Example usage:
 
@@ -93,51 +112,88 @@ class ASTVisualizer(object):
        node1 -> node2
     }
 
+    Large trees are better written straight to a file:
+
+    >>> import sys
+    >>> from tinypie.astviz import find_function
+    >>> source = '''
+    ... def double(x) return x * 2
+    ... print double(21)
+    ... '''
+    >>> parser = Parser(Lexer(source), interpreter=Interpreter())
+    >>> parser.parse()
+    >>> tree = find_function(parser.root, 'double')
+    >>> ASTVisualizer(tree, max_depth=1).write(sys.stdout)
+    digraph astgraph {
+    ...
+       node1 [label="FUNC_DEF"];
+       node2 [label="ID (double)"];
+       node3 [label="ID (x)"];
+       node4 [label="BLOCK"];
+    <BLANKLINE>
+       node1 -> node2
+       node1 -> node3
+       node1 -> node4
+    }
+
     """
 
-    def __init__(self, tree):
+    def __init__(self, tree, max_depth=None):
         self.tree = tree
-        self.count = 1
+        self.max_depth = max_depth
 
     def __str__(self):
-        self.count = 1
-
-        def _render_templates(values):
-            return [template.render(context) for template, context in values]
-
-        nodes, edges = [], []
-        self.walk(self.tree, nodes, edges)
-        template = Template(DOT_TEMPLATE)
-        output = template.render(
-            nodes=_render_templates(nodes), edges=_render_templates(edges))
-
-        return output
-
-    def walk(self, node, nodes, edges):
-        result = parent_tmpl, parent_context = self._get_node_template(node)
-        nodes.append(result)
-
-        for child in node.children:
-            _, child_context = self.walk(child, nodes, edges)
-            from_text = parent_context['name']
-            to_text = child_context['name']
-            edges.append(self._get_edge_template(from_text, to_text))
-
-        return (parent_tmpl, parent_context)
-
-    def _get_node_template(self, node):
-        payload, text = node.type, node.text
-        if text:
-            payload = '%s (%s)' % (payload, text)
-        template = Template(NODE_TEMPLATE)
-        context = {'name': 'node%s' % self.count, 'text': payload}
-        self.count += 1
-        return (template, context)
-
-    @staticmethod
-    def _get_edge_template(from_text, to_text):
-        template = Template(EDGE_TEMPLATE)
-        return template, {'from': from_text, 'to': to_text}
+        output = StringIO()
+        self.write(output)
+        return output.getvalue().rstrip('\n')
+
+    def write(self, output):
+        """Write the DOT graph of the tree to the output file object.
+
+        Nodes are written by one walk over the tree and edges by another
+        one, nothing but the path to the current node is kept.
+        """
+        write = output.write
+        write(DOT_HEADER)
+        for number, node, _ in self.walk():
+            if node is not None:
+                write(NODE_FORMAT % (number, label(node)))
+        write('\n')
+        for number, node, parent in self.walk():
+            if node is None and parent is not None:
+                write(EDGE_FORMAT % (parent, number))
+        write('}\n')
+
+    def walk(self):
+        """Walk the tree depth first.
+
+        Yield (number, node, parent number) when a node is entered and
+        (number, None, parent number) when its subtree is done.  Nodes
+        are numbered from 1 in the order they are entered.
+        """
+        max_depth = self.max_depth
+        number = 1
+        yield number, self.tree, None
+        children = self.tree.children
+        if max_depth is not None and max_depth < 1:
+            children = ()
+        # (children left to enter, node number, parent number)
+        stack = [(iter(children), number, None)]
+        while stack:
+            children, current, parent = stack[-1]
+            for child in children:
+                break
+            else:
+                stack.pop()
+                yield current, None, parent
+                continue
+
+            number += 1
+            yield number, child, current
+            if max_depth is None or len(stack) < max_depth:
+                stack.append((iter(child.children), number, current))
+            else:
+                yield number, None, current
 
 
 class Interpreter(object):
@@ -153,15 +209,33 @@ def generate_dot():
     If source file name is not provided on the command line
     defaults to STDIN.
     """
-    if len(sys.argv) != 2:
-        source = sys.stdin.read()
+    parser = optparse.OptionParser(usage='%prog [options] [input_file]')
+    parser.add_option('-d', '--max-depth', type='int', dest='max_depth',
+                      help='Draw nodes up to MAX_DEPTH levels below the '
+                      'root.')
+    parser.add_option('-f', '--function', dest='function',
+                      help='Draw the definition of the FUNCTION only.')
+    options, args = parser.parse_args()
+
+    if len(args) > 1:
+        parser.print_usage()
+        sys.exit(1)
+
+    if args:
+        source = map_file(args[0])
     else:
-        source = open(sys.argv[1]).read()
+        source = sys.stdin.read()
+
+    ast_parser = TokenStreamParser(
+        Lexer(source).tokenize(), interpreter=Interpreter())
+    ast_parser.parse()
+    tree = ast_parser.root
+    if options.function is not None:
+        tree = find_function(tree, options.function)
+        if tree is None:
+            parser.error("function '%s' is not defined" % options.function)
 
-    parser = Parser(Lexer(source), interpreter=Interpreter())
-    parser.parse()
-    visualizer = ASTVisualizer(parser.root)
-    print visualizer
+    ASTVisualizer(tree, max_depth=options.max_depth).write(sys.stdout)
 
 
 if __name__ == '__main__':
@@ -59,6 +59,20 @@ INSTRUCTIONS = [
     Instruction('move', REG, REG),       # A B    R(A) = R(B)
     Instruction('print', REG),           # A      print R(A)
     Instruction('call', FUNC, REG),      # A B    call A, R(B)
+    # integer instructions: operands are known to be integers
+    Instruction('iadd', REG, REG, REG),  # A B C  R(A) = R(B) + R(C)
+    Instruction('isub', REG, REG, REG),  # A B C  R(A) = R(B) - R(C)
+    Instruction('imul', REG, REG, REG),  # A B C  R(A) = R(B) * R(C)
+    Instruction('ilt', REG, REG, REG),   # A B C  R(A) = R(B) < R(C), unboxed
+    Instruction('ieq', REG, REG, REG),   # A B C  R(A) = R(B) == R(C), unboxed
+    # quickened instructions: the VM rewrites generic instructions into
+    # these after seeing operand types, they check the types they expect
+    Instruction('add_int', REG, REG, REG),
+    Instruction('add_str', REG, REG, REG),
+    Instruction('sub_int', REG, REG, REG),
+    Instruction('mul_int', REG, REG, REG),
+    Instruction('lt_int', REG, REG, REG),
+    Instruction('eq_int', REG, REG, REG),
     ]
 
 (INSTR_ADD,    # 1
@@ -76,4 +90,15 @@ INSTRUCTIONS = [
  INSTR_BRF,    # 13
  INSTR_MOVE,
  INSTR_PRINT,
- INSTR_CALL) = range(1, len(INSTRUCTIONS))
+ INSTR_CALL,   # 16
+ INSTR_IADD,
+ INSTR_ISUB,
+ INSTR_IMUL,   # 19
+ INSTR_ILT,
+ INSTR_IEQ,
+ INSTR_ADD_INT,  # 22
+ INSTR_ADD_STR,
+ INSTR_SUB_INT,
+ INSTR_MUL_INT,  # 25
+ INSTR_LT_INT,
+ INSTR_EQ_INT) = range(1, len(INSTRUCTIONS))
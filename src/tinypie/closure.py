@@ -0,0 +1,426 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.interpreter import (
+    UNDEFINED,
+    RETURN_SIGNAL,
+    Interpreter,
+    FunctionSpace,
+    InterpreterException,
+    )
+from tinypie.memo import make_key, MISSING
+from tinypie.typeinfer import TypeInference, is_int
+
+
+class ClosureCompiler(object):
+    """AST to closure compiler.
+
+    Walks the AST once and converts every node into a specialized
+    Python closure. Executing the program is then a matter of calling
+    the closure built for the root node - there is no per-visit
+    dispatch on node type.
+
+    Statement closures return RETURN_SIGNAL after executing 'return'
+    and the value travels in Interpreter.return_value, so function
+    calls do not raise and catch exceptions.
+
+    Function bodies are compiled lazily on the first call, which
+    takes care of recursion and forward references.
+
+    Arithmetic and comparisons that TypeInference proved to work on
+    integers, with one constant operand, get closures with the
+    constant built in. Other operations use generic closures.
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        # FunctionSymbol -> compiled body
+        self.functions = {}
+
+    def compile(self, node):
+        """Return closure for the node."""
+        if node.type == tokens.BLOCK:
+            return self._block(node)
+
+        elif node.type == tokens.RETURN:
+            return self._ret(node)
+
+        elif node.type == tokens.CALL:
+            return self._call(node)
+
+        elif node.type == tokens.ASSIGN:
+            return self._assign(node)
+
+        elif node.type == tokens.PRINT:
+            return self._print(node)
+
+        elif node.type == tokens.INT:
+            return self._constant(int(node.text))
+
+        elif node.type == tokens.STRING:
+            return self._constant(node.text)
+
+        elif node.type == tokens.ID:
+            return self._load(node)
+
+        elif node.type in (tokens.ADD, tokens.SUB, tokens.MUL):
+            return self._binop(node)
+
+        elif node.type in (tokens.LT, tokens.EQ):
+            return self._compare(node)
+
+        elif node.type == tokens.IF:
+            return self._ifstat(node)
+
+        elif node.type == tokens.WHILE:
+            return self._whileop(node)
+
+        return self._nop
+
+    def get_function(self, func_symbol):
+        code = self.functions.get(func_symbol)
+        if code is None:
+            code = self.functions[func_symbol] = self.compile(
+                func_symbol.block_ast)
+        return code
+
+    @staticmethod
+    def _nop():
+        pass
+
+    @staticmethod
+    def _constant(value):
+        def constant():
+            return value
+        return constant
+
+    def _block(self, node):
+        statements = tuple(self.compile(child) for child in node.children)
+
+        if not statements:
+            return self._nop
+
+        if len(statements) == 1:
+            return statements[0]
+
+        def block():
+            for statement in statements:
+                if statement() is RETURN_SIGNAL:
+                    return RETURN_SIGNAL
+
+        return block
+
+    def _ret(self, node):
+        expr = self.compile(node.children[0])
+
+        interp = self.interpreter
+
+        def ret():
+            interp.return_value = expr()
+            return RETURN_SIGNAL
+
+        return ret
+
+    def _assign(self, node):
+        expr = self.compile(node.children[1])
+        slot, global_slot = node.slot, node.global_slot
+        func_stack = self.interpreter.func_stack
+        global_values = self.interpreter.globals.values
+
+        if slot is None:
+            def assign():
+                global_values[global_slot] = expr()
+
+            return assign
+
+        def assign_local():
+            value = expr()
+            values = func_stack[-1].values
+            if (values[slot] is not UNDEFINED or
+                global_values[global_slot] is UNDEFINED):
+                values[slot] = value
+            else:
+                global_values[global_slot] = value
+
+        return assign_local
+
+    def _print(self, node):
+        expr = self.compile(node.children[0])
+
+        def print_():
+            print expr()
+
+        return print_
+
+    def _call(self, node):
+        func_name = node.children[0].text
+        scope = node.scope
+        args = tuple(self.compile(child) for child in node.children[1:])
+        interp = self.interpreter
+        func_stack = interp.func_stack
+        get_function = self.get_function
+
+        def call():
+            func_symbol = scope.resolve(func_name)
+            body = get_function(func_symbol)
+            func_space = FunctionSpace(func_symbol)
+            values = func_space.values
+
+            # formal arguments occupy the first slots of the function space
+            for index in range(len(func_symbol.formal_args)):
+                values[index] = args[index]()
+
+            # push local scope
+            func_stack.append(func_space)
+
+            value = None
+            if body() is RETURN_SIGNAL:
+                value, interp.return_value = interp.return_value, None
+
+            func_stack.pop()
+            return value
+
+        if interp.memoizer is None:
+            return call
+
+        get_table = interp.memoizer.get_table
+
+        def memo_call():
+            func_symbol = scope.resolve(func_name)
+            table = get_table(func_symbol)
+            if table is None:
+                return call()
+
+            nargs = len(func_symbol.formal_args)
+            arg_values = [args[index]() for index in range(nargs)]
+            key = make_key(arg_values)
+            value = table.lookup(key)
+            if value is not MISSING:
+                return value
+
+            body = get_function(func_symbol)
+            func_space = FunctionSpace(func_symbol)
+            func_space.values[:nargs] = arg_values
+            func_stack.append(func_space)
+
+            value = None
+            if body() is RETURN_SIGNAL:
+                value, interp.return_value = interp.return_value, None
+
+            func_stack.pop()
+            table.store(key, value)
+            return value
+
+        return memo_call
+
+    def _int_operation(self, node):
+        """Return closure for integer operation with a constant operand.
+
+        Returns None if the operands are not proved to be integers or
+        neither of them is a constant.
+        """
+        left_node, right_node = node.children
+        if not (is_int(left_node) and is_int(right_node)):
+            return None
+
+        node_type = node.type
+
+        if right_node.type == tokens.INT:
+            left = self.compile(left_node)
+            constant = int(right_node.text)
+
+            if node_type == tokens.ADD:
+                def int_operation():
+                    return left() + constant
+
+            elif node_type == tokens.SUB:
+                def int_operation():
+                    return left() - constant
+
+            elif node_type == tokens.MUL:
+                def int_operation():
+                    return left() * constant
+
+            elif node_type == tokens.LT:
+                def int_operation():
+                    return left() < constant
+
+            else:
+                def int_operation():
+                    return left() == constant
+
+            return int_operation
+
+        if left_node.type == tokens.INT:
+            constant = int(left_node.text)
+            right = self.compile(right_node)
+
+            if node_type == tokens.ADD:
+                def int_operation():
+                    return constant + right()
+
+            elif node_type == tokens.SUB:
+                def int_operation():
+                    return constant - right()
+
+            elif node_type == tokens.MUL:
+                def int_operation():
+                    return constant * right()
+
+            elif node_type == tokens.LT:
+                def int_operation():
+                    return constant < right()
+
+            else:
+                def int_operation():
+                    return constant == right()
+
+            return int_operation
+
+        return None
+
+    def _binop(self, node):
+        int_operation = self._int_operation(node)
+        if int_operation is not None:
+            return int_operation
+
+        left = self.compile(node.children[0])
+        right = self.compile(node.children[1])
+
+        if node.type == tokens.ADD:
+            def binop():
+                return left() + right()
+
+        elif node.type == tokens.SUB:
+            def binop():
+                return left() - right()
+
+        else:
+            def binop():
+                return left() * right()
+
+        return binop
+
+    def _compare(self, node):
+        int_operation = self._int_operation(node)
+        if int_operation is not None:
+            return int_operation
+
+        left = self.compile(node.children[0])
+        right = self.compile(node.children[1])
+
+        if node.type == tokens.LT:
+            def compare():
+                return left() < right()
+
+        else:
+            def compare():
+                return left() == right()
+
+        return compare
+
+    def _load(self, node):
+        name = node.text
+        slot, global_slot = node.slot, node.global_slot
+        func_stack = self.interpreter.func_stack
+        global_values = self.interpreter.globals.values
+
+        if slot is None:
+            def load():
+                value = global_values[global_slot]
+                if value is UNDEFINED:
+                    raise InterpreterException(
+                        "name '%s' is not defined" % name)
+                return value
+
+            return load
+
+        def load_local():
+            value = func_stack[-1].values[slot]
+            if value is UNDEFINED:
+                value = global_values[global_slot]
+                if value is UNDEFINED:
+                    raise InterpreterException(
+                        "name '%s' is not defined" % name)
+            return value
+
+        return load_local
+
+    def _ifstat(self, node):
+        predicate = self.compile(node.children[0])
+        consequent = self.compile(node.children[1])
+
+        if len(node.children) != 3:
+            def ifstat():
+                if predicate():
+                    return consequent()
+
+            return ifstat
+
+        alternative = self.compile(node.children[2])
+
+        def ifelse():
+            if predicate():
+                return consequent()
+            return alternative()
+
+        return ifelse
+
+    def _whileop(self, node):
+        predicate = self.compile(node.children[0])
+        body = self.compile(node.children[1])
+
+        def whileop():
+            while predicate():
+                if body() is RETURN_SIGNAL:
+                    return RETURN_SIGNAL
+
+        return whileop
+
+
+class ClosureInterpreter(Interpreter):
+    """Interpreter that compiles the AST into closures before execution.
+
+    Runs the same programs with the same memory model as the
+    tree-walking Interpreter, but every node is visited only once,
+    by the ClosureCompiler.
+    """
+
+    def parse(self, text, arena=None):
+        """Build AST and annotate it with inferred types."""
+        # global variables of earlier runs
+        known_globals = set(self.global_slots)
+        tree = super(ClosureInterpreter, self).parse(text, arena=arena)
+        TypeInference(known_globals).infer(tree)
+        return tree
+
+    def execute(self, tree):
+        """Compile AST into closures and run them."""
+        code = ClosureCompiler(self).compile(tree)
+        del self.func_stack[:]
+        code()
@@ -0,0 +1,561 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.asmutils import DeadCodeStripper
+from tinypie.symbol import FunctionSymbol
+from tinypie.typeinfer import TypeInference, is_int
+
+# Instruction operand positions written (defs) and read (uses).
+# 'call' is special cased in def_use.
+DEF_USE = {
+    'add': ((1,), (2, 3)),
+    'sub': ((1,), (2, 3)),
+    'mul': ((1,), (2, 3)),
+    'lt': ((1,), (2, 3)),
+    'eq': ((1,), (2, 3)),
+    'iadd': ((1,), (2, 3)),
+    'isub': ((1,), (2, 3)),
+    'imul': ((1,), (2, 3)),
+    'ilt': ((1,), (2, 3)),
+    'ieq': ((1,), (2, 3)),
+    'loadk': ((1,), ()),
+    'gload': ((1,), ()),
+    'gstore': ((), (2,)),
+    'move': ((1,), (2,)),
+    'print': ((), (1,)),
+    'brt': ((), (1,)),
+    'brf': ((), (1,)),
+    'br': ((), ()),
+    'ret': ((), ()),
+    'halt': ((), ()),
+    'label': ((), ()),
+    }
+
+BRANCHES = ('br', 'brt', 'brf')
+
+# Names the assembler lexes as something other than an identifier
+RESERVED_NAMES = ('main', 'args', 'locals', 'call', 'loadk')
+
+
+class CompilerException(Exception):
+    pass
+
+
+class VirtualRegister(object):
+    """Register of the unlimited register machine the compiler targets.
+
+    Registers with 'fixed' set are pinned to a physical register:
+    r0 holds the return value and r1..rN the function arguments.
+    """
+
+    __slots__ = ('number', 'fixed')
+
+    def __init__(self, number, fixed=None):
+        self.number = number
+        self.fixed = fixed
+
+    def __repr__(self):
+        return 'v%d' % self.number
+
+
+class FunctionCode(object):
+    """Instructions of one function before register allocation.
+
+    Instructions are tuples: (name, operand, ...). Operands are
+    VirtualRegister objects, label names, constants, and global
+    memory indexes. Two pseudo instructions exist:
+
+    ('label', name)             - defines a label
+    ('call', func_name, args)   - args is a tuple of registers
+    """
+
+    def __init__(self, name, args=0):
+        self.name = name
+        self.args = args
+        self.registers = []
+        self.instructions = []
+        self.ret = self.new_register(fixed=0)
+        self.params = [self.new_register(fixed=index + 1)
+                       for index in range(args)]
+
+    def new_register(self, fixed=None):
+        register = VirtualRegister(len(self.registers), fixed)
+        self.registers.append(register)
+        return register
+
+    def emit(self, *instruction):
+        self.instructions.append(instruction)
+
+
+def def_use(instruction):
+    """Return (defined registers, used registers) of the instruction."""
+    name = instruction[0]
+    if name == 'call':
+        return [], list(instruction[2])
+
+    defs, uses = DEF_USE[name]
+    return ([instruction[index] for index in defs],
+            [instruction[index] for index in uses])
+
+
+class NaiveAllocator(object):
+    """One physical register per virtual register."""
+
+    def allocate(self, code):
+        """Return (virtual register -> physical register, locals)."""
+        mapping = {}
+        number = code.args
+        for register in code.registers:
+            if register.fixed is not None:
+                mapping[register] = register.fixed
+            else:
+                number += 1
+                mapping[register] = number
+
+        return mapping, number - code.args
+
+
+class BytecodeCompiler(object):
+    """TinyPie to register VM assembly compiler.
+
+    Lowers the AST built by the Parser into assembly text accepted by
+    assembler.BytecodeAssembler. Top-level statements become the 'main'
+    function, every TinyPie function becomes an assembly function with
+    its arguments in r1..rN and the return value in r0.
+
+    Variables are bound statically: formal arguments and names assigned
+    inside a function live in registers unless a global variable with
+    the same name is assigned at the top level, in which case all
+    accesses use gload/gstore. The tree interpreters make that choice
+    at run time.
+
+    Comparisons yield 1 and 0 in the VM where the tree interpreters
+    yield True and False.
+
+    Operations on operands TypeInference proved to be integers use
+    the integer instructions iadd, isub and imul. Integer comparisons
+    that only decide a branch use ilt and ieq, which leave the result
+    unconverted.
+
+    Code is generated for unlimited virtual registers first, the
+    allocator (regalloc.LinearScanAllocator by default) maps them to
+    VM registers. With 'ssa' set the AST is translated to the SSA
+    form of tinypie.ssa, optimized there and lowered to registers.
+
+    >>> from tinypie.interpreter import Interpreter
+    >>> from tinypie.compiler import BytecodeCompiler
+    >>>
+    >>> interp = Interpreter()
+    >>> tree = interp.parse('''
+    ... def square(x) return x * x
+    ... y = square(7)
+    ... print y
+    ... ''')
+    >>> print BytecodeCompiler(interp.global_scope).compile(tree)
+    .globals 1
+    .def square: args=1, locals=0
+        imul r0, r1, r1
+        ret
+    .def main: args=0, locals=1
+        loadk r1, 7
+        call square, r1
+        move r1, r0
+        gstore 0, r1
+        gload r1, 0
+        print r1
+        halt
+    <BLANKLINE>
+
+    """
+
+    def __init__(self, global_scope, allocator=None, ssa=False):
+        if allocator is None:
+            from tinypie.regalloc import LinearScanAllocator
+            allocator = LinearScanAllocator()
+
+        self.global_scope = global_scope
+        self.allocator = allocator
+        self.ssa_optimizer = None
+        if ssa:
+            from tinypie.ssa import SSAOptimizer
+            self.ssa_optimizer = SSAOptimizer()
+        # name -> global memory index
+        self.globals = {}
+        self.label_count = 0
+        self.code = None
+        # name -> register of the function being compiled
+        self.variables = None
+
+    def compile(self, tree):
+        """Return assembly text for the AST."""
+        functions = self.generate(tree)
+        lines = []
+        if self.globals:
+            lines.append('.globals %d' % len(self.globals))
+
+        for code in functions:
+            lines.extend(self.render(code))
+
+        return '\n'.join(lines) + '\n'
+
+    def generate(self, tree):
+        """Return list of FunctionCode for the AST, 'main' last."""
+        TypeInference().infer(tree)
+        self.globals = global_indexes(tree)
+
+        if self.ssa_optimizer is not None:
+            return self._generate_ssa(tree)
+
+        functions = []
+        for node in tree.children:
+            if node.type != tokens.FUNC_DEF:
+                continue
+            func_symbol = node.symbol
+            # redefinition: the last definition wins
+            if self.global_scope.resolve(func_symbol.name) is func_symbol:
+                functions.append(self._function(func_symbol))
+
+        main = self.code = FunctionCode('main')
+        self.variables = {}
+        for node in tree.children:
+            if node.type != tokens.FUNC_DEF:
+                self._statement(node)
+        main.emit('halt')
+        functions.append(main)
+
+        return functions
+
+    def render(self, code):
+        """Allocate registers and return assembly lines of function."""
+        mapping, locals_num = self.allocator.allocate(code)
+        reg = lambda register: 'r%d' % mapping[register]
+
+        lines = ['.def %s: args=%d, locals=%d' % (
+            code.name, code.args, locals_num)]
+
+        for instruction in code.instructions:
+            name = instruction[0]
+
+            if name == 'label':
+                lines.append('%s:' % instruction[1])
+                continue
+
+            if name == 'move' and (
+                mapping[instruction[1]] == mapping[instruction[2]]):
+                # coalesced by the register allocator
+                continue
+
+            if name == 'call':
+                args = instruction[2]
+                base = reg(args[0]) if args else 'r0'
+                lines.append('    call %s, %s' % (instruction[1], base))
+                continue
+
+            operands = []
+            for operand in instruction[1:]:
+                if isinstance(operand, VirtualRegister):
+                    operands.append(reg(operand))
+                elif isinstance(operand, basestring) and name == 'loadk':
+                    operands.append("'%s'" % operand)
+                else:
+                    operands.append(str(operand))
+
+            if operands:
+                lines.append('    %s %s' % (name, ', '.join(operands)))
+            else:
+                lines.append('    %s' % name)
+
+        return lines
+
+    # Helper methods
+    def _generate_ssa(self, tree):
+        from tinypie.ssa import SSABuilder, SSALowering
+
+        functions = SSABuilder(self.global_scope, self.globals).build(tree)
+        self.ssa_optimizer.optimize(functions)
+        lowering = SSALowering(self.globals)
+        return [lowering.lower(function) for function in functions]
+
+    def _new_label(self):
+        self.label_count += 1
+        return 'L%d' % self.label_count
+
+    def _function(self, func_symbol):
+        if func_symbol.name in RESERVED_NAMES:
+            raise CompilerException(
+                "function name '%s' is reserved" % func_symbol.name)
+
+        code = self.code = FunctionCode(
+            func_symbol.name, len(func_symbol.formal_args))
+        self.variables = {}
+        for arg, register in zip(func_symbol.formal_args, code.params):
+            self.variables[arg.name] = register
+
+        names = set()
+        _collect_assigned_names(func_symbol.block_ast, names)
+        for name in sorted(names):
+            if name not in self.variables and name not in self.globals:
+                self.variables[name] = code.new_register()
+
+        self._statement(func_symbol.block_ast)
+
+        if code.instructions[-1:] != [('ret',)]:
+            # r0 is None on entry but calls clobber it: keep the None
+            # around for a body that ends without 'return'
+            if _has_call(func_symbol.block_ast):
+                none = code.new_register()
+                code.instructions.insert(0, ('move', none, code.ret))
+                code.emit('move', code.ret, none)
+            code.emit('ret')
+
+        return code
+
+    def _statement(self, node):
+        code = self.code
+
+        if node.type == tokens.BLOCK:
+            for child in node.children:
+                self._statement(child)
+
+        elif node.type == tokens.ASSIGN:
+            self._assign(node)
+
+        elif node.type == tokens.PRINT:
+            code.emit('print', self._expr(node.children[0]))
+
+        elif node.type == tokens.CALL:
+            self._call(node, None, discard=True)
+
+        elif node.type == tokens.RETURN:
+            if code.name == 'main':
+                self._expr(node.children[0])
+                code.emit('halt')
+            else:
+                self._expr(node.children[0], code.ret)
+                code.emit('ret')
+
+        elif node.type == tokens.IF:
+            self._ifstat(node)
+
+        elif node.type == tokens.WHILE:
+            self._whileop(node)
+
+    def _assign(self, node):
+        name = node.children[0].text
+        register = self.variables.get(name)
+        if register is not None:
+            self._expr(node.children[1], register)
+        else:
+            self.code.emit(
+                'gstore', self.globals[name], self._expr(node.children[1]))
+
+    def _ifstat(self, node):
+        code = self.code
+        else_label = self._new_label()
+        code.emit('brf', self._predicate(node.children[0]), else_label)
+        self._statement(node.children[1])
+
+        if len(node.children) == 3:
+            end_label = self._new_label()
+            code.emit('br', end_label)
+            code.emit('label', else_label)
+            self._statement(node.children[2])
+            code.emit('label', end_label)
+        else:
+            code.emit('label', else_label)
+
+    def _whileop(self, node):
+        code = self.code
+        top_label = self._new_label()
+        end_label = self._new_label()
+        code.emit('label', top_label)
+        code.emit('brf', self._predicate(node.children[0]), end_label)
+        self._statement(node.children[1])
+        code.emit('br', top_label)
+        code.emit('label', end_label)
+
+    def _predicate(self, node):
+        """Generate code for branch condition and return its register."""
+        if (node.type in (tokens.LT, tokens.EQ) and
+            is_int(node.children[0]) and is_int(node.children[1])):
+            left = self._expr(node.children[0])
+            right = self._expr(node.children[1])
+            dest = self.code.new_register()
+            self.code.emit('i' + node.type.lower(), dest, left, right)
+            return dest
+
+        return self._expr(node)
+
+    def _expr(self, node, dest=None):
+        """Generate code for expression and return its register.
+
+        The result is written to 'dest' if provided. 'dest' is written
+        only by the last instruction generated for the expression.
+        """
+        code = self.code
+        node_type = node.type
+
+        if node_type == tokens.ID:
+            name = node.text
+            register = self.variables.get(name)
+            if register is None and name not in self.globals:
+                raise CompilerException("name '%s' is not defined" % name)
+
+            if register is not None:
+                if dest is not None and dest is not register:
+                    code.emit('move', dest, register)
+                    return dest
+                return register
+
+            dest = dest or code.new_register()
+            code.emit('gload', dest, self.globals[name])
+            return dest
+
+        if node_type == tokens.INT:
+            dest = dest or code.new_register()
+            code.emit('loadk', dest, int(node.text))
+            return dest
+
+        if node_type == tokens.STRING:
+            dest = dest or code.new_register()
+            code.emit('loadk', dest, node.text)
+            return dest
+
+        if node_type == tokens.CALL:
+            return self._call(node, dest)
+
+        if node_type in (tokens.ADD, tokens.SUB, tokens.MUL,
+                         tokens.LT, tokens.EQ):
+            left = self._expr(node.children[0])
+            right = self._expr(node.children[1])
+            dest = dest or code.new_register()
+            name = node_type.lower()
+            if (node_type in (tokens.ADD, tokens.SUB, tokens.MUL) and
+                is_int(node.children[0]) and is_int(node.children[1])):
+                name = 'i' + name
+            code.emit(name, dest, left, right)
+            return dest
+
+        raise CompilerException('Unexpected node %s' % node)
+
+    def _call(self, node, dest, discard=False):
+        code = self.code
+        func_name = node.children[0].text
+        func_symbol = self.global_scope.resolve(func_name)
+        if not isinstance(func_symbol, FunctionSymbol):
+            raise CompilerException(
+                "function '%s' is not defined" % func_name)
+
+        nargs = len(func_symbol.formal_args)
+        if len(node.children) - 1 < nargs:
+            raise CompilerException(
+                '%s() takes %d arguments' % (func_name, nargs))
+
+        # arguments are passed in consecutive registers
+        args = tuple(code.new_register() for _ in range(nargs))
+        for register, child in zip(args, node.children[1:]):
+            self._expr(child, register)
+
+        code.emit('call', func_name, args)
+        if discard or dest is code.ret:
+            return code.ret
+
+        # the next call clobbers r0
+        dest = dest or code.new_register()
+        code.emit('move', dest, code.ret)
+        return dest
+
+
+def global_indexes(tree):
+    """Return global variable name -> global memory index.
+
+    Every name assigned by top level code is global, assignments in
+    nested blocks included.
+    """
+    indexes = {}
+    _define_globals(tree, indexes)
+    return indexes
+
+
+def _define_globals(node, indexes):
+    if node.type == tokens.FUNC_DEF:
+        return
+
+    if node.type == tokens.ASSIGN:
+        indexes.setdefault(node.children[0].text, len(indexes))
+
+    for child in node.children:
+        _define_globals(child, indexes)
+
+
+def _collect_assigned_names(node, names):
+    if node.type == tokens.ASSIGN:
+        names.add(node.children[0].text)
+
+    for child in node.children:
+        _collect_assigned_names(child, names)
+
+
+def _has_call(node):
+    if node.type == tokens.CALL:
+        return True
+    return any(_has_call(child) for child in node.children)
+
+
+def compile_source(text, allocator=None, optimize=False, ssa=False,
+                   parse_cache=None, parallel_parser=None):
+    """Compile TinyPie source code into assembly text."""
+    from tinypie.interpreter import Interpreter
+
+    interp = Interpreter(optimize=optimize, parse_cache=parse_cache,
+                         parallel_parser=parallel_parser)
+    tree = interp.parse(text)
+    compiler = BytecodeCompiler(interp.global_scope, allocator=allocator,
+                                ssa=ssa)
+    text = compiler.compile(tree)
+    if optimize:
+        text = DeadCodeStripper().strip(text)
+    return text
+
+
+def run_source(text, allocator=None, trace=False, optimize=False,
+               ssa=False, parse_cache=None, parallel_parser=None):
+    """Compile TinyPie source code and execute it in the VM."""
+    from tinypie.lexer import AssemblerLexer
+    from tinypie.assembler import BytecodeAssembler
+    from tinypie.vm import VM
+
+    assembler = BytecodeAssembler(
+        AssemblerLexer(
+            compile_source(text, allocator=allocator, optimize=optimize,
+                           ssa=ssa, parse_cache=parse_cache,
+                           parallel_parser=parallel_parser)))
+    assembler.parse()
+    vm = VM(assembler, trace=trace)
+    vm.execute()
+    return vm
@@ -0,0 +1,223 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.ast import AST
+from tinypie.lexer import Lexer, LexerException
+from tinypie.optimizer import assigned_names
+from tinypie.parser import ParserException, TokenStreamParser
+from tinypie.resolver import SlotResolver
+
+
+def _ends_line(text):
+    """Return True if the text can not run into the text after it.
+
+    That is when it ends with a new line and optional indentation, a
+    comment or a token at the end would continue in the next item.
+    """
+    return not text or not text[text.rfind('\n') + 1:].strip(' \t')
+
+
+class Item(object):
+    """Top level function definition or statement of a source file.
+
+    text    - source of the item with its ending new line and the blank
+              lines and comments before it
+    symbols - name -> symbol the item defined in the global scope
+    """
+
+    __slots__ = ('text', 'node', 'symbols')
+
+    def __init__(self, text, node, symbols):
+        self.text = text
+        self.node = node
+        self.symbols = symbols
+
+
+class ItemParser(TokenStreamParser):
+    """Parser that splits the program into top level Items."""
+
+    def parse(self):
+        text = self.lexer.buffer
+        starts = self.lexer.starts
+        symbols = self.current_scope.symbols
+        self.items = []
+        start = 0
+
+        while self._lookahead_type(0) != tokens.EOF:
+            if self._lookahead_type(0) == tokens.DEF:
+                node = self._function_definition()
+                names = [node.children[0].text]
+            else:
+                node = self._statement()
+                if node is None:
+                    continue
+                names = assigned_names(node)
+            # the new line ending the item belongs to it
+            if self._lookahead_type(0) == tokens.NL:
+                self._match(tokens.NL)
+
+            end = starts[min(self.index, self.last)]
+            self.items.append(Item(
+                text[start:end], node,
+                dict((name, symbols[name]) for name in names)))
+            start = end
+
+        # trailing blank lines and comments belong to the last item
+        if self.items and start < len(text):
+            self.items[-1].text += text[start:]
+
+        self.root = AST(tokens.BLOCK)
+        self.root.children = [item.node for item in self.items]
+
+
+class IncrementalParser(object):
+    """Reparse only the top level items of a source file that changed.
+
+    Items at the start and at the end of the new text that are equal to
+    items of the previous text are kept together with their subtrees,
+    the text between them is lexed and parsed on its own and the new
+    items are spliced into the tree.  The global scope of the
+    interpreter is patched: names of removed items are dropped or bound
+    to the last remaining item defining them.  If the changed text does
+    not parse on its own, e.g. a comment at its end swallows the next
+    item, the whole text is parsed again.
+
+    New items get their variable slots resolved, the tree can be run
+    with Interpreter.execute.  Whole program optimizations are not
+    applied, they would rewrite the kept subtrees.
+
+    >>> from tinypie.interpreter import Interpreter
+    >>> from tinypie.incremental import IncrementalParser
+    >>> interp = Interpreter()
+    >>> parser = IncrementalParser(interp)
+    >>> text = '''
+    ... def double(x) return x * 2
+    ... def triple(x) return x * 3
+    ... print double(triple(7))
+    ... '''
+    >>> interp.execute(parser.parse(text))
+    42
+    >>> interp.execute(parser.parse(text.replace('x * 2', 'x + x + 1')))
+    43
+    >>> parser.reparsed, len(parser.items)
+    (1, 3)
+
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.items = []
+        self.root = AST(tokens.BLOCK)
+        # number of items parsed by the last call and whether the whole
+        # text had to be parsed
+        self.reparsed = 0
+        self.full = False
+
+    def parse(self, text):
+        """Parse the new text of the file and return the updated tree."""
+        items = self.items
+        # unchanged items at the start
+        first = pos = 0
+        while first < len(items) and text.startswith(items[first].text, pos):
+            pos += len(items[first].text)
+            first += 1
+
+        # unchanged items at the end
+        last, end = len(items), len(text)
+        while last > first:
+            item_text = items[last - 1].text
+            if (end - len(item_text) < pos or
+                    not text.endswith(item_text, pos, end)):
+                break
+            end -= len(item_text)
+            last -= 1
+
+        middle = text[pos:end]
+        self.full = not items or (
+            last < len(items) and not _ends_line(middle))
+        # a text that does not parse leaves the scope and items as they were
+        symbols = self.interpreter.global_scope.symbols
+        saved = dict(symbols)
+        if not self.full:
+            try:
+                new_items = self._parse_items(middle)
+            except (LexerException, ParserException):
+                symbols.clear()
+                symbols.update(saved)
+                self.full = True
+        if self.full:
+            first, last = 0, len(items)
+            self._drop_symbols(items)
+            try:
+                new_items = self._parse_items(text)
+            except (LexerException, ParserException):
+                symbols.clear()
+                symbols.update(saved)
+                raise
+
+        removed = items[first:last]
+        self.items = items[:first] + new_items + items[last:]
+        self._patch_scope(removed, new_items)
+        self.root.children = [item.node for item in self.items]
+        self.reparsed = len(new_items)
+
+        resolver = SlotResolver(self.interpreter.global_slots)
+        for item in new_items:
+            resolver.resolve(item.node)
+        self.interpreter.globals.ensure_size(
+            len(self.interpreter.global_slots))
+        return self.root
+
+    def _parse_items(self, text):
+        parser = ItemParser(Lexer(text).tokenize(),
+                            interpreter=self.interpreter)
+        parser.parse()
+        return parser.items
+
+    def _drop_symbols(self, items):
+        symbols = self.interpreter.global_scope.symbols
+        for item in items:
+            for name, symbol in item.symbols.iteritems():
+                if symbols.get(name) is symbol:
+                    del symbols[name]
+
+    def _patch_scope(self, removed, added):
+        """Bind names defined by removed and added items to the symbol
+        of the last item defining them, or drop them."""
+        names = set()
+        for item in removed + added:
+            names.update(item.symbols)
+
+        symbols = self.interpreter.global_scope.symbols
+        for item in reversed(self.items):
+            if not names:
+                break
+            for name in names.intersection(item.symbols):
+                symbols[name] = item.symbols[name]
+                names.discard(name)
+        for name in names:
+            symbols.pop(name, None)
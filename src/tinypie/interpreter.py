@@ -25,40 +25,65 @@
 __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
 import sys
+import optparse
+import textwrap
 
-from tinypie.lexer import Lexer
-from tinypie.parser import Parser
+from tinypie.lexer import Lexer, map_file
+from tinypie.parser import TokenStreamParser
 from tinypie.scope import GlobalScope
+from tinypie.resolver import SlotResolver
+from tinypie.optimizer import Optimizer
+from tinypie.memo import Memoizer, make_key, MISSING
 from tinypie import tokens
 
 
+# marks memory slot that has not been assigned yet
+UNDEFINED = object()
+
+
 class MemorySpace(object):
+    """List-backed memory space.
+
+    Variables are addressed by slot indexes assigned by
+    resolver.SlotResolver.
+    """
 
-    def __init__(self, name):
+    __slots__ = ('name', 'values')
+
+    def __init__(self, name, size=0):
         self.name = name
-        self.members = {}
+        self.values = [UNDEFINED] * size
+
+    def __contains__(self, slot):
+        return (slot < len(self.values) and
+                self.values[slot] is not UNDEFINED)
 
-    def __contains__(self, key):
-        return key in self.members
+    def get(self, slot):
+        value = self.values[slot]
+        return None if value is UNDEFINED else value
 
-    def get(self, name):
-        return self.members.get(name)
+    def put(self, slot, value):
+        self.values[slot] = value
 
-    def put(self, name, value):
-        self.members[name] = value
+    def ensure_size(self, size):
+        # extend in place: compiled code keeps references to the list
+        if size > len(self.values):
+            self.values.extend([UNDEFINED] * (size - len(self.values)))
 
 
 class FunctionSpace(MemorySpace):
 
+    __slots__ = ('func_symbol',)
+
     def __init__(self, func_symbol):
-        super(FunctionSpace, self).__init__(func_symbol.name)
+        super(FunctionSpace, self).__init__(
+            func_symbol.name, len(func_symbol.slots))
         self.func_symbol = func_symbol
 
 
-class ReturnValue(Exception):
-
-    def __init__(self, *args, **kwargs):
-        self.value = kwargs.pop('value')
+# Returned by statements that executed 'return'. The value itself is
+# kept in Interpreter.return_value until the enclosing call picks it up.
+RETURN_SIGNAL = object()
 
 
 class InterpreterException(Exception):
@@ -71,74 +96,146 @@ class Interpreter(object):
     Executes code by constructing AST and walking the tree.
     """
 
-    def __init__(self):
+    def __init__(self, optimize=False, memoize=False, parse_cache=None,
+                 parallel_parser=None):
         self.global_scope = GlobalScope()
         self.globals = MemorySpace('global')
+        # variable name -> global memory slot
+        self.global_slots = {}
         self.func_stack = []
-        self.current_space = self.globals
+        self.return_value = None
+        self.optimizer = None
+        if optimize:
+            self.optimizer = Optimizer(self.global_scope, self.global_slots)
+        self.memoizer = None
+        if memoize:
+            self.memoizer = Memoizer()
+        # parsecache.ParseCache of parsed source files
+        self.parse_cache = parse_cache
+        # parallel.ParallelParser that parses large files in processes
+        self.parallel_parser = parallel_parser
 
     def interpret(self, text):
         """Interprete passed source code."""
-        parser = Parser(Lexer(text), interpreter=self)
-        parser.parse()
-        tree = parser.root
+        tree = self.parse(text)
+        self.execute(tree)
+
+    def parse(self, text, arena=None):
+        """Build AST and scope tree, optimize it and resolve variable slots.
+
+        With an arena.ASTArena the parser fills the arena and the tree
+        to execute is built from it.  Otherwise the parse cache, if any,
+        is tried first and the parallel parser, if any, parses the text.
+        """
+        tree = None
+        cache = self.parse_cache if arena is None else None
+        if cache is not None:
+            tree = cache.load(text, self.global_scope)
+
+        if tree is None:
+            defined = dict(self.global_scope.symbols)
+            if self.parallel_parser is not None and arena is None:
+                tree = self.parallel_parser.parse(text, self.global_scope)
+            else:
+                parser = TokenStreamParser(
+                    Lexer(text).tokenize(), interpreter=self, arena=arena)
+                parser.parse()
+                tree = parser.root
+                if arena is not None:
+                    tree = tree.to_ast()
+            if cache is not None:
+                symbols = [symbol for name, symbol
+                           in self.global_scope.symbols.items()
+                           if defined.get(name) is not symbol]
+                cache.store(text, tree, self.global_scope, symbols)
+        if self.optimizer is not None:
+            self.optimizer.optimize(tree)
+        if self.memoizer is not None:
+            self.memoizer.analyze(tree, self.global_slots)
+        SlotResolver(self.global_slots).resolve(tree)
+        self.globals.ensure_size(len(self.global_slots))
+        return tree
+
+    def get_global(self, name):
+        """Return value of the global variable or None."""
+        slot = self.global_slots.get(name)
+        if slot is None or slot >= len(self.globals.values):
+            return None
+        return self.globals.get(slot)
+
+    def execute(self, tree):
+        """Execute AST produced by parse."""
+        # drop frames left behind by a previous run that raised
+        del self.func_stack[:]
         self._block(tree)
 
     def _exec(self, node):
-        """Dispatch method of external tree visitor"""
+        """Dispatch method of external tree visitor.
 
-        if node.type == tokens.BLOCK:
-            self._block(node)
+        Statements return RETURN_SIGNAL when 'return' was executed,
+        expressions return their value.
+        """
 
-        elif node.type == tokens.RETURN:
-            self._ret(node)
+        token = node.token
+        node_type = token.type
+        if node_type == tokens.BLOCK:
+            return self._block(node)
 
-        elif node.type == tokens.CALL:
+        elif node_type == tokens.RETURN:
+            return self._ret(node)
+
+        elif node_type == tokens.CALL:
             return self._call(node)
 
-        elif node.type == tokens.ASSIGN:
+        elif node_type == tokens.ASSIGN:
             self._assign(node)
 
-        elif node.type == tokens.PRINT:
+        elif node_type == tokens.PRINT:
             self._print(node)
 
-        elif node.type == tokens.INT:
-            return int(node.text)
+        elif node_type == tokens.INT:
+            return int(token.text)
 
-        elif node.type == tokens.STRING:
-            return node.text
+        elif node_type == tokens.STRING:
+            return token.text
 
-        elif node.type == tokens.ID:
+        elif node_type == tokens.ID:
             return self._load(node)
 
-        elif node.type in (tokens.ADD, tokens.SUB, tokens.MUL):
+        elif node_type in (tokens.ADD, tokens.SUB, tokens.MUL):
             return self._binop(node)
 
-        elif node.type in (tokens.LT, tokens.EQ):
+        elif node_type in (tokens.LT, tokens.EQ):
             return self._compare(node)
 
-        elif node.type == tokens.IF:
-            self._ifstat(node)
+        elif node_type == tokens.IF:
+            return self._ifstat(node)
 
-        elif node.type == tokens.WHILE:
-            self._whileop(node)
+        elif node_type == tokens.WHILE:
+            return self._whileop(node)
 
     def _block(self, node):
         for child in node.children:
-            self._exec(child)
+            if self._exec(child) is RETURN_SIGNAL:
+                return RETURN_SIGNAL
 
     def _ret(self, node):
-        raise ReturnValue(value=self._exec(node.children[0]))
+        self.return_value = self._exec(node.children[0])
+        return RETURN_SIGNAL
 
     def _assign(self, node):
-        left = node.children[0]
-        value = self._exec(node.children[1])
+        self._store(node, self._exec(node.children[1]))
 
-        memory_space = self._get_symbol_space(left.text)
-        if memory_space is None:
-            memory_space = self.current_space
+    def _store(self, node, value):
+        slot = node.slot
+        if slot is not None:
+            values = self.func_stack[-1].values
+            if (values[slot] is not UNDEFINED or
+                self.globals.values[node.global_slot] is UNDEFINED):
+                values[slot] = value
+                return
 
-        memory_space.put(left.text, value)
+        self.globals.values[node.global_slot] = value
 
     def _print(self, node):
         value = self._exec(node.children[0])
@@ -148,55 +245,72 @@ class Interpreter(object):
         func_name = node.children[0].text
         func_symbol = node.scope.resolve(func_name)
         func_space = FunctionSpace(func_symbol)
-        save_space = self.current_space
-        self.current_space = func_space
-
-        for index, arg in enumerate(func_symbol.formal_args):
-            name = arg.name
-            value = self._exec(node.children[index + 1])
-            self.current_space.put(name, value)
+        values = func_space.values
+
+        # formal arguments occupy the first slots of the function space
+        nargs = len(func_symbol.formal_args)
+        for index in range(nargs):
+            values[index] = self._exec(node.children[index + 1])
+
+        table = None
+        if self.memoizer is not None:
+            table = self.memoizer.get_table(func_symbol)
+            if table is not None:
+                key = make_key(values[:nargs])
+                value = table.lookup(key)
+                if value is not MISSING:
+                    return value
 
         # push local scope
         self.func_stack.append(func_space)
 
-        try:
-            self._exec(func_symbol.block_ast)
-        except ReturnValue as rv:
-            return rv.value
-        finally:
-            self.func_stack.pop()
-            self.current_space = save_space
+        value = None
+        if self._exec(func_symbol.block_ast) is RETURN_SIGNAL:
+            value, self.return_value = self.return_value, None
+
+        self.func_stack.pop()
+
+        if table is not None:
+            table.store(key, value)
+        return value
 
     def _binop(self, node):
         left = self._exec(node.children[0])
         right = self._exec(node.children[1])
+        node_type = node.token.type
 
-        if node.type == tokens.ADD:
+        if node_type == tokens.ADD:
             return left + right
 
-        if node.type == tokens.SUB:
+        if node_type == tokens.SUB:
             return left - right
 
-        if node.type == tokens.MUL:
+        if node_type == tokens.MUL:
             return left * right
 
     def _compare(self, node):
         left = self._exec(node.children[0])
         right = self._exec(node.children[1])
+        node_type = node.token.type
 
-        if node.type == tokens.LT:
+        if node_type == tokens.LT:
             return left < right
 
-        if node.type == tokens.EQ:
+        if node_type == tokens.EQ:
             return left == right
 
     def _load(self, node):
-        name = node.text
-        memory_space = self._get_symbol_space(name)
-        if memory_space is not None:
-            return memory_space.get(name)
+        slot = node.slot
+        if slot is not None:
+            value = self.func_stack[-1].values[slot]
+            if value is not UNDEFINED:
+                return value
 
-        raise InterpreterException("name '%s' is not defined" % name)
+        value = self.globals.values[node.global_slot]
+        if value is not UNDEFINED:
+            return value
+
+        raise InterpreterException("name '%s' is not defined" % node.text)
 
     def _ifstat(self, node):
         cond_predicate = node.children[0]
@@ -204,34 +318,108 @@ class Interpreter(object):
         cond_else = node.children[2] if len(node.children) == 3 else None
 
         if self._exec(cond_predicate):
-            self._exec(cond_consequent)
+            return self._exec(cond_consequent)
 
         elif cond_else is not None:
-            self._exec(cond_else)
+            return self._exec(cond_else)
 
     def _whileop(self, node):
         cond_start = node.children[0]
         code_start = node.children[1]
         cond = self._exec(cond_start)
         while cond:
-            self._exec(code_start)
+            if self._exec(code_start) is RETURN_SIGNAL:
+                return RETURN_SIGNAL
             cond = self._exec(cond_start)
 
-    def _get_symbol_space(self, name):
-        if self.func_stack and name in self.func_stack[-1]:
-            return self.func_stack[-1]
-
-        if name in self.globals:
-            return self.globals
-
-        return None
-
 
 def main():
-    if len(sys.argv) != 2:
-        print 'Usage: tinypie input_file'
+    from tinypie.closure import ClosureInterpreter
+    from tinypie.stackless import StacklessInterpreter
+    from tinypie.compiler import compile_source, run_source
+    from tinypie.parsecache import ParseCache
+    from tinypie.parallel import ParallelParser
+
+    usage = textwrap.dedent("""\
+    %prog [options] input_file
+    """)
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-c', '--closures', action='store_true',
+                      dest='closures',
+                      help='Compile AST into closures before execution.')
+    parser.add_option('-s', '--stackless', action='store_true',
+                      dest='stackless',
+                      help='Use explicit work stack instead of recursion.')
+    parser.add_option('--vm', action='store_true', dest='vm',
+                      help='Compile to bytecode and run it in the VM.')
+    parser.add_option('-S', '--assembly', action='store_true',
+                      dest='assembly',
+                      help='Print VM assembly code and exit.')
+    parser.add_option('--ssa', action='store_true', dest='ssa',
+                      help='Optimize SSA form of the program before '
+                      'generating bytecode (with --vm and -S).')
+    parser.add_option('-O', '--optimize', action='store_true',
+                      dest='optimize',
+                      help='Optimize AST before execution.')
+    parser.add_option('-m', '--memoize', action='store_true',
+                      dest='memoize',
+                      help='Cache results of pure functions.')
+    parser.add_option('--cache-dir', dest='cache_dir',
+                      help='Cache parsed source files in the directory.')
+    parser.add_option('-j', '--jobs', type='int', dest='jobs',
+                      help='Parse large source files in JOBS processes.')
+    parser.add_option('--report', action='store_true', dest='report',
+                      help='Print optimization and memoization report '
+                      'to stderr (not with --vm and -S).')
+    options, args = parser.parse_args()
+
+    if len(args) != 1:
+        parser.print_usage()
         sys.exit(1)
 
-    interp = Interpreter()
-    text = open(sys.argv[1]).read()
-    interp.interpret(text)
+    if options.report and (options.vm or options.assembly):
+        parser.error('--report does not work with --vm and -S')
+
+    text = map_file(args[0])
+
+    optimize = options.optimize
+    parse_cache = None
+    if options.cache_dir is not None:
+        parse_cache = ParseCache(options.cache_dir)
+    parallel_parser = None
+    if options.jobs is not None:
+        parallel_parser = ParallelParser(options.jobs)
+
+    try:
+        if options.assembly:
+            sys.stdout.write(
+                compile_source(text, optimize=optimize, ssa=options.ssa,
+                               parse_cache=parse_cache,
+                               parallel_parser=parallel_parser))
+            return
+
+        if options.vm:
+            run_source(text, optimize=optimize, ssa=options.ssa,
+                       parse_cache=parse_cache,
+                       parallel_parser=parallel_parser)
+            return
+
+        if options.closures:
+            interp_class = ClosureInterpreter
+        elif options.stackless:
+            interp_class = StacklessInterpreter
+        else:
+            interp_class = Interpreter
+
+        interp = interp_class(optimize=optimize, memoize=options.memoize,
+                              parse_cache=parse_cache,
+                              parallel_parser=parallel_parser)
+        interp.interpret(text)
+
+        if options.report:
+            for reporter in (interp.optimizer, interp.memoizer):
+                if reporter is not None:
+                    sys.stderr.write(reporter.report() + '\n')
+    finally:
+        if parallel_parser is not None:
+            parallel_parser.close()
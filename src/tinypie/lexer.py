@@ -24,13 +24,32 @@
 
 __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
+import os
 import re
+import mmap
+from array import array
 
 from tinypie import tokens
 
+# Rule regexp that matches only the word itself
+KEYWORD_RULE = re.compile(r'[a-zA-Z_]\w*$').match
+
+
+def map_file(path):
+    """Return a read-only mmap of the file to lex in place.
+
+    An empty file can not be mapped, its contents is returned instead.
+    """
+    with open(path, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
 
 class Token(object):
 
+    __slots__ = ('type', 'text')
+
     def __init__(self, type, text=''):
         self.type = type
         self.text = text
@@ -42,6 +61,46 @@ class Token(object):
         return self.type == other.type and self.text == other.text
 
 
+class TokenStream(object):
+    """Tokens of a buffer as parallel arrays.
+
+    Token i has type names[kinds[i]] and spans buffer[starts[i]:ends[i]].
+    The text and Token objects are only created when asked for.  The
+    stream always ends with an EOF token.
+    """
+
+    __slots__ = ('buffer', 'names', 'kinds', 'starts', 'ends')
+
+    def __init__(self, buffer, names, kinds, starts, ends):
+        self.buffer = buffer
+        self.names = names
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __iter__(self):
+        for index in xrange(len(self.kinds)):
+            yield self.token(index)
+
+    def type(self, index):
+        return self.names[self.kinds[index]]
+
+    def text(self, index):
+        token_type = self.names[self.kinds[index]]
+        if token_type == tokens.EOF:
+            return 'EOF'
+        text = self.buffer[self.starts[index]:self.ends[index]]
+        if token_type == tokens.STRING:
+            text = text.strip("'")
+        return text
+
+    def token(self, index):
+        return Token(self.type(index), self.text(index))
+
+
 class LexerException(Exception):
 
     def __init__(self, msg, pos):
@@ -80,58 +139,219 @@ class Lexer(object):
 
     IS_WHITESPACE = re.compile(r'( |\t)+').match
     IS_COMMENT = re.compile(r'#.*').match
+    # whitespace and comments between tokens, skipped in one match
+    SKIP = r'(?:[ \t]+|#.*)+'
+    # match keywords as identifiers and classify them by a dict lookup
+    # instead of trying every keyword rule before the identifier rule
+    LOOKUP_KEYWORDS = True
+    IDENTIFIER = tokens.ID
+
+    # bytes read at a time from a file object
+    CHUNK_SIZE = 64 * 1024
+
+    __slots__ = ('buffer', 'pos', 'regexp', 'skip', 'keywords', 'types',
+                 'reader', 'chunk_size', 'offset', 'line_end')
 
-    def __init__(self, buffer):
+    def __init__(self, buffer, chunk_size=None):
+        """Lex a string, an mmap or a file object.
+
+        A file object is read in chunks and only the unlexed part of the
+        current chunk is kept in memory, positions in exceptions are
+        still offsets from the start of the file.
+        """
+        self.reader = None
+        if hasattr(buffer, 'read') and not isinstance(buffer, mmap.mmap):
+            self.reader = buffer
+            buffer = ''
         self.buffer = buffer
         self.pos = 0
-        self.regexp = self._build_master_regexp()
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.offset = 0
+        self.line_end = -1
+        (self.regexp, self.skip,
+         self.keywords, self.types) = self.get_tables()
+
+    @classmethod
+    def get_tables(cls):
+        """Return (master regexp, skip match, keyword map, types).
 
-    def _build_master_regexp(self):
+        The tables are built on first use and cached on the class
+        itself, a subclass with its own RULES gets its own tables.
+        The keyword map has the token type of every rule that matches
+        a fixed word.  With LOOKUP_KEYWORDS those rules are left out of
+        the master regexp and identifiers are looked up in the map, so
+        'define' is a single identifier instead of 'def' and 'ine'.
+        Types maps regexp group names to interned token types, so token
+        types compare by identity.
+        """
+        tables = cls.__dict__.get('_tables')
+        if tables is None:
+            keywords = {}
+            for regexp, group_name in cls.RULES:
+                if KEYWORD_RULE(regexp):
+                    keywords[regexp] = group_name
+            if not cls.LOOKUP_KEYWORDS:
+                exclude = ()
+            else:
+                exclude = keywords
+            types = dict((group_name, intern(group_name))
+                         for _, group_name in cls.RULES)
+            tables = (cls._build_master_regexp(exclude),
+                      re.compile(cls.SKIP).match,
+                      keywords, types)
+            cls._tables = tables
+        return tables
+
+    @classmethod
+    def get_scanner(cls):
+        """Return (scan regexp, kind names, kinds, keyword kinds).
+
+        The scan regexp is the master regexp with whitespace and comments
+        as the first alternative, so one finditer pass covers the whole
+        buffer.  Token kinds are small ints indexing the kind names.
+        Built on first use and cached on the class like get_tables.
+        """
+        scanner = cls.__dict__.get('_scanner')
+        if scanner is None:
+            regexp, _, keywords, _ = cls.get_tables()
+            names = []
+            for _, group_name in cls.RULES:
+                if group_name not in names:
+                    names.append(group_name)
+            names.append(tokens.EOF)
+            kinds = dict((name, kind) for kind, name in enumerate(names))
+            keyword_kinds = {}
+            if cls.LOOKUP_KEYWORDS:
+                for text, group_name in keywords.iteritems():
+                    keyword_kinds[text] = kinds[group_name]
+            scan = re.compile(
+                r'(?P<_SKIP>%s)|%s' % (cls.SKIP, regexp.pattern),
+                re.MULTILINE)
+            scanner = (scan, tuple(names), kinds, keyword_kinds)
+            cls._scanner = scanner
+        return scanner
+
+    @classmethod
+    def _build_master_regexp(cls, exclude=()):
         result = []
-        for regexp, group_name in self.RULES:
+        for regexp, group_name in cls.RULES:
+            if regexp in exclude:
+                continue
             result.append(r'(?P<%s>%s)' % (group_name, regexp))
 
         master_regexp = re.compile('|'.join(result), re.MULTILINE)
         return master_regexp
 
-    def token(self):
-        buffer, regexp = self.buffer, self.regexp
-        IS_WHITESPACE = self.IS_WHITESPACE
-        IS_COMMENT = self.IS_COMMENT
-        end = len(buffer)
+    def _read(self):
+        """Append next chunk to the unlexed part of the buffer.
 
-        while True:
-            match = (IS_WHITESPACE(buffer, self.pos) or
-                     IS_COMMENT(buffer, self.pos))
+        Return False and stop reading at the end of the file.
+        """
+        chunk = self.reader.read(self.chunk_size)
+        if not chunk:
+            self.reader = None
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.line_end = -1
+        return True
 
-            if match is not None:
-                self.pos = match.end()
-            else:
-                break
+    def _fill(self):
+        """Read until the buffer has a whole line after the position.
+
+        Only strings can span lines, for them the token match fails and
+        is retried after reading more.
+        """
+        if self.line_end >= self.pos:
+            return
+        self.line_end = self.buffer.find('\n', self.pos)
+        while self.line_end < 0 and self._read():
+            self.line_end = self.buffer.find('\n', self.pos)
+
+    def token(self):
+        if self.reader is not None:
+            self._fill()
+        buffer = self.buffer
+
+        match = self.skip(buffer, self.pos)
+        if match is not None:
+            self.pos = match.end()
 
         # the end
-        if self.pos >= end:
+        if self.pos >= len(buffer):
             return Token(tokens.EOF, 'EOF')
 
-        match = regexp.match(buffer, self.pos)
+        match = self.regexp.match(buffer, self.pos)
         if match is None:
-            raise LexerException('No valid token', self.pos)
+            if self.reader is not None and self._read():
+                return self.token()
+            raise LexerException('No valid token', self.offset + self.pos)
 
         self.pos = match.end()
 
         group_name = match.lastgroup
-        token = Token(group_name, match.group(group_name))
+        text = match.group(group_name)
+        group_name = self.types[group_name]
+        if group_name == self.IDENTIFIER and self.LOOKUP_KEYWORDS:
+            group_name = self.keywords.get(text, group_name)
+        token = Token(group_name, text)
         if token.type == tokens.STRING:
             token.text = token.text.strip("'")
         return token
 
+    def tokenize(self):
+        """Lex the rest of the buffer in one pass into a TokenStream."""
+        if self.reader is not None:
+            # the stream holds offsets into one buffer, read the rest
+            self.offset += self.pos
+            self.buffer = self.buffer[self.pos:] + self.reader.read()
+            self.pos = 0
+            self.reader = None
+        scan, names, kinds, keyword_kinds = self.get_scanner()
+        buffer = self.buffer
+        offset = self.offset
+        identifier = kinds.get(self.IDENTIFIER)
+
+        kind_array = array('B' if len(names) <= 256 else 'H')
+        starts = array('l')
+        ends = array('l')
+        add_kind = kind_array.append
+        add_start = starts.append
+        add_end = ends.append
+
+        pos = self.pos
+        for match in scan.finditer(buffer, pos):
+            start, end = match.span()
+            if start != pos:
+                raise LexerException('No valid token', offset + pos)
+            pos = end
+            group_name = match.lastgroup
+            if group_name == '_SKIP':
+                continue
+            kind = kinds[group_name]
+            if kind == identifier and keyword_kinds:
+                kind = keyword_kinds.get(buffer[start:end], kind)
+            add_kind(kind)
+            add_start(start)
+            add_end(end)
+
+        if pos < len(buffer):
+            raise LexerException('No valid token', offset + pos)
+        self.pos = pos
+
+        add_kind(kinds[tokens.EOF])
+        add_start(pos)
+        add_end(pos)
+        return TokenStream(buffer, names, kind_array, starts, ends)
+
     def __iter__(self):
         return self.next()
 
     def next(self):
         while True:
             token = self.token()
-            if tokens.type == tokens.EOF:
+            if token.type == tokens.EOF:
                 yield token
                 return
             yield token
@@ -139,6 +359,8 @@ class Lexer(object):
 
 class AssemblerLexer(Lexer):
 
+    __slots__ = ()
+
     RULES = [
         (r'\.globals', tokens.GLOBALS),
         (r'args', tokens.ARGS),
@@ -147,7 +369,7 @@ class AssemblerLexer(Lexer):
         (r'loadk', tokens.LOADK),
         (r'r\d+', tokens.REG),
         (r'\.def', tokens.DEF),
-        (r'\d+', tokens.INT),
+        (r'-?\d+', tokens.INT),
         (r"'[^']*'", tokens.STRING),
         (r'\r?\n', tokens.NL),
         (r'[a-zA-Z_]+\d*', tokens.ID),
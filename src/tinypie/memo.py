@@ -0,0 +1,136 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from collections import OrderedDict
+
+from tinypie import tokens
+from tinypie.optimizer import PurityAnalysis, global_names
+
+# Default number of results kept per function
+DEFAULT_SIZE = 1024
+
+# Returned by MemoTable.lookup when there is no entry for the key
+MISSING = object()
+
+
+def make_key(args):
+    """Return memo key for argument values.
+
+    Types are part of the key because equal values of different
+    types, like 1 and True, print differently.
+    """
+    return tuple(args) + tuple(type(arg) for arg in args)
+
+
+class MemoTable(object):
+    """Bounded LRU table of function results keyed by argument tuple."""
+
+    def __init__(self, name, size=DEFAULT_SIZE):
+        self.name = name
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """Return cached result for the key or MISSING."""
+        entries = self.entries
+        value = entries.pop(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            # move to the most recently used end
+            entries[key] = value
+            self.hits += 1
+        return value
+
+    def store(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return float(self.hits) / calls if calls else 0.0
+
+    def report(self):
+        return '%s: %d hits, %d misses, %.1f%% hit rate, %d evictions' % (
+            self.name, self.hits, self.misses, self.hit_rate * 100,
+            self.evictions)
+
+
+class Memoizer(object):
+    """Memo tables for the pure functions of a program.
+
+    A function gets a table if PurityAnalysis finds that it neither
+    prints nor reads or writes global variables and calls only such
+    functions: its result then depends only on its arguments.
+    Calls that raise an exception are not cached.
+
+    Tables of earlier runs are dropped when a run defines a function
+    or a global variable: a redefined callee or a global an earlier
+    function now writes would make their results stale.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        # FunctionSymbol -> MemoTable
+        self.tables = {}
+        # names assigned by top level code of earlier runs
+        self.globals = set()
+
+    def analyze(self, tree, known_globals=()):
+        """Create memo tables for pure functions defined in the tree."""
+        names = global_names(tree)
+        defines = any(node.type == tokens.FUNC_DEF for node in tree.children)
+        if defines or not names.issubset(self.globals):
+            self.tables.clear()
+        self.globals.update(names)
+        names.update(known_globals)
+        purity = PurityAnalysis(tree, names)
+        for node in tree.children:
+            if node.type != tokens.FUNC_DEF:
+                continue
+            func_symbol = node.symbol
+            if purity.is_pure(func_symbol):
+                self.tables[func_symbol] = MemoTable(func_symbol.name,
+                                                     self.size)
+
+    def get_table(self, func_symbol):
+        """Return MemoTable of the function or None."""
+        return self.tables.get(func_symbol)
+
+    def report(self):
+        tables = sorted(self.tables.values(), key=lambda table: table.name)
+        return '\n'.join('memo ' + table.report() for table in tables)
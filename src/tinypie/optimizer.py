@@ -0,0 +1,1024 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import copy
+
+from tinypie import tokens
+from tinypie.ast import AST
+from tinypie.lexer import Token
+from tinypie.symbol import FunctionSymbol, VariableSymbol
+
+# Longest string constant the folder is allowed to build
+MAX_STRING_LENGTH = 4096
+# Largest return expression, in AST nodes, the inliner substitutes
+MAX_INLINE_SIZE = 16
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+
+def is_constant(node):
+    return node.type in (tokens.INT, tokens.STRING)
+
+
+def constant_value(node):
+    if node.type == tokens.INT:
+        return int(node.text)
+    return node.text
+
+
+def make_constant(value):
+    if isinstance(value, basestring):
+        return AST(Token(tokens.STRING, value))
+    return AST(Token(tokens.INT, str(value)))
+
+
+def static_kind(node):
+    """Return int or str if the expression always yields one, else None."""
+    node_type = node.type
+
+    if node_type == tokens.INT:
+        return int
+
+    if node_type == tokens.STRING:
+        return str
+
+    if node_type in (tokens.ADD, tokens.SUB, tokens.MUL):
+        left = static_kind(node.children[0])
+        right = static_kind(node.children[1])
+        if left is int and right is int:
+            return int
+        if node_type == tokens.ADD and left is str and right is str:
+            return str
+        if node_type == tokens.MUL and str in (left, right):
+            return str
+
+    return None
+
+
+def has_call(node):
+    if node.type == tokens.CALL:
+        return True
+    return any(has_call(child) for child in node.children)
+
+
+def copy_tree(node):
+    """Return deep copy of AST keeping tokens and annotations."""
+    new_node = copy.copy(node)
+    new_node.children = [copy_tree(child) for child in node.children]
+    return new_node
+
+
+def tree_key(node):
+    """Return string that is equal for structurally equal trees."""
+    if not node.children:
+        return '%s:%s' % (node.type, node.text)
+    children = ' '.join(tree_key(child) for child in node.children)
+    return '(%s:%s %s)' % (node.type, node.text, children)
+
+
+def assigned_names(node, names=None):
+    """Return set of names assigned anywhere in the tree."""
+    if names is None:
+        names = set()
+    if node.type == tokens.ASSIGN:
+        names.add(node.children[0].text)
+    for child in node.children:
+        assigned_names(child, names)
+    return names
+
+
+def global_names(tree):
+    """Return set of names assigned by top level code.
+
+    Only top level code creates global variables, an assignment
+    inside a function writes a global only if it already exists.
+    """
+    names = set()
+    for child in tree.children:
+        if child.type != tokens.FUNC_DEF:
+            assigned_names(child, names)
+    return names
+
+
+def called_function(node):
+    """Return FunctionSymbol a CALL node invokes or None."""
+    scope = getattr(node, 'scope', None)
+    if scope is None:
+        return None
+    symbol = scope.resolve(node.children[0].text)
+    if isinstance(symbol, FunctionSymbol):
+        return symbol
+    return None
+
+
+class ConstantFolder(object):
+    """Constant folding and algebraic simplification pass.
+
+    - folds ADD, SUB, MUL of constant operands into a constant
+    - folds LT and EQ of constant operands in IF and WHILE
+      predicates, where only the truth value matters
+    - simplifies x * 1, x + 0, x - 0, x * 0 and s + '' when the
+      other operand is known to be an integer (string for s)
+    - replaces IF with the branch a constant predicate selects and
+      drops WHILE loops whose predicate is constantly false
+
+    Expressions that would fail at run time, like 1 + 'a', are left
+    alone so that the error still happens when they are executed.
+
+    In top level code the types TypeInference finds for variables
+    count as known, so x * 1 becomes x if x only holds integers. A
+    function body keeps its variables untyped: code parsed later by
+    the same interpreter may call it with other arguments or assign
+    other values to the globals it reads. x * 0 needs an operand
+    without variables either way, reading a variable may fail.
+    """
+
+    name = 'constant folding'
+
+    def __init__(self, known_globals=()):
+        # globals created by earlier runs of the same interpreter
+        self.known_globals = known_globals
+        self.eliminated = 0
+        # True while folding top level code of a type inferred tree
+        self.typed = False
+
+    def optimize(self, tree):
+        from tinypie.typeinfer import TypeInference
+
+        before = count_nodes(tree)
+        TypeInference(self.known_globals).infer(tree)
+        self.typed = True
+        self._block(tree)
+        self.typed = False
+        self.eliminated += before - count_nodes(tree)
+        return tree
+
+    def report(self):
+        return '%s: %d nodes eliminated' % (self.name, self.eliminated)
+
+    def fold(self, node):
+        """Fold expression and return the node replacing it."""
+        return self._expr(node)
+
+    def _block(self, node):
+        children = []
+        for child in node.children:
+            children.extend(self._statement(child))
+        node.children = children
+
+    def _statement(self, node):
+        """Fold statement and return list of statements replacing it."""
+        node_type = node.type
+
+        if node_type == tokens.FUNC_DEF:
+            typed, self.typed = self.typed, False
+            self._block(node.children[-1])
+            self.typed = typed
+
+        elif node_type == tokens.BLOCK:
+            self._block(node)
+
+        elif node_type in (tokens.ASSIGN, tokens.PRINT, tokens.RETURN):
+            node.children[-1] = self._expr(node.children[-1])
+
+        elif node_type == tokens.CALL:
+            self._call(node)
+
+        elif node_type == tokens.IF:
+            predicate, truth = self._predicate(node.children[0])
+            if truth is None:
+                node.children[0] = predicate
+                for child in node.children[1:]:
+                    self._block(child)
+            elif truth:
+                self._block(node.children[1])
+                return node.children[1].children
+            elif len(node.children) == 3:
+                self._block(node.children[2])
+                return node.children[2].children
+            else:
+                return []
+
+        elif node_type == tokens.WHILE:
+            predicate, truth = self._predicate(node.children[0])
+            if truth is not None and not truth:
+                return []
+            node.children[0] = predicate
+            self._block(node.children[1])
+
+        return [node]
+
+    def _predicate(self, node):
+        """Fold predicate and return (node, truth value or None)."""
+        node = self._expr(node)
+
+        if node.type in (tokens.LT, tokens.EQ):
+            left, right = node.children
+            if is_constant(left) and is_constant(right):
+                if node.type == tokens.LT:
+                    result = constant_value(left) < constant_value(right)
+                else:
+                    result = constant_value(left) == constant_value(right)
+                return node, bool(result)
+
+        if is_constant(node):
+            return node, bool(constant_value(node))
+
+        return node, None
+
+    def _call(self, node):
+        for index in range(1, len(node.children)):
+            node.children[index] = self._expr(node.children[index])
+
+    def _expr(self, node):
+        node_type = node.type
+
+        if node_type == tokens.CALL:
+            self._call(node)
+            return node
+
+        if node_type not in (tokens.ADD, tokens.SUB, tokens.MUL,
+                             tokens.LT, tokens.EQ):
+            return node
+
+        left = node.children[0] = self._expr(node.children[0])
+        right = node.children[1] = self._expr(node.children[1])
+
+        if node_type in (tokens.LT, tokens.EQ):
+            return node
+
+        if is_constant(left) and is_constant(right):
+            folded = self._fold(
+                node_type, constant_value(left), constant_value(right))
+            if folded is not None:
+                return folded
+
+        return self._simplify(node, left, right)
+
+    @staticmethod
+    def _fold(node_type, left, right):
+        if node_type == tokens.ADD:
+            if type(left) is not type(right):
+                return None
+            result = left + right
+
+        elif node_type == tokens.SUB:
+            if not (isinstance(left, int) and isinstance(right, int)):
+                return None
+            result = left - right
+
+        else:
+            if isinstance(left, basestring) and isinstance(right, basestring):
+                return None
+            result = left * right
+
+        if isinstance(result, basestring) and len(result) > MAX_STRING_LENGTH:
+            return None
+
+        return make_constant(result)
+
+    def _kind(self, node):
+        """Return int or str if the expression always yields one."""
+        kind = static_kind(node)
+        if kind is None and self.typed:
+            kind = getattr(node, 'static_type', None)
+            if kind not in (int, str):
+                return None
+        return kind
+
+    def _simplify(self, node, left, right):
+        node_type = node.type
+
+        def is_value(operand, value):
+            return is_constant(operand) and constant_value(operand) == value
+
+        if node_type == tokens.MUL:
+            for operand, other in ((right, left), (left, right)):
+                if is_value(operand, 1) and self._kind(other) is not None:
+                    return other
+                if (is_value(operand, 0) and static_kind(other) is int and
+                    not has_call(other)):
+                    return operand
+
+        elif node_type == tokens.ADD:
+            for operand, other in ((right, left), (left, right)):
+                if is_value(operand, 0) and self._kind(other) is int:
+                    return other
+                if is_value(operand, '') and self._kind(other) is str:
+                    return other
+
+        elif node_type == tokens.SUB:
+            if is_value(right, 0) and self._kind(left) is int:
+                return left
+
+        return node
+
+
+class PurityAnalysis(object):
+    """Finds functions without side effects.
+
+    A function is pure if it does not print, does not read or write
+    global variables and calls only pure functions. A pure function
+    called twice with the same arguments returns the same value and
+    changes nothing, though it may still raise an exception.
+
+    Functions calling each other are solved together: all of them
+    start out pure and are marked impure until nothing changes.
+    """
+
+    def __init__(self, tree, global_names):
+        self.global_names = global_names
+        self.pure = {}
+        functions = [node.symbol for node in tree.children
+                     if node.type == tokens.FUNC_DEF]
+        self._solve(functions)
+
+    def is_pure(self, func_symbol):
+        if func_symbol not in self.pure:
+            self._solve([func_symbol])
+        return self.pure[func_symbol]
+
+    def is_pure_call(self, node):
+        func_symbol = called_function(node)
+        return func_symbol is not None and self.is_pure(func_symbol)
+
+    def is_pure_expr(self, node):
+        """Return True if evaluating expression has no side effects."""
+        if node.type == tokens.CALL:
+            if not self.is_pure_call(node):
+                return False
+            return all(self.is_pure_expr(child)
+                       for child in node.children[1:])
+        return all(self.is_pure_expr(child) for child in node.children)
+
+    def _solve(self, functions):
+        callees = {}
+        worklist = list(functions)
+        while worklist:
+            func_symbol = worklist.pop()
+            if func_symbol in self.pure or func_symbol in callees:
+                continue
+            calls = []
+            pure = self._is_local_pure(func_symbol, func_symbol.block_ast,
+                                       calls)
+            callees[func_symbol] = [called_function(call) for call in calls]
+            self.pure[func_symbol] = pure
+            worklist.extend(callee for callee in callees[func_symbol]
+                            if callee is not None)
+
+        changed = True
+        while changed:
+            changed = False
+            for func_symbol, targets in callees.items():
+                if not self.pure[func_symbol]:
+                    continue
+                if any(target is None or not self.pure[target]
+                       for target in targets):
+                    self.pure[func_symbol] = False
+                    changed = True
+
+    def _is_local_pure(self, func_symbol, node, calls):
+        if node is None:
+            return False
+
+        args = set(arg.name for arg in func_symbol.formal_args)
+
+        def visit(node):
+            if node.type == tokens.PRINT:
+                return False
+            if node.type == tokens.ID:
+                return node.text in args or node.text not in self.global_names
+            if node.type == tokens.ASSIGN:
+                name = node.children[0].text
+                if name not in args and name in self.global_names:
+                    return False
+                return visit(node.children[1])
+            if node.type == tokens.CALL:
+                calls.append(node)
+                return all(visit(child) for child in node.children[1:])
+            return all(visit(child) for child in node.children)
+
+        return visit(node)
+
+
+class FunctionInliner(object):
+    """Replaces calls to small functions with their bodies.
+
+    A function can be inlined if its body is a single 'return expr'
+    statement, expr has at most max_size nodes and the function does
+    not call itself, directly or through other functions. The call
+
+        def sq(x) return x * x
+        y = sq(a) + 1               y = a * a + 1
+
+    is replaced with the return expression, formal arguments renamed
+    to the actual arguments. A call is left alone if:
+
+    - the number of arguments does not match the formal arguments
+    - an argument other than a constant or a variable has side
+      effects or its formal argument is not used exactly once,
+      so it would be evaluated a different number of times
+    - the body reads a global that is a local variable of the caller
+
+    A function keeps its body as it was before inlining. If code parsed
+    later by the same interpreter redefines a function inlined into it,
+    that body is put back into the later tree and optimized again.
+    """
+
+    name = 'inlining'
+
+    def __init__(self, known_globals=(), max_size=MAX_INLINE_SIZE):
+        self.known_globals = known_globals
+        self.max_size = max_size
+        self.inlined = 0
+        self.purity = None
+        self.folder = ConstantFolder()
+        # FunctionSymbol -> return expression or None
+        self.candidates = {}
+        # FunctionSymbol -> (FUNC_DEF node, body before inlining)
+        self.originals = {}
+        # FunctionSymbol -> names of functions inlined into its body
+        self.depends = {}
+        # function whose body is being optimized, None at top level
+        self.caller = None
+
+    def optimize(self, tree):
+        self._restore(tree)
+        names = global_names(tree)
+        names.update(self.known_globals)
+        self.purity = PurityAnalysis(tree, names)
+        self.candidates = {}
+        self._statements(tree, frozenset())
+        return tree
+
+    def report(self):
+        return '%s: %d call sites inlined' % (self.name, self.inlined)
+
+    def _restore(self, tree):
+        """Put back functions that inlined a function the tree redefines."""
+        defined = set(child.symbol.name for child in tree.children
+                      if child.type == tokens.FUNC_DEF)
+        restored = []
+        for func_symbol, names in self.depends.items():
+            if func_symbol.name not in defined and not names & defined:
+                continue
+            del self.depends[func_symbol]
+            node, body = self.originals.pop(func_symbol)
+            # a function the tree redefines itself is never called again
+            if func_symbol.name not in defined:
+                node.children[-1] = func_symbol.block_ast = body
+                restored.append(node)
+        tree.children[:0] = restored
+
+    def get_body(self, func_symbol):
+        """Return return expression of inlinable function or None."""
+        if func_symbol not in self.candidates:
+            self.candidates[func_symbol] = self._get_body(func_symbol)
+        return self.candidates[func_symbol]
+
+    def _get_body(self, func_symbol):
+        block = func_symbol.block_ast
+        if block is None or len(block.children) != 1:
+            return None
+
+        statement = block.children[0]
+        if statement.type != tokens.RETURN:
+            return None
+
+        body = statement.children[0]
+        if count_nodes(body) > self.max_size:
+            return None
+
+        if self._calls(func_symbol, func_symbol):
+            return None
+
+        return body
+
+    def _calls(self, func_symbol, target, seen=None):
+        """Return True if func_symbol may end up calling target."""
+        if seen is None:
+            seen = set()
+        seen.add(func_symbol)
+
+        def visit(node):
+            if node.type == tokens.CALL:
+                callee = called_function(node)
+                if callee is None or callee is target:
+                    return True
+                if callee not in seen and self._calls(callee, target, seen):
+                    return True
+            return any(visit(child) for child in node.children)
+
+        return func_symbol.block_ast is None or visit(func_symbol.block_ast)
+
+    def _statements(self, node, local_names):
+        for child in node.children:
+            child_type = child.type
+
+            if child_type == tokens.FUNC_DEF:
+                func_symbol = child.symbol
+                names = set(arg.name for arg in func_symbol.formal_args)
+                assigned_names(child.children[-1], names)
+                if func_symbol.local_scope is not None:
+                    names.update(func_symbol.local_scope.symbols)
+                body = copy_tree(child.children[-1])
+                self.caller = func_symbol
+                self._statements(child.children[-1], frozenset(names))
+                self.caller = None
+                if func_symbol in self.depends:
+                    self.originals[func_symbol] = (child, body)
+                # the body may have changed
+                self.candidates.pop(func_symbol, None)
+
+            elif child_type == tokens.BLOCK:
+                self._statements(child, local_names)
+
+            elif child_type in (tokens.IF, tokens.WHILE):
+                child.children[0] = self._expr(child.children[0], local_names)
+                for block in child.children[1:]:
+                    self._statements(block, local_names)
+
+            elif child_type in (tokens.ASSIGN, tokens.PRINT, tokens.RETURN):
+                child.children[-1] = self._expr(child.children[-1],
+                                                local_names)
+
+            elif child_type == tokens.CALL:
+                self._arguments(child, local_names)
+
+    def _arguments(self, node, local_names):
+        for index in range(1, len(node.children)):
+            node.children[index] = self._expr(node.children[index],
+                                              local_names)
+
+    def _expr(self, node, local_names):
+        if node.type == tokens.CALL:
+            self._arguments(node, local_names)
+            inlined = self._inline(node, local_names)
+            if inlined is not None:
+                self.inlined += 1
+                # the body may call other small functions
+                return self._expr(inlined, local_names)
+            return node
+
+        inlined = self.inlined
+        for index, child in enumerate(node.children):
+            node.children[index] = self._expr(child, local_names)
+        if self.inlined != inlined:
+            # inlined constant arguments may fold further
+            return self.folder.fold(node)
+        return node
+
+    def _inline(self, node, local_names):
+        func_symbol = called_function(node)
+        if func_symbol is None:
+            return None
+
+        body = self.get_body(func_symbol)
+        if body is None:
+            return None
+
+        formal_args = [arg.name for arg in func_symbol.formal_args]
+        args = node.children[1:]
+        if len(args) != len(formal_args):
+            return None
+
+        uses = {}
+        free_names = set()
+        self._count_uses(body, formal_args, uses, free_names)
+        if free_names & local_names:
+            return None
+
+        substitutions = {}
+        for name, arg in zip(formal_args, args):
+            if arg.type == tokens.ID and name not in uses:
+                # reading the dropped name could fail, keep the call
+                return None
+            if arg.type not in (tokens.INT, tokens.STRING, tokens.ID):
+                if uses.get(name, 0) != 1:
+                    return None
+                if not self.purity.is_pure_expr(arg):
+                    return None
+            substitutions[name] = arg
+
+        if self.caller is not None:
+            names = self.depends.setdefault(self.caller, set())
+            names.add(func_symbol.name)
+            names.update(self.depends.get(func_symbol, ()))
+        return self.folder.fold(self._substitute(body, substitutions))
+
+    def _count_uses(self, node, formal_args, uses, free_names):
+        if node.type == tokens.ID:
+            if node.text in formal_args:
+                uses[node.text] = uses.get(node.text, 0) + 1
+            else:
+                free_names.add(node.text)
+            return
+
+        children = node.children
+        if node.type == tokens.CALL:
+            children = children[1:]
+        for child in children:
+            self._count_uses(child, formal_args, uses, free_names)
+
+    def _substitute(self, node, substitutions):
+        if node.type == tokens.ID and node.text in substitutions:
+            return copy_tree(substitutions[node.text])
+
+        new_node = copy.copy(node)
+        new_node.children = list(node.children)
+        start = 1 if node.type == tokens.CALL else 0
+        for index in range(start, len(node.children)):
+            new_node.children[index] = self._substitute(
+                node.children[index], substitutions)
+        return new_node
+
+
+class LoopInvariantMotion(object):
+    """Loop-invariant code motion for WHILE loops.
+
+    An expression inside a loop is invariant if the loop does not
+    assign any of the variables it reads and it calls only pure
+    functions. If the loop calls an impure function, that function
+    may write any global variable, so only the formal arguments of
+    the enclosing function are treated as invariant then.
+
+    The invariant expressions evaluated at the start of every
+    iteration - in the predicate and in the assignments that open
+    the loop body - are computed once into temporary variables
+    before the loop:
+
+        while i < n * 2:              if i < n * 2:
+            x = limit * 2                 licm$1 = n * 2
+            ...                           licm$2 = limit * 2
+        .                                 while i < licm$1:
+                                              x = licm$2
+                                              ...
+                                          .
+                                      .
+
+    The guard keeps the loop from evaluating anything it would not
+    evaluate itself when the predicate is false from the start,
+    so loops whose predicate has side effects are left alone.
+    """
+
+    name = 'loop-invariant code motion'
+
+    def __init__(self, global_scope, known_globals=()):
+        self.global_scope = global_scope
+        # globals created by earlier runs of the same interpreter
+        self.known_globals = known_globals
+        self.hoisted = 0
+        self.temp_count = 0
+        self.purity = None
+
+    def optimize(self, tree):
+        names = global_names(tree)
+        names.update(self.known_globals)
+        self.purity = PurityAnalysis(tree, names)
+        self._block(tree, None)
+        return tree
+
+    def report(self):
+        return '%s: %d expressions hoisted' % (self.name, self.hoisted)
+
+    def _block(self, node, func_symbol):
+        children = []
+        for child in node.children:
+            if child.type == tokens.FUNC_DEF:
+                self._block(child.children[-1], child.symbol)
+
+            elif child.type == tokens.BLOCK:
+                self._block(child, func_symbol)
+
+            elif child.type == tokens.IF:
+                for block in child.children[1:]:
+                    self._block(block, func_symbol)
+
+            elif child.type == tokens.WHILE:
+                self._block(child.children[1], func_symbol)
+                children.extend(self._loop(child, func_symbol))
+                continue
+
+            children.append(child)
+
+        node.children = children
+
+    def _loop(self, node, func_symbol):
+        predicate, body = node.children
+        if not self.purity.is_pure_expr(predicate):
+            return [node]
+
+        variant = assigned_names(node)
+        if not self.purity.is_pure_expr(node):
+            # impure calls may write any global variable
+            fixed = set()
+            if func_symbol is not None:
+                fixed = set(arg.name for arg in func_symbol.formal_args)
+            is_invariant_name = lambda name: (name in fixed and
+                                              name not in variant)
+        else:
+            is_invariant_name = lambda name: name not in variant
+
+        candidates = []
+        self._candidates(predicate, is_invariant_name, candidates)
+        for statement in body.children:
+            if statement.type == tokens.ASSIGN:
+                self._candidates(
+                    statement.children[1], is_invariant_name, candidates)
+                continue
+            if statement.type in (tokens.PRINT, tokens.RETURN):
+                self._candidates(
+                    statement.children[0], is_invariant_name, candidates)
+            elif statement.type == tokens.CALL:
+                for child in statement.children[1:]:
+                    self._candidates(child, is_invariant_name, candidates)
+            break
+
+        if not candidates:
+            return [node]
+
+        guard = AST(Token(tokens.IF, 'if'))
+        guard.add_child(copy_tree(predicate))
+        preheader = AST(tokens.BLOCK)
+        guard.add_child(preheader)
+
+        temps = {}
+        for candidate in candidates:
+            key = tree_key(candidate)
+            if key in temps:
+                continue
+            temps[key] = name = self._new_temp(func_symbol)
+            assign = AST(tokens.ASSIGN)
+            assign.add_child(AST(Token(tokens.ID, name)))
+            assign.add_child(copy_tree(candidate))
+            preheader.add_child(assign)
+            self.hoisted += 1
+
+        self._replace(node, temps)
+        preheader.add_child(node)
+        return [guard]
+
+    def _candidates(self, node, is_invariant_name, candidates):
+        """Collect maximal invariant subexpressions worth hoisting."""
+        if node.type in (tokens.INT, tokens.STRING, tokens.ID):
+            return
+
+        if self._is_invariant(node, is_invariant_name):
+            candidates.append(node)
+            return
+
+        children = node.children
+        if node.type == tokens.CALL:
+            children = children[1:]
+        for child in children:
+            self._candidates(child, is_invariant_name, candidates)
+
+    def _is_invariant(self, node, is_invariant_name):
+        node_type = node.type
+
+        if node_type in (tokens.INT, tokens.STRING):
+            return True
+
+        if node_type == tokens.ID:
+            return is_invariant_name(node.text)
+
+        if node_type == tokens.CALL:
+            if not self.purity.is_pure_call(node):
+                return False
+            return all(self._is_invariant(child, is_invariant_name)
+                       for child in node.children[1:])
+
+        if node_type in (tokens.ADD, tokens.SUB, tokens.MUL,
+                         tokens.LT, tokens.EQ):
+            return all(self._is_invariant(child, is_invariant_name)
+                       for child in node.children)
+
+        return False
+
+    def _replace(self, node, temps):
+        """Replace occurrences of hoisted expressions with temporaries."""
+        for index, child in enumerate(node.children):
+            name = temps.get(tree_key(child)) if child.children else None
+            if name is not None:
+                node.children[index] = AST(Token(tokens.ID, name))
+            else:
+                self._replace(child, temps)
+
+    def _new_temp(self, func_symbol):
+        self.temp_count += 1
+        name = 'licm$%d' % self.temp_count
+        if func_symbol is not None:
+            scope = func_symbol.local_scope
+        else:
+            scope = self.global_scope
+        scope.define(VariableSymbol(name))
+        return name
+
+
+class DeadCodeEliminator(object):
+    """Whole program dead function and dead store elimination.
+
+    - drops FUNC_DEF nodes of functions that top level code cannot
+      call, directly or through other functions
+    - drops assignments to formal arguments the function never reads
+
+    Dropped functions keep their symbols in the global scope: if code
+    parsed later by the same interpreter calls one, its definition is
+    put back into that tree. Other variables a function assigns are
+    kept even if it never reads them: the assignment stores into the
+    global variable of that name once it exists, and a program run
+    later by the same interpreter may create and read it. Only formal
+    arguments always have a local value. An assignment whose value
+    may fail at run time stays, one whose value is a call becomes a
+    call statement. Reading a variable is safe if it is a formal
+    argument or an earlier statement of the same or an enclosing block
+    assigns it.
+    """
+
+    name = 'dead code elimination'
+
+    def __init__(self, global_scope):
+        self.global_scope = global_scope
+        self.functions = 0
+        self.stores = 0
+        # FunctionSymbol -> FUNC_DEF node dropped from an earlier tree
+        self.dropped = {}
+
+    def optimize(self, tree):
+        reachable = self._reachable(tree)
+
+        for child in tree.children:
+            if child.type == tokens.FUNC_DEF:
+                # put back into the tree by an earlier pass
+                self.dropped.pop(child.symbol, None)
+
+        children = []
+        for func_symbol, node in self.dropped.items():
+            if func_symbol in reachable:
+                children.append(node)
+                del self.dropped[func_symbol]
+
+        for child in tree.children:
+            if child.type == tokens.FUNC_DEF and (
+                child.symbol not in reachable):
+                func_symbol = child.symbol
+                if self.global_scope.resolve(func_symbol.name) is func_symbol:
+                    self.dropped[func_symbol] = child
+                self.functions += 1
+                continue
+            children.append(child)
+        tree.children = children
+
+        for child in tree.children:
+            if child.type == tokens.FUNC_DEF:
+                self._remove_dead_stores(child.symbol)
+
+        return tree
+
+    def report(self):
+        return '%s: %d functions, %d assignments removed' % (
+            self.name, self.functions, self.stores)
+
+    def _reachable(self, tree):
+        reachable = set()
+        worklist = [child for child in tree.children
+                    if child.type != tokens.FUNC_DEF]
+        while worklist:
+            node = worklist.pop()
+            if node.type == tokens.CALL:
+                func_symbol = called_function(node)
+                if func_symbol is not None and func_symbol not in reachable:
+                    reachable.add(func_symbol)
+                    worklist.append(func_symbol.block_ast)
+            worklist.extend(node.children)
+        return reachable
+
+    def _remove_dead_stores(self, func_symbol):
+        args = set(arg.name for arg in func_symbol.formal_args)
+        # stores to other names may go to a global variable
+        candidates = set(args)
+        # removing a store may leave the names it read unread
+        while True:
+            dead = candidates - self._read_names(func_symbol.block_ast)
+            if not dead or not self._block(func_symbol.block_ast, dead,
+                                           set(args)):
+                return
+
+    def _read_names(self, node, names=None):
+        if names is None:
+            names = set()
+        if node.type == tokens.ID:
+            names.add(node.text)
+        children = node.children
+        if node.type == tokens.ASSIGN:
+            children = children[1:]
+        for child in children:
+            self._read_names(child, names)
+        return names
+
+    def _block(self, node, dead, defined):
+        """Remove stores to dead names, return True if any was removed.
+
+        'defined' are the names surely assigned before the block runs.
+        """
+        removed = False
+        defined = set(defined)
+        children = []
+        for child in node.children:
+            if child.type == tokens.ASSIGN:
+                name = child.children[0].text
+                value = child.children[1]
+                if name in dead and value.type == tokens.CALL:
+                    children.append(value)
+                    self.stores += 1
+                    removed = True
+                    continue
+                if name in dead and self._is_safe(value, defined):
+                    self.stores += 1
+                    removed = True
+                    continue
+                defined.add(name)
+
+            elif child.type in (tokens.BLOCK, tokens.IF, tokens.WHILE):
+                for block in child.children:
+                    if block.type == tokens.BLOCK:
+                        removed = self._block(
+                            block, dead, defined) or removed
+
+            children.append(child)
+
+        node.children = children
+        return removed
+
+    def _is_safe(self, node, defined):
+        """Return True if evaluating expression cannot fail."""
+        node_type = node.type
+
+        if node_type in (tokens.INT, tokens.STRING):
+            return True
+
+        if node_type == tokens.ID:
+            return node.text in defined
+
+        if node_type in (tokens.ADD, tokens.SUB, tokens.MUL,
+                         tokens.LT, tokens.EQ):
+            if not all(self._is_safe(child, defined)
+                       for child in node.children):
+                return False
+            if node_type in (tokens.LT, tokens.EQ):
+                return True
+            left = static_kind(node.children[0])
+            right = static_kind(node.children[1])
+            if left is int and right is int:
+                return True
+            return node_type == tokens.ADD and left is str and right is str
+
+        return False
+
+
+class Optimizer(object):
+    """Runs AST optimization passes between parsing and execution."""
+
+    def __init__(self, global_scope, known_globals=(), passes=None):
+        self.global_scope = global_scope
+        if passes is None:
+            passes = [ConstantFolder(known_globals),
+                      FunctionInliner(known_globals),
+                      LoopInvariantMotion(global_scope, known_globals),
+                      DeadCodeEliminator(global_scope)]
+        self.passes = passes
+
+    def optimize(self, tree):
+        for optimization in self.passes:
+            optimization.optimize(tree)
+        return tree
+
+    def report(self):
+        return '\n'.join(optimization.report()
+                         for optimization in self.passes)
@@ -0,0 +1,178 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import re
+import multiprocessing
+from cStringIO import StringIO
+
+from tinypie import tokens
+from tinypie.arena import ASTArena
+from tinypie.ast import AST
+from tinypie.lexer import Lexer, LexerException
+from tinypie.parser import TokenStreamParser
+from tinypie.parsecache import dump, load
+from tinypie.scope import GlobalScope
+
+# smallest piece of source worth sending to another process
+MIN_CHUNK_SIZE = 64 * 1024
+# pieces per process, smaller pieces even out uneven functions
+CHUNKS_PER_PROCESS = 4
+
+# strings and comments can hold 'def' at the start of a line
+DEF_LINE = re.compile(r"'[^']*'|#[^\n]*|^(def)\b", re.M)
+
+
+def split_source(text, count):
+    """Return offsets of at most count pieces of about the same size.
+
+    Pieces start at the beginning of the text or at a 'def' starting
+    a line outside of strings and comments.  As functions can not be
+    nested such a 'def' is a top level function definition, unless
+    the text does not parse anyway.
+
+    >>> from tinypie.parallel import split_source
+    >>> text = '''x = 1
+    ... def f() return 'a
+    ... def g()'
+    ... # def h()
+    ... def h() return 1
+    ... '''
+    >>> split_source(text, 10)
+    [0, 6, 43]
+
+    """
+    offsets = [0]
+    size = len(text) / float(count)
+    for match in DEF_LINE.finditer(text):
+        start = match.start(1)
+        if start != -1 and start >= size * len(offsets):
+            offsets.append(start)
+            if len(offsets) == count:
+                break
+    return offsets
+
+
+class _Scope(object):
+    """Stand-in interpreter the parser takes its global scope from."""
+
+    def __init__(self, global_scope):
+        self.global_scope = global_scope
+
+
+def _parse(text, global_scope, arena=None):
+    parser = TokenStreamParser(Lexer(text).tokenize(),
+                               interpreter=_Scope(global_scope), arena=arena)
+    parser.parse()
+    return parser.root
+
+
+def _parse_chunk(chunk):
+    """Parse a piece of source in a worker process.
+
+    Return the tree serialized with parsecache.dump, or the message
+    and position of a LexerException that can not cross processes.
+    """
+    global_scope = GlobalScope()
+    try:
+        tree = _parse(chunk, global_scope, ASTArena())
+    except LexerException as e:
+        return None, (e.msg, e.pos)
+    output = StringIO()
+    dump(output, tree, global_scope, global_scope.symbols.values())
+    return output.getvalue(), None
+
+
+class ParallelParser(object):
+    """Lex and parse top level functions of a file in a process pool.
+
+    The source is split at top level function definitions, the pieces
+    are parsed by worker processes and the trees are sent back in the
+    parse cache format.  Their statements are merged under one BLOCK
+    root and the symbols they define are defined in the global scope in
+    source order, a later definition of a name wins as it does when the
+    whole file is parsed at once.  Names are resolved when the tree is
+    executed so calls to functions of other pieces need no fix up.
+
+    Sources shorter than two min_chunk_size pieces are parsed in the
+    calling process.
+
+    >>> from tinypie.interpreter import Interpreter
+    >>> from tinypie.parallel import ParallelParser
+    >>> parser = ParallelParser(processes=2, min_chunk_size=1)
+    >>> interp = Interpreter(parallel_parser=parser)
+    >>> interp.interpret('''
+    ... print double(21)
+    ... def double(x) return x * 2
+    ... def triple(x) return x * 3
+    ... print triple(double(7))
+    ... ''')
+    42
+    42
+    >>> parser.chunks
+    3
+    >>> parser.close()
+
+    """
+
+    def __init__(self, processes=None, min_chunk_size=MIN_CHUNK_SIZE):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_chunk_size = max(min_chunk_size, 1)
+        self.pool = None
+        # number of pieces the last source was split into
+        self.chunks = 0
+
+    def parse(self, text, global_scope):
+        """Parse the text and return the BLOCK root of its tree."""
+        count = min(self.processes * CHUNKS_PER_PROCESS,
+                    len(text) // self.min_chunk_size)
+        offsets = split_source(text, count) if count > 1 else [0]
+        self.chunks = len(offsets)
+        if len(offsets) == 1:
+            return _parse(text, global_scope)
+
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        chunks = [text[start:end] for start, end
+                  in zip(offsets, offsets[1:] + [len(text)])]
+        results = self.pool.imap(_parse_chunk, chunks)
+
+        root = AST(tokens.BLOCK)
+        root.children = []
+        for start, (data, error) in zip(offsets, results):
+            if error is not None:
+                msg, pos = error
+                raise LexerException(msg, start + pos)
+            tree = load(StringIO(data), global_scope)
+            root.children.extend(tree.children)
+        return root
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
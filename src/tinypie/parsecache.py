@@ -0,0 +1,232 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import stat
+import errno
+import struct
+import hashlib
+import tempfile
+import cPickle as pickle
+
+from tinypie.arena import ASTArena, ArenaNode
+from tinypie.ast import AST
+
+# bump when the AST, symbol or parser output changes
+FORMAT_VERSION = 1
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+SUFFIX = '.tpc'
+GLOBAL_SCOPE = 'global'
+# errors of reading a truncated, corrupt or outdated tree
+LOAD_ERRORS = (IOError, EOFError, IndexError, struct.error,
+               pickle.UnpicklingError, AttributeError, ImportError,
+               ValueError)
+
+
+def default_directory():
+    return os.environ.get('TINYPIE_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'tinypie')
+
+
+def dump(output, tree, global_scope, symbols):
+    """Write the tree and the global symbols parsing defined to output.
+
+    The tree is written as an ASTArena, symbol tables are pickled
+    with references to its nodes and to the global scope.  A tree of
+    ArenaNodes is written as is, its root has to be the first node of
+    the arena.
+    """
+    indexes = {}
+    if isinstance(tree, ArenaNode):
+        arena = tree.arena
+    else:
+        arena = ASTArena.from_ast(tree, indexes)
+
+    def persistent_id(obj):
+        if obj is global_scope:
+            return GLOBAL_SCOPE
+        if isinstance(obj, AST):
+            return indexes.get(id(obj))
+        if isinstance(obj, ArenaNode):
+            return obj.index
+        return None
+
+    pickler = pickle.Pickler(output, pickle.HIGHEST_PROTOCOL)
+    pickler.dump(arena.dumps())
+    pickler.persistent_id = persistent_id
+    pickler.dump((arena.symbols, arena.scopes, symbols))
+
+
+def load(source, global_scope):
+    """Read a tree written by dump and return it.
+
+    The global symbols are defined in global_scope.
+    """
+    unpickler = pickle.Unpickler(source)
+    nodes = ASTArena.loads(unpickler.load()).to_ast_nodes()
+
+    def persistent_load(pid):
+        if pid == GLOBAL_SCOPE:
+            return global_scope
+        if isinstance(pid, int) and 0 <= pid < len(nodes):
+            return nodes[pid]
+        raise pickle.UnpicklingError('unknown reference %r' % pid)
+
+    unpickler.persistent_load = persistent_load
+    symbols, scopes, defined = unpickler.load()
+    for index, symbol in symbols.iteritems():
+        nodes[index].symbol = symbol
+    for index, scope in scopes.iteritems():
+        nodes[index].scope = scope
+    for symbol in defined:
+        global_scope.symbols[symbol.name] = symbol
+    return nodes[0]
+
+
+def is_trusted(entry_stat):
+    """Return True if only the current user can have written the file."""
+    return (entry_stat.st_uid == os.getuid() and
+            not entry_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+class ParseCache(object):
+    """On-disk cache of parsed TinyPie source keyed by source hash.
+
+    An entry holds the AST as a serialized ASTArena, the symbols and
+    scopes of its nodes and the symbols parsing defined in the global
+    scope.  The global scope itself is stored as a reference and bound
+    to the scope of the loading interpreter.  Entries are evicted least
+    recently used first once the directory grows over max_size bytes.
+
+    Loading an entry unpickles it, which can run arbitrary code, so the
+    directory is created accessible to its owner only and entries owned
+    by another user or writable by others are treated as missing.
+
+    >>> import shutil, tempfile
+    >>> from tinypie.parsecache import ParseCache
+    >>> from tinypie.interpreter import Interpreter
+    >>> directory = tempfile.mkdtemp()
+    >>> text = '''
+    ... def f(x) return x * 2
+    ... print f(21)
+    ... '''
+    >>> Interpreter(parse_cache=ParseCache(directory)).interpret(text)
+    42
+    >>> cache = ParseCache(directory)
+    >>> interp = Interpreter(parse_cache=cache)
+    >>> interp.interpret(text)
+    42
+    >>> cache.hits, cache.misses
+    (1, 0)
+    >>> shutil.rmtree(directory)
+
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, text):
+        digest = hashlib.sha1('tinypie %d\n' % FORMAT_VERSION)
+        digest.update(text)
+        return os.path.join(self.directory, digest.hexdigest() + SUFFIX)
+
+    def load(self, text, global_scope):
+        """Return the cached tree of the text or None.
+
+        Global symbols of the entry are defined in global_scope.
+        """
+        path = self._path(text)
+        try:
+            with open(path, 'rb') as source:
+                if not is_trusted(os.fstat(source.fileno())):
+                    raise IOError('untrusted cache entry %s' % path)
+                tree = load(source, global_scope)
+        except LOAD_ERRORS:
+            self.misses += 1
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return tree
+
+    def store(self, text, tree, global_scope, symbols):
+        """Cache the tree and the global symbols parsing defined."""
+        try:
+            os.makedirs(self.directory, 0700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                return
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                dump(output, tree, global_scope, symbols)
+            os.rename(temp_path, self._path(text))
+        except (IOError, OSError, RuntimeError, pickle.PicklingError):
+            # too deep to pickle or the disk is full, parse next time
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove every entry of the cache."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                os.remove(os.path.join(self.directory, name))
@@ -41,12 +41,22 @@ from tinypie.symbol import VariableSymbol, FunctionSymbol
 #                        | 'while' expr slist
 #                        | NL
 # assign              -> ID '=' expr
-# expr                -> add_expr (('<' | '==') add_expr)?
-# add_expr            -> mult_expr (('+' | '-') mult_expr)*
-# mult_expr           -> atom ('*' atom)*
+# expr                -> atom (binary_operator atom)*
+# binary_operator     -> '<' | '==' | '+' | '-' | '*'
 # atom                -> ID | INT | STRING | call | '(' expr ')'
 # call                -> ID '(' (expr (',' expr)*)? ')'
 
+# binary operator -> binding power, higher binds tighter
+BINDING_POWER = {
+    tokens.LT: 1,
+    tokens.EQ: 1,
+    tokens.ADD: 2,
+    tokens.SUB: 2,
+    tokens.MUL: 3,
+    }
+# operators that do not chain, 'a < b < c' is a syntax error
+NON_ASSOCIATIVE = frozenset([tokens.LT, tokens.EQ])
+
 
 class ParserException(Exception):
     pass
@@ -79,11 +89,46 @@ class BaseParser(object):
         return self.lookahead[(self.pos + number) % self.lookahead_limit]
 
 
+class TokenStreamMixin(object):
+    """Read tokens from a lexer.TokenStream instead of a lexer.
+
+    The lookahead is an index into the stream, token types come straight
+    from its arrays and Token objects are only created for the tokens
+    the parser asks for.  Mix in before a BaseParser subclass and pass
+    the stream in place of the lexer.
+    """
+
+    def _init_lookahead(self):
+        self.index = 0
+        self.last = len(self.lexer) - 1
+        self.names = self.lexer.names
+        self.kinds = self.lexer.kinds
+
+    def _consume(self):
+        if self.index < self.last:
+            self.index += 1
+
+    def _lookahead_type(self, number):
+        index = self.index + number
+        if index > self.last:
+            index = self.last
+        return self.names[self.kinds[index]]
+
+    def _lookahead_token(self, number):
+        index = self.index + number
+        if index > self.last:
+            index = self.last
+        return self.lexer.token(index)
+
+
 class Parser(BaseParser):
     """TinyPie Parser"""
 
-    def __init__(self, lexer, lookahead_limit=2, interpreter=None):
+    def __init__(self, lexer, lookahead_limit=2, interpreter=None,
+                 arena=None):
         self.lexer = lexer
+        # with an arena.ASTArena nodes are ArenaNode views into it
+        self.new_node = AST if arena is None else arena.node
         self.lookahead = [None] * lookahead_limit
         self.lookahead_limit = lookahead_limit
         self.pos = 0
@@ -94,7 +139,7 @@ class Parser(BaseParser):
         self.current_scope = interpreter.global_scope
 
     def parse(self):
-        node = AST(tokens.BLOCK)
+        node = self.new_node(tokens.BLOCK)
 
         while self._lookahead_type(0) != tokens.EOF:
 
@@ -116,11 +161,12 @@ class Parser(BaseParser):
         """
         self._match(tokens.DEF)
 
-        node = AST(tokens.FUNC_DEF)
+        node = self.new_node(tokens.FUNC_DEF)
         id_token = self._lookahead_token(0)
-        node.add_child(AST(id_token))
+        node.add_child(self.new_node(id_token))
 
         func_symbol = FunctionSymbol(id_token.text, self.current_scope)
+        node.symbol = func_symbol
         func_symbol.scope = self.current_scope
         self.current_scope.define(func_symbol)
         self.current_scope = func_symbol
@@ -129,7 +175,7 @@ class Parser(BaseParser):
         self._match(tokens.LPAREN)
 
         if self._lookahead_type(0) == tokens.ID:
-            node.add_child(AST(self._lookahead_token(0)))
+            node.add_child(self.new_node(self._lookahead_token(0)))
 
             variable_symbol = VariableSymbol(self._lookahead_token(0).text)
             variable_symbol.scope = self.current_scope
@@ -139,7 +185,7 @@ class Parser(BaseParser):
 
             while self._lookahead_type(0) == tokens.COMMA:
                 self._match(tokens.COMMA)
-                node.add_child(AST(self._lookahead_token(0)))
+                node.add_child(self.new_node(self._lookahead_token(0)))
 
                 variable_symbol = VariableSymbol(self._lookahead_token(0).text)
                 self.current_scope.define(variable_symbol)
@@ -150,6 +196,7 @@ class Parser(BaseParser):
         self._match(tokens.RPAREN)
 
         self.current_scope = LocalScope(self.current_scope)
+        func_symbol.local_scope = self.current_scope
 
         block_ast = self._slist()
         func_symbol.block_ast = block_ast
@@ -169,7 +216,7 @@ class Parser(BaseParser):
         slist -> ':' NL statement+ '.' NL
                  | statement
         """
-        node = AST(tokens.BLOCK)
+        node = self.new_node(tokens.BLOCK)
 
         if self._lookahead_type(0) == tokens.COLON:
             self._match(tokens.COLON)
@@ -203,14 +250,14 @@ class Parser(BaseParser):
                      | NL
         """
         if self._lookahead_type(0) == tokens.PRINT:
-            node = AST(self._lookahead_token(0))
+            node = self.new_node(self._lookahead_token(0))
             self._match(tokens.PRINT)
             node.add_child(self._expr())
             self._match(tokens.NL)
             return node
 
         elif self._lookahead_type(0) == tokens.RETURN:
-            node = AST(self._lookahead_token(0))
+            node = self.new_node(self._lookahead_token(0))
             self._match(tokens.RETURN)
             node.add_child(self._expr())
             self._match(tokens.NL)
@@ -225,7 +272,7 @@ class Parser(BaseParser):
             return self._call()
 
         elif self._lookahead_type(0) == tokens.IF:
-            node = AST(self._lookahead_token(0))
+            node = self.new_node(self._lookahead_token(0))
             self._match(tokens.IF)
             node.add_child(self._expr())
             node.add_child(self._slist())
@@ -235,7 +282,7 @@ class Parser(BaseParser):
             return node
 
         elif self._lookahead_type(0) == tokens.WHILE:
-            node = AST(self._lookahead_token(0))
+            node = self.new_node(self._lookahead_token(0))
             self._match(tokens.WHILE)
             node.add_child(self._expr())
             node.add_child(self._slist())
@@ -244,61 +291,40 @@ class Parser(BaseParser):
         else:
             return self._assign()
 
-    def _expr(self):
+    def _expr(self, min_power=1):
         """Expression rule.
 
-        expr -> add_expr (('<' | '==') add_expr)?
-        """
-        left_node = self._add_expr()
+        expr -> atom (binary_operator atom)*
 
-        if self._lookahead_type(0) in (tokens.LT, tokens.EQ):
-            node = AST(self._lookahead_token(0))
-            node.add_child(left_node)
-            self._match(self._lookahead_type(0))
-            node.add_child(self._add_expr())
-            left_node = node
-
-        return left_node
-
-    def _add_expr(self):
-        """Add expression rule.
-
-        add_expr -> mult_expr (('+' | '-') mult_expr)*
+        Precedence climbing over BINDING_POWER: operators binding at
+        least as tight as min_power are folded into the left operand in
+        one loop, their right operand is an expression of operators
+        binding tighter.
         """
-        left_node = self._mult_expr()
+        left_node = self._atom()
+
+        while True:
+            token_type = self._lookahead_type(0)
+            power = BINDING_POWER.get(token_type)
+            if power is None or power < min_power:
+                return left_node
 
-        while self._lookahead_type(0) in (tokens.ADD, tokens.SUB):
-            node = AST(self._lookahead_token(0))
+            node = self.new_node(self._lookahead_token(0))
             node.add_child(left_node)
-            self._match(self._lookahead_type(0))
-            node.add_child(self._mult_expr())
+            self._consume()
+            node.add_child(self._expr(power + 1))
             left_node = node
 
-        return left_node
-
-    def _mult_expr(self):
-        """Multiply expression rule.
-
-        mult_expr -> atom ('*' atom)*
-        """
-        result_node = self._atom()
-
-        while self._lookahead_type(0) == tokens.MUL:
-            node = AST(self._lookahead_token(0))
-            node.add_child(result_node)
-            self._match(tokens.MUL)
-            node.add_child(self._atom())
-            result_node = node
-
-        return result_node
+            if token_type in NON_ASSOCIATIVE:
+                min_power = power + 1
 
     def _assign(self):
         """Assign rule.
 
         assign -> ID '=' expr
         """
-        node = AST(tokens.ASSIGN)
-        node.add_child(AST(self._lookahead_token(0)))
+        node = self.new_node(tokens.ASSIGN)
+        node.add_child(self.new_node(self._lookahead_token(0)))
 
         variable_symbol = VariableSymbol(self._lookahead_token(0).text)
         variable_symbol.scope = self.current_scope
@@ -315,9 +341,9 @@ class Parser(BaseParser):
 
         call -> ID '(' (expr (',' expr)*)? ')'
         """
-        node = AST(tokens.CALL)
+        node = self.new_node(tokens.CALL)
         node.scope = self.current_scope
-        node.add_child(AST(self._lookahead_token(0)))
+        node.add_child(self.new_node(self._lookahead_token(0)))
 
         self._match(tokens.ID)
         self._match(tokens.LPAREN)
@@ -337,31 +363,33 @@ class Parser(BaseParser):
 
         atom -> ID | INT | STRING | call | '(' expr ')'
         """
-        if (self._lookahead_type(0) == tokens.ID and
-              self._lookahead_type(1) == tokens.LPAREN
-              ):
-            return self._call()
-
-        elif self._lookahead_type(0) == tokens.ID:
-            node = AST(self._lookahead_token(0))
-            self._match(tokens.ID)
+        token_type = self._lookahead_type(0)
+        if token_type == tokens.ID:
+            if self._lookahead_type(1) == tokens.LPAREN:
+                return self._call()
+            node = self.new_node(self._lookahead_token(0))
+            self._consume()
             return node
 
-        elif self._lookahead_type(0) == tokens.INT:
-            node = AST(self._lookahead_token(0))
-            self._match(tokens.INT)
+        elif token_type == tokens.INT:
+            node = self.new_node(self._lookahead_token(0))
+            self._consume()
             return node
 
-        elif self._lookahead_type(0) == tokens.STRING:
+        elif token_type == tokens.STRING:
             # strip single quote around the string
             token = self._lookahead_token(0)
             token.text = token.text.strip("'")
-            node = AST(token)
-            self._match(tokens.STRING)
+            node = self.new_node(token)
+            self._consume()
             return node
 
-        elif self._lookahead_type(0) == tokens.LPAREN:
-            self._match(tokens.LPAREN)
+        elif token_type == tokens.LPAREN:
+            self._consume()
             node = self._expr()
             self._match(tokens.RPAREN)
             return node
+
+
+class TokenStreamParser(TokenStreamMixin, Parser):
+    """TinyPie Parser over the output of Lexer.tokenize()"""
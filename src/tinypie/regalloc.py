@@ -0,0 +1,264 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie.compiler import BRANCHES, def_use
+
+
+class BasicBlock(object):
+
+    def __init__(self, start, end):
+        # instruction positions [start, end)
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.uses = set()
+        self.defs = set()
+        self.live_in = set()
+        self.live_out = set()
+
+
+class Interval(object):
+    """Live range of a virtual register over instruction positions."""
+
+    def __init__(self, register, start, end):
+        self.register = register
+        self.start = start
+        self.end = end
+        # physical register
+        self.physical = None
+        # call arguments that need consecutive registers
+        self.group = None
+        # preferred physical register source (move coalescing)
+        self.hint = None
+
+    def __repr__(self):
+        return '<Interval %r [%d, %d] -> %s>' % (
+            self.register, self.start, self.end, self.physical)
+
+
+def build_blocks(instructions):
+    """Split instructions into basic blocks and connect them."""
+    leaders = set([0])
+    labels = {}
+    for index, instruction in enumerate(instructions):
+        name = instruction[0]
+        if name == 'label':
+            leaders.add(index)
+            labels[instruction[1]] = index
+        elif name in BRANCHES or name in ('ret', 'halt'):
+            leaders.add(index + 1)
+
+    starts = sorted(leader for leader in leaders
+                    if leader < len(instructions))
+    blocks = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] if index + 1 < len(starts) else len(
+            instructions)
+        blocks.append(BasicBlock(start, end))
+
+    block_at = dict((block.start, block) for block in blocks)
+    for index, block in enumerate(blocks):
+        last = instructions[block.end - 1]
+        name = last[0]
+        if name in BRANCHES:
+            block.successors.append(block_at[labels[last[-1]]])
+        if name not in ('br', 'ret', 'halt') and index + 1 < len(blocks):
+            block.successors.append(blocks[index + 1])
+
+    return blocks
+
+
+def _allocatable(register):
+    # r0 is the return value register and is never allocated
+    return register.fixed != 0
+
+
+def compute_liveness(instructions, blocks):
+    """Fill live_in/live_out sets of blocks."""
+    for block in blocks:
+        for index in range(block.start, block.end):
+            defs, uses = def_use(instructions[index])
+            for register in uses:
+                if _allocatable(register) and register not in block.defs:
+                    block.uses.add(register)
+            for register in defs:
+                if _allocatable(register):
+                    block.defs.add(register)
+
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            live_out = set()
+            for successor in block.successors:
+                live_out |= successor.live_in
+            live_in = block.uses | (live_out - block.defs)
+            if live_in != block.live_in or live_out != block.live_out:
+                block.live_in, block.live_out = live_in, live_out
+                changed = True
+
+
+def build_intervals(code, blocks):
+    """Return register -> Interval covering every position it is live."""
+    intervals = {}
+
+    def extend(register, position):
+        interval = intervals.get(register)
+        if interval is None:
+            intervals[register] = Interval(register, position, position)
+        else:
+            interval.start = min(interval.start, position)
+            interval.end = max(interval.end, position)
+
+    # arguments are live on entry
+    for register in code.params:
+        extend(register, -1)
+
+    for block in blocks:
+        for register in block.live_in:
+            extend(register, block.start)
+        for register in block.live_out:
+            extend(register, block.end - 1)
+        for index in range(block.start, block.end):
+            defs, uses = def_use(code.instructions[index])
+            for register in defs + uses:
+                if _allocatable(register):
+                    extend(register, index)
+
+    return intervals
+
+
+class LinearScanAllocator(object):
+    """Liveness based linear-scan register allocator.
+
+    Computes live intervals of virtual registers over the linear
+    instruction order and assigns each interval the lowest physical
+    register that is free for its whole length, so registers of dead
+    temporaries are reused and 'locals' of the function stays small.
+
+    A 'move' whose source dies at the move is coalesced: the
+    destination gets the source register and the move turns into a
+    no-op that the compiler drops. Call arguments get consecutive
+    registers as the VM calling convention requires.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+
+    def allocate(self, code):
+        """Return (virtual register -> physical register, locals)."""
+        instructions = code.instructions
+        blocks = build_blocks(instructions)
+        compute_liveness(instructions, blocks)
+        intervals = build_intervals(code, blocks)
+
+        self._add_constraints(code, intervals)
+
+        mapping = {code.ret: 0}
+        for register in code.registers:
+            if register.fixed is not None:
+                mapping[register] = register.fixed
+
+        self._scan(code, intervals, mapping)
+
+        highest = max(mapping.values() + [code.args])
+        return mapping, highest - code.args
+
+    def _add_constraints(self, code, intervals):
+        for index, instruction in enumerate(code.instructions):
+            name = instruction[0]
+            if name == 'call' and instruction[2]:
+                group = [intervals[register] for register in instruction[2]]
+                # reserve the whole block from the first argument on
+                start = min(interval.start for interval in group)
+                for interval in group:
+                    interval.start = start
+                    interval.group = group
+
+            elif name == 'move':
+                dest, source = instruction[1], instruction[2]
+                if dest.fixed is not None or source.fixed == 0:
+                    continue
+                dest_interval = intervals.get(dest)
+                source_interval = intervals.get(source)
+                if (dest_interval is not None and
+                    source_interval is not None and
+                    dest_interval.start == index and
+                    source_interval.end == index):
+                    dest_interval.hint = source_interval
+
+    def _scan(self, code, intervals, mapping):
+        unhandled = sorted(
+            intervals.values(),
+            key=lambda interval: (interval.start, interval.register.number))
+
+        active = []
+        # physical registers currently taken
+        taken = set()
+
+        for interval in unhandled:
+            # expire intervals that end before this one starts; a register
+            # last read by an instruction can be written by the same one
+            for other in active[:]:
+                if other.end <= interval.start:
+                    active.remove(other)
+                    taken.discard(other.physical)
+
+            if interval.physical is not None:
+                # allocated together with its call argument group
+                continue
+
+            if interval.register.fixed is not None:
+                interval.physical = interval.register.fixed
+
+            elif interval.group is not None:
+                base = self._find_block(taken, len(interval.group))
+                for offset, member in enumerate(interval.group):
+                    member.physical = base + offset
+                    mapping[member.register] = member.physical
+                    active.append(member)
+                    taken.add(member.physical)
+                continue
+
+            elif (interval.hint is not None and
+                  interval.hint.physical not in taken):
+                interval.physical = interval.hint.physical
+                self.coalesced += 1
+
+            else:
+                interval.physical = self._find_block(taken, 1)
+
+            mapping[interval.register] = interval.physical
+            active.append(interval)
+            taken.add(interval.physical)
+
+    @staticmethod
+    def _find_block(taken, size):
+        base = 1
+        while any(base + offset in taken for offset in range(size)):
+            base += 1
+        return base
@@ -0,0 +1,116 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+
+
+class SlotResolver(object):
+    """Resolves variable references to memory space slots.
+
+    Runs after parsing and annotates every ID and ASSIGN node with
+    two attributes:
+
+    slot        - index into the FunctionSpace of the enclosing
+                  function or None if the name is not local to it
+    global_slot - index into the global MemorySpace
+
+    A variable assigned inside a function lives in the function space
+    unless a global variable with the same name exists at the time of
+    the assignment. That is only known at run time, so local names
+    carry both addresses and the interpreter picks one when the node
+    is executed. Either way a variable access is a list index
+    operation instead of a dictionary lookup.
+
+    Function slots are stored in FunctionSymbol.slots: formal
+    arguments come first and in order, followed by the variables
+    defined in the function's LocalScope.
+    """
+
+    def __init__(self, global_slots):
+        # name -> global slot, shared between runs of the same interpreter
+        self.global_slots = global_slots
+
+    def resolve(self, tree):
+        self._visit(tree, None)
+
+    def resolve_function(self, func_symbol):
+        slots = {}
+        for arg in func_symbol.formal_args:
+            slots.setdefault(arg.name, len(slots))
+
+        names = set()
+        if func_symbol.local_scope is not None:
+            names.update(func_symbol.local_scope.symbols)
+        if func_symbol.block_ast is not None:
+            _collect_assigned_names(func_symbol.block_ast, names)
+
+        for name in sorted(names):
+            slots.setdefault(name, len(slots))
+
+        func_symbol.slots = slots
+        if func_symbol.block_ast is not None:
+            self._visit(func_symbol.block_ast, slots)
+
+    def _visit(self, node, local_slots):
+        if node.type == tokens.FUNC_DEF:
+            self.resolve_function(node.symbol)
+            return
+
+        if node.type == tokens.ID:
+            self._annotate(node, node.text, local_slots)
+
+        elif node.type == tokens.ASSIGN:
+            self._annotate(node, node.children[0].text, local_slots)
+            self._visit(node.children[1], local_slots)
+            return
+
+        elif node.type == tokens.CALL:
+            # the first child is the function name, not a variable
+            for child in node.children[1:]:
+                self._visit(child, local_slots)
+            return
+
+        for child in node.children:
+            self._visit(child, local_slots)
+
+    def _annotate(self, node, name, local_slots):
+        node.slot = local_slots.get(name) if local_slots else None
+        node.global_slot = self._get_global_slot(name)
+
+    def _get_global_slot(self, name):
+        slot = self.global_slots.get(name)
+        if slot is None:
+            slot = self.global_slots[name] = len(self.global_slots)
+        return slot
+
+
+def _collect_assigned_names(node, names):
+    if node.type == tokens.ASSIGN:
+        names.add(node.children[0].text)
+
+    for child in node.children:
+        _collect_assigned_names(child, names)
@@ -0,0 +1,1423 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.compiler import CompilerException, FunctionCode, RESERVED_NAMES
+from tinypie.optimizer import MAX_STRING_LENGTH, assigned_names
+from tinypie.symbol import FunctionSymbol
+from tinypie.typeinfer import is_int
+
+BINARY_OPS = ('add', 'sub', 'mul', 'lt', 'eq',
+              'iadd', 'isub', 'imul', 'ilt', 'ieq')
+# 'add' concatenates strings, the operand order matters
+COMMUTATIVE_OPS = ('mul', 'eq', 'iadd', 'imul', 'ieq')
+TERMINATORS = ('br', 'cbr', 'ret', 'halt')
+# Instructions kept even if their value is never used
+SIDE_EFFECT_OPS = ('gstore', 'print', 'call') + TERMINATORS
+# Generic arithmetic raises TypeError on bad operands, removing it
+# would hide the error
+MAY_FAIL_OPS = ('add', 'sub', 'mul')
+# Instructions that compute no value
+VOID_OPS = ('gstore', 'print') + TERMINATORS
+
+# Constant propagation lattice: no value seen yet / more than one value
+UNKNOWN = object()
+VARYING = object()
+
+
+class SSAException(Exception):
+    pass
+
+
+class Instruction(object):
+    """SSA instruction and the value it defines.
+
+    'args' are the instructions whose values are read and 'uses' the
+    instructions that read this one, one entry per operand: together
+    they are the use-def and def-use chains. 'data' is the immediate
+    operand: constant, parameter index, global or function name.
+    """
+
+    __slots__ = ('number', 'op', 'args', 'data', 'block', 'uses')
+
+    def __init__(self, number, op, args=(), data=None):
+        self.number = number
+        self.op = op
+        self.args = list(args)
+        self.data = data
+        self.block = None
+        self.uses = []
+        for arg in self.args:
+            arg.uses.append(self)
+
+    def __repr__(self):
+        return 'v%d' % self.number
+
+    def add_arg(self, value):
+        self.args.append(value)
+        value.uses.append(self)
+
+    def drop_args(self):
+        for arg in self.args:
+            arg.uses.remove(self)
+        self.args = []
+
+    def replace_uses(self, value):
+        """Make every instruction reading this value read 'value'."""
+        for use in self.uses:
+            use.args[use.args.index(self)] = value
+            value.uses.append(use)
+        self.uses = []
+
+
+class Block(object):
+    """Basic block: phi instructions, then a straight instruction list
+    that ends with exactly one terminator (br, cbr, ret or halt).
+
+    Phi arguments are ordered like 'predecessors'. The successors of
+    'cbr' are (taken if true, taken if false).
+    """
+
+    def __init__(self, number):
+        self.number = number
+        self.phis = []
+        self.instructions = []
+        self.predecessors = []
+        self.successors = []
+
+    def __repr__(self):
+        return 'b%d' % self.number
+
+    @property
+    def terminator(self):
+        if self.instructions and self.instructions[-1].op in TERMINATORS:
+            return self.instructions[-1]
+        return None
+
+    def append(self, instruction):
+        instruction.block = self
+        self.instructions.append(instruction)
+
+    def add_phi(self, phi):
+        phi.block = self
+        self.phis.append(phi)
+
+    def remove(self, instruction):
+        instruction.drop_args()
+        if instruction.op == 'phi':
+            self.phis.remove(instruction)
+        else:
+            self.instructions.remove(instruction)
+        instruction.block = None
+
+
+class Function(object):
+    """Control flow graph of SSA instructions of one TinyPie function."""
+
+    def __init__(self, name, args=0):
+        self.name = name
+        self.args = args
+        self.blocks = []
+        self.block_count = 0
+        self.value_count = 0
+        self.entry = self.new_block()
+
+    def __str__(self):
+        return format_function(self)
+
+    def new_block(self):
+        block = Block(self.block_count)
+        self.block_count += 1
+        self.blocks.append(block)
+        return block
+
+    def new_value(self, op, args=(), data=None):
+        self.value_count += 1
+        return Instruction(self.value_count, op, args, data)
+
+
+def link(pred, succ):
+    pred.successors.append(succ)
+    succ.predecessors.append(pred)
+
+
+def remove_edge(pred, succ):
+    """Remove control flow edge and the phi arguments it carries."""
+    index = succ.predecessors.index(pred)
+    del succ.predecessors[index]
+    for phi in succ.phis:
+        arg = phi.args.pop(index)
+        arg.uses.remove(phi)
+    pred.successors.remove(succ)
+
+
+def reverse_postorder(function):
+    """Return blocks reachable from the entry in reverse postorder."""
+    order = []
+    visited = set([function.entry])
+    # successors are visited last to first so that the first one
+    # comes first in the order: loop bodies before loop exits
+    stack = [(function.entry, reversed(function.entry.successors))]
+    while stack:
+        block, successors = stack[-1]
+        for succ in successors:
+            if succ not in visited:
+                visited.add(succ)
+                stack.append((succ, reversed(succ.successors)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def dominators(function):
+    """Return block -> immediate dominator, None for the entry.
+
+    Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm".
+    """
+    order = reverse_postorder(function)
+    index = dict((block, position) for position, block in enumerate(order))
+    idom = {function.entry: function.entry}
+
+    def intersect(first, second):
+        while first is not second:
+            while index[first] > index[second]:
+                first = idom[first]
+            while index[second] > index[first]:
+                second = idom[second]
+        return first
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new_idom = None
+            for pred in block.predecessors:
+                if pred not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = pred
+                else:
+                    new_idom = intersect(pred, new_idom)
+            if idom.get(block) is not new_idom:
+                idom[block] = new_idom
+                changed = True
+
+    idom[function.entry] = None
+    return idom
+
+
+def remove_unreachable(function):
+    """Delete blocks not reachable from the entry, return their number."""
+    reachable = set(reverse_postorder(function))
+    dead = [block for block in function.blocks if block not in reachable]
+    for block in dead:
+        for succ in list(block.successors):
+            remove_edge(block, succ)
+    for block in dead:
+        for instruction in block.phis + block.instructions:
+            instruction.drop_args()
+    function.blocks = [block for block in function.blocks
+                       if block in reachable]
+    return len(dead)
+
+
+def simplify_phis(function):
+    """Remove phis whose arguments are all the same value or the phi
+    itself, return the number removed."""
+    work = [phi for block in function.blocks for phi in block.phis]
+    removed = 0
+    while work:
+        phi = work.pop()
+        if phi.block is None:
+            continue
+        values = set(arg for arg in phi.args if arg is not phi)
+        if len(values) != 1:
+            continue
+        value = values.pop()
+        work.extend(use for use in phi.uses if use.op == 'phi')
+        phi.block.remove(phi)
+        phi.replace_uses(value)
+        removed += 1
+    return removed
+
+
+def liveness(function):
+    """Return (live in, live out): block -> set of values.
+
+    A phi argument is live out of the predecessor it comes from but
+    not live into the phi block. Phis are not live into their block.
+    """
+    upward = {}
+    defined = {}
+    phi_uses = dict((block, set()) for block in function.blocks)
+    for block in function.blocks:
+        defs = set(block.phis)
+        uses = set()
+        for instruction in block.instructions:
+            for arg in instruction.args:
+                if arg not in defs:
+                    uses.add(arg)
+            defs.add(instruction)
+        upward[block] = uses
+        defined[block] = defs
+        for phi in block.phis:
+            for arg, pred in zip(phi.args, block.predecessors):
+                phi_uses[pred].add(arg)
+
+    live_in = dict((block, set()) for block in function.blocks)
+    live_out = dict((block, set()) for block in function.blocks)
+    order = reverse_postorder(function)
+    order.reverse()
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            out = set(phi_uses[block])
+            for succ in block.successors:
+                out |= live_in[succ]
+            live = upward[block] | (out - defined[block])
+            if len(out) != len(live_out[block]) or len(
+                live) != len(live_in[block]):
+                live_out[block] = out
+                live_in[block] = live
+                changed = True
+
+    return live_in, live_out
+
+
+def format_function(function):
+    """Return printable listing of the SSA function."""
+    lines = ['function %s(%d):' % (function.name, function.args)]
+    for block in function.blocks:
+        header = '%r:' % block
+        if block.predecessors:
+            header += ' ; preds %s' % ', '.join(
+                repr(pred) for pred in block.predecessors)
+        lines.append(header)
+        for instruction in block.phis + block.instructions:
+            lines.append('    ' + format_instruction(instruction))
+    return '\n'.join(lines)
+
+
+def format_instruction(instruction):
+    op = instruction.op
+    args = instruction.args
+    data = instruction.data
+
+    if op == 'phi':
+        operands = ', '.join(
+            '[%r, %r]' % (arg, pred)
+            for arg, pred in zip(args, instruction.block.predecessors))
+    elif op == 'const':
+        operands = repr(data)
+    elif op in ('param', 'gload'):
+        operands = str(data)
+    elif op == 'gstore':
+        operands = '%s, %r' % (data, args[0])
+    elif op == 'call':
+        operands = '%s(%s)' % (data, ', '.join(repr(arg) for arg in args))
+    elif op in ('br', 'cbr'):
+        operands = ', '.join(
+            repr(item) for item in args + instruction.block.successors)
+    else:
+        operands = ', '.join(repr(arg) for arg in args)
+
+    text = op + (' ' + operands if operands else '')
+    if op in VOID_OPS:
+        return text
+    return '%r = %s' % (instruction, text)
+
+
+def verify(function):
+    """Check SSA invariants, raise SSAException if one is broken."""
+
+    def error(message, *args):
+        raise SSAException('%s: %s' % (function.name, message % args))
+
+    blocks = set(function.blocks)
+    if function.entry not in blocks or function.entry.predecessors:
+        error('entry block must exist and have no predecessors')
+
+    defined = {}
+    for block in function.blocks:
+        terminator = block.terminator
+        if terminator is None:
+            error('%r does not end with a terminator', block)
+        for instruction in block.instructions[:-1]:
+            if instruction.op in TERMINATORS or instruction.op == 'phi':
+                error('%r: misplaced %s', block, instruction.op)
+        expected = {'br': 1, 'cbr': 2}.get(terminator.op, 0)
+        if len(block.successors) != expected:
+            error('%r: %s needs %d successors', block, terminator.op,
+                  expected)
+        for succ in block.successors:
+            if succ not in blocks or block not in succ.predecessors:
+                error('%r: broken edge to %r', block, succ)
+        for pred in block.predecessors:
+            if pred not in blocks or block not in pred.successors:
+                error('%r: broken edge from %r', block, pred)
+        for position, instruction in enumerate(block.phis +
+                                               block.instructions):
+            if instruction.block is not block:
+                error('%r is not linked to %r', instruction, block)
+            if (instruction.op == 'phi') != (position < len(block.phis)):
+                error('%r: phi must precede other instructions', block)
+            defined[instruction] = (block, position)
+
+    idom = dominators(function)
+    for block in function.blocks:
+        if block not in idom:
+            error('%r is unreachable', block)
+
+    def dominates(first, second):
+        while second is not None and second is not first:
+            second = idom[second]
+        return second is first
+
+    for block in function.blocks:
+        for instruction in block.phis:
+            if len(instruction.args) != len(block.predecessors):
+                error('%r: %d arguments for %d predecessors', instruction,
+                      len(instruction.args), len(block.predecessors))
+        for instruction in block.phis + block.instructions:
+            for index, arg in enumerate(instruction.args):
+                if arg not in defined:
+                    error('%r uses undefined %r', instruction, arg)
+                if arg.uses.count(instruction) != instruction.args.count(
+                    arg):
+                    error('%r: broken def-use chain of %r', instruction, arg)
+                arg_block, arg_position = defined[arg]
+                if instruction.op == 'phi':
+                    use_block = block.predecessors[index]
+                    ok = dominates(arg_block, use_block)
+                elif arg_block is block:
+                    ok = arg_position < defined[instruction][1]
+                else:
+                    ok = dominates(arg_block, block)
+                if not ok:
+                    error('%r does not dominate its use in %r', arg,
+                          instruction)
+            for use in instruction.uses:
+                if instruction not in use.args:
+                    error('%r: stale use %r', instruction, use)
+
+
+class SSABuilder(object):
+    """Builds SSA functions from the AST the Parser produced.
+
+    Variables are bound like in compiler.BytecodeCompiler: formal
+    arguments and names assigned inside a function are SSA values,
+    global variables are read and written with gload and gstore.
+    Top level code becomes the 'main' function.
+
+    The AST is structured, so phis are placed while walking it: an IF
+    joins the variables that differ between its branches and a WHILE
+    header gets a phi for every variable assigned in the loop body.
+    Phis that turn out to merge a single value are removed.
+
+    >>> from tinypie.interpreter import Interpreter
+    >>> from tinypie.compiler import global_indexes
+    >>> from tinypie.ssa import SSABuilder
+    >>>
+    >>> interp = Interpreter()
+    >>> tree = interp.parse('''
+    ... def count(n):
+    ...     i = 0
+    ...     while i < n:
+    ...         i = i + 1
+    ...     .
+    ...     return i
+    ... .
+    ... print count(3)
+    ... ''')
+    >>> builder = SSABuilder(interp.global_scope, global_indexes(tree))
+    >>> for function in builder.build(tree):
+    ...     print function
+    function count(1):
+    b0:
+        v1 = param 0
+        v2 = const 0
+        br b1
+    b1: ; preds b0, b2
+        v4 = phi [v2, b0], [v8, b2]
+        v5 = lt v4, v1
+        cbr v5, b2, b3
+    b2: ; preds b1
+        v7 = const 1
+        v8 = add v4, v7
+        br b1
+    b3: ; preds b1
+        ret v4
+    function main(0):
+    b0:
+        v1 = const 3
+        v2 = call count(v1)
+        print v2
+        halt
+
+    """
+
+    def __init__(self, global_scope, globals):
+        self.global_scope = global_scope
+        # name -> global memory index
+        self.globals = globals
+        self.function = None
+        # block new instructions go to, None after ret and halt
+        self.block = None
+        # local variable name -> current SSA value
+        self.variables = None
+        # shared value of variables read before assignment
+        self.undefined = None
+
+    def build(self, tree):
+        """Return list of Function for the AST, 'main' last."""
+        functions = []
+        for node in tree.children:
+            if node.type != tokens.FUNC_DEF:
+                continue
+            func_symbol = node.symbol
+            # redefinition: the last definition wins
+            if self.global_scope.resolve(func_symbol.name) is func_symbol:
+                functions.append(self._function(func_symbol))
+
+        main = self._start('main', 0)
+        for node in tree.children:
+            if self.block is None:
+                # unreachable after a top level return
+                break
+            if node.type != tokens.FUNC_DEF:
+                self._statement(node)
+        if self.block is not None:
+            self._emit('halt')
+        functions.append(self._finish(main))
+
+        return functions
+
+    # Helper methods
+    def _start(self, name, args):
+        function = self.function = Function(name, args)
+        self.block = function.entry
+        self.variables = {}
+        self.undefined = None
+        return function
+
+    def _finish(self, function):
+        remove_unreachable(function)
+        simplify_phis(function)
+        return function
+
+    def _variable(self, name):
+        return self._defined(self.variables[name])
+
+    def _defined(self, value):
+        if value is None:
+            # read before assignment, undef defines no register
+            if self.undefined is None:
+                self.undefined = self.function.new_value('undef')
+                self.undefined.block = self.function.entry
+                self.function.entry.instructions.insert(0, self.undefined)
+            value = self.undefined
+        return value
+
+    def _emit(self, op, args=(), data=None):
+        instruction = self.function.new_value(op, args, data)
+        self.block.append(instruction)
+        return instruction
+
+    def _jump(self, target):
+        self._emit('br')
+        link(self.block, target)
+
+    def _branch(self, cond, if_true, if_false):
+        self._emit('cbr', [cond])
+        link(self.block, if_true)
+        link(self.block, if_false)
+
+    def _function(self, func_symbol):
+        if func_symbol.name in RESERVED_NAMES:
+            raise CompilerException(
+                "function name '%s' is reserved" % func_symbol.name)
+
+        function = self._start(
+            func_symbol.name, len(func_symbol.formal_args))
+        for index, arg in enumerate(func_symbol.formal_args):
+            self.variables[arg.name] = self._emit('param', data=index)
+
+        for name in assigned_names(func_symbol.block_ast):
+            if name not in self.variables and name not in self.globals:
+                # no value until the first assignment
+                self.variables[name] = None
+
+        self._statement(func_symbol.block_ast)
+        if self.block is not None:
+            self._emit('ret')
+
+        return self._finish(function)
+
+    def _statement(self, node):
+        if node.type == tokens.BLOCK:
+            for child in node.children:
+                if self.block is None:
+                    # unreachable after return
+                    break
+                self._statement(child)
+
+        elif node.type == tokens.ASSIGN:
+            name = node.children[0].text
+            value = self._expr(node.children[1])
+            if name in self.variables:
+                self.variables[name] = value
+            else:
+                self._emit('gstore', [value], name)
+
+        elif node.type == tokens.PRINT:
+            self._emit('print', [self._expr(node.children[0])])
+
+        elif node.type == tokens.CALL:
+            self._call(node)
+
+        elif node.type == tokens.RETURN:
+            value = self._expr(node.children[0])
+            if self.function.name == 'main':
+                self._emit('halt')
+            else:
+                self._emit('ret', [value])
+            self.block = None
+
+        elif node.type == tokens.IF:
+            self._ifstat(node)
+
+        elif node.type == tokens.WHILE:
+            self._whileop(node)
+
+    def _ifstat(self, node):
+        cond = self._predicate(node.children[0])
+        branches = [(self.function.new_block(), node.children[1]),
+                    (self.function.new_block(),
+                     node.children[2] if len(node.children) == 3 else None)]
+        self._branch(cond, branches[0][0], branches[1][0])
+
+        variables = self.variables
+        ends = []
+        for block, body in branches:
+            self.block = block
+            self.variables = dict(variables)
+            if body is not None:
+                self._statement(body)
+            if self.block is not None:
+                ends.append((self.block, self.variables))
+
+        if not ends:
+            self.block = None
+            return
+
+        join = self.function.new_block()
+        for block, _ in ends:
+            self.block = block
+            self._jump(join)
+
+        self.block = join
+        self.variables = ends[0][1]
+        for name in self.variables:
+            values = [end_variables[name] for _, end_variables in ends]
+            if any(value is not values[0] for value in values):
+                phi = self.function.new_value(
+                    'phi', [self._defined(value) for value in values])
+                join.add_phi(phi)
+                self.variables[name] = phi
+
+    def _whileop(self, node):
+        header = self.function.new_block()
+        self._jump(header)
+
+        phis = []
+        for name in sorted(assigned_names(node.children[1])):
+            if name in self.variables:
+                phi = self.function.new_value('phi', [self._variable(name)])
+                header.add_phi(phi)
+                self.variables[name] = phi
+                phis.append((name, phi))
+
+        self.block = header
+        cond = self._predicate(node.children[0])
+        body = self.function.new_block()
+        end = self.function.new_block()
+        self._branch(cond, body, end)
+
+        variables = self.variables
+        self.block = body
+        self.variables = dict(variables)
+        self._statement(node.children[1])
+        if self.block is not None:
+            self._jump(header)
+            for name, phi in phis:
+                phi.add_arg(self._variable(name))
+
+        self.block = end
+        self.variables = variables
+
+    def _predicate(self, node):
+        if (node.type in (tokens.LT, tokens.EQ) and
+            is_int(node.children[0]) and is_int(node.children[1])):
+            left = self._expr(node.children[0])
+            right = self._expr(node.children[1])
+            return self._emit('i' + node.type.lower(), [left, right])
+
+        return self._expr(node)
+
+    def _expr(self, node):
+        node_type = node.type
+
+        if node_type == tokens.ID:
+            name = node.text
+            if name in self.variables:
+                return self._variable(name)
+            if name not in self.globals:
+                raise CompilerException("name '%s' is not defined" % name)
+            return self._emit('gload', data=name)
+
+        if node_type == tokens.INT:
+            return self._emit('const', data=int(node.text))
+
+        if node_type == tokens.STRING:
+            return self._emit('const', data=node.text)
+
+        if node_type == tokens.CALL:
+            return self._call(node)
+
+        if node_type in (tokens.ADD, tokens.SUB, tokens.MUL,
+                         tokens.LT, tokens.EQ):
+            left = self._expr(node.children[0])
+            right = self._expr(node.children[1])
+            op = node_type.lower()
+            if (node_type in (tokens.ADD, tokens.SUB, tokens.MUL) and
+                is_int(node.children[0]) and is_int(node.children[1])):
+                op = 'i' + op
+            return self._emit(op, [left, right])
+
+        raise CompilerException('Unexpected node %s' % node)
+
+    def _call(self, node):
+        func_name = node.children[0].text
+        func_symbol = self.global_scope.resolve(func_name)
+        if not isinstance(func_symbol, FunctionSymbol):
+            raise CompilerException(
+                "function '%s' is not defined" % func_name)
+
+        nargs = len(func_symbol.formal_args)
+        if len(node.children) - 1 < nargs:
+            raise CompilerException(
+                '%s() takes %d arguments' % (func_name, nargs))
+
+        args = [self._expr(child) for child in node.children[1:nargs + 1]]
+        return self._emit('call', args, func_name)
+
+
+def fold(op, left, right):
+    """Return result of operation on constants, VARYING if it has to
+    be left to run time."""
+    kind = type(left)
+    if kind is not type(right):
+        return VARYING
+
+    if op in ('add', 'iadd'):
+        if kind is str and len(left) + len(right) > MAX_STRING_LENGTH:
+            return VARYING
+        return left + right
+
+    if op in ('lt', 'ilt'):
+        return int(left < right)
+
+    if op in ('eq', 'ieq'):
+        return int(left == right)
+
+    if kind is not int:
+        return VARYING
+
+    if op in ('sub', 'isub'):
+        return left - right
+
+    return left * right
+
+
+def _same(first, second):
+    return first is second or (type(first) is type(second) and
+                               first == second)
+
+
+class ConstantPropagation(object):
+    """Sparse conditional constant propagation.
+
+    Wegman and Zadeck: values start unknown and are only evaluated in
+    blocks found executable, so a constant that decides a branch also
+    keeps the code it skips from spoiling the values merged after it.
+    Constant values are replaced with 'const' instructions, branches
+    on constants become jumps and blocks never executed are removed.
+    """
+
+    name = 'constant propagation'
+
+    def __init__(self):
+        self.folded = 0
+        self.branches = 0
+
+    def report(self):
+        return '%s: %d values folded, %d branches resolved' % (
+            self.name, self.folded, self.branches)
+
+    def run(self, function):
+        self.values = {}
+        self.edges = set()
+        self.executable = set()
+        self.block_work = [function.entry]
+        self.work = []
+
+        while self.block_work or self.work:
+            while self.block_work:
+                block = self.block_work.pop()
+                if block in self.executable:
+                    # new edge into the block: only phis can change
+                    for phi in block.phis:
+                        self._visit(phi)
+                    continue
+                self.executable.add(block)
+                for instruction in block.phis + block.instructions:
+                    self._visit(instruction)
+
+            while self.work:
+                instruction = self.work.pop()
+                if instruction.block in self.executable:
+                    self._visit(instruction)
+
+        self._rewrite(function)
+
+    # Helper methods
+    def _value(self, instruction):
+        return self.values.get(instruction, UNKNOWN)
+
+    def _mark_edge(self, pred, succ):
+        if (pred, succ) not in self.edges:
+            self.edges.add((pred, succ))
+            self.block_work.append(succ)
+
+    def _visit(self, instruction):
+        op = instruction.op
+
+        if op == 'cbr':
+            block = instruction.block
+            cond = self._value(instruction.args[0])
+            if cond is UNKNOWN:
+                return
+            if cond is VARYING:
+                for succ in block.successors:
+                    self._mark_edge(block, succ)
+            else:
+                self._mark_edge(block, block.successors[not cond])
+            return
+
+        if op == 'br':
+            self._mark_edge(instruction.block, instruction.block.successors[0])
+            return
+
+        if op in VOID_OPS:
+            return
+
+        if op == 'const':
+            value = instruction.data
+
+        elif op == 'phi':
+            value = UNKNOWN
+            block = instruction.block
+            for arg, pred in zip(instruction.args, block.predecessors):
+                if (pred, block) not in self.edges:
+                    continue
+                arg_value = self._value(arg)
+                if arg_value is UNKNOWN:
+                    continue
+                if value is UNKNOWN:
+                    value = arg_value
+                elif not _same(value, arg_value):
+                    value = VARYING
+                    break
+
+        elif op in BINARY_OPS:
+            left, right = [self._value(arg) for arg in instruction.args]
+            if left is UNKNOWN or right is UNKNOWN:
+                value = UNKNOWN
+            elif left is VARYING or right is VARYING:
+                value = VARYING
+            else:
+                value = fold(op, left, right)
+
+        else:
+            # param, undef, gload and call
+            value = VARYING
+
+        if not _same(value, self._value(instruction)):
+            self.values[instruction] = value
+            self.work.extend(instruction.uses)
+
+    def _rewrite(self, function):
+        for block in function.blocks:
+            if block not in self.executable:
+                continue
+
+            phis = []
+            instructions = []
+            # (type, value) -> const instruction of the block
+            constants = {}
+            for instruction in block.phis + block.instructions:
+                value = self._value(instruction)
+                if (instruction.op == 'const' or value is UNKNOWN or
+                    value is VARYING):
+                    if instruction.op == 'phi':
+                        phis.append(instruction)
+                    else:
+                        instructions.append(instruction)
+                    continue
+                const = constants.get((type(value), value))
+                if const is None:
+                    const = function.new_value('const', data=value)
+                    const.block = block
+                    instructions.append(const)
+                    constants[type(value), value] = const
+                instruction.replace_uses(const)
+                instruction.drop_args()
+                instruction.block = None
+                self.folded += 1
+            block.phis = phis
+            block.instructions = instructions
+
+            terminator = block.terminator
+            if terminator.op == 'cbr':
+                live = [succ for succ in block.successors
+                        if (block, succ) in self.edges]
+                if len(live) == 1:
+                    for succ in list(block.successors):
+                        if succ is not live[0]:
+                            remove_edge(block, succ)
+                    terminator.op = 'br'
+                    terminator.drop_args()
+                    self.branches += 1
+
+        remove_unreachable(function)
+        simplify_phis(function)
+
+
+class GlobalValueNumbering(object):
+    """Removes computations of values already available.
+
+    Walks the dominator tree with a scoped table of pure expressions:
+    an expression dominated by an identical one reuses its value.
+    Within a block, global loads reuse the last value loaded or stored
+    until a call may have changed the global.
+    """
+
+    name = 'global value numbering'
+
+    def __init__(self):
+        self.removed = 0
+
+    def report(self):
+        return '%s: %d redundant values removed' % (self.name, self.removed)
+
+    def run(self, function):
+        idom = dominators(function)
+        children = dict((block, []) for block in idom)
+        for block in reverse_postorder(function):
+            if idom[block] is not None:
+                children[idom[block]].append(block)
+
+        table = {}
+        undo = []
+        stack = [function.entry]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, int):
+                # leaving a dominator subtree
+                while len(undo) > item:
+                    del table[undo.pop()]
+                continue
+            stack.append(len(undo))
+            self._number(item, table, undo)
+            stack.extend(reversed(children[item]))
+
+        simplify_phis(function)
+
+    # Helper methods
+    def _key(self, instruction):
+        op = instruction.op
+        if op == 'const':
+            return op, type(instruction.data), instruction.data
+        if op in BINARY_OPS:
+            numbers = [arg.number for arg in instruction.args]
+            if op in COMMUTATIVE_OPS:
+                numbers.sort()
+            return (op,) + tuple(numbers)
+        if op == 'phi':
+            return (op, instruction.block.number) + tuple(
+                arg.number for arg in instruction.args)
+        return None
+
+    def _number(self, block, table, undo):
+        # global name -> value it holds
+        loads = {}
+        redundant = set()
+        for instruction in block.phis + block.instructions:
+            op = instruction.op
+            existing = None
+
+            if op == 'gload':
+                existing = loads.get(instruction.data)
+                if existing is None:
+                    loads[instruction.data] = instruction
+            elif op == 'gstore':
+                loads[instruction.data] = instruction.args[0]
+            elif op == 'call':
+                loads.clear()
+            else:
+                key = self._key(instruction)
+                if key is not None:
+                    existing = table.get(key)
+                    if existing is None:
+                        table[key] = instruction
+                        undo.append(key)
+
+            if existing is not None:
+                instruction.replace_uses(existing)
+                instruction.drop_args()
+                instruction.block = None
+                redundant.add(instruction)
+
+        if redundant:
+            block.phis = [phi for phi in block.phis if phi not in redundant]
+            block.instructions = [instruction
+                                  for instruction in block.instructions
+                                  if instruction not in redundant]
+            self.removed += len(redundant)
+
+
+class DeadCodeElimination(object):
+    """Removes instructions whose values are never used and simplifies
+    the control flow graph.
+
+    Instructions with side effects are live, so are the values they
+    use, transitively. Blocks that only jump are bypassed and a block
+    is merged into its only predecessor if it is its only successor.
+    """
+
+    name = 'dead code elimination'
+
+    def __init__(self):
+        self.removed = 0
+        self.blocks = 0
+
+    def report(self):
+        return '%s: %d instructions, %d blocks removed' % (
+            self.name, self.removed, self.blocks)
+
+    def run(self, function):
+        self.blocks += remove_unreachable(function)
+
+        live = set()
+        work = [instruction
+                for block in function.blocks
+                for instruction in block.instructions
+                if instruction.op in SIDE_EFFECT_OPS or
+                instruction.op in MAY_FAIL_OPS]
+        while work:
+            instruction = work.pop()
+            if instruction not in live:
+                live.add(instruction)
+                work.extend(instruction.args)
+
+        for block in function.blocks:
+            dead = [instruction
+                    for instruction in block.phis + block.instructions
+                    if instruction not in live]
+            for instruction in dead:
+                instruction.drop_args()
+                instruction.block = None
+            block.phis = [phi for phi in block.phis if phi in live]
+            block.instructions = [instruction
+                                  for instruction in block.instructions
+                                  if instruction in live]
+            self.removed += len(dead)
+
+        self._simplify_cfg(function)
+
+    # Helper methods
+    def _simplify_cfg(self, function):
+        self.deleted = set()
+        changed = True
+        while changed:
+            changed = False
+            for block in function.blocks:
+                if block in self.deleted:
+                    continue
+                if self._bypass(function, block) or self._merge(
+                    function, block):
+                    changed = True
+        function.blocks = [block for block in function.blocks
+                           if block not in self.deleted]
+        self.blocks += len(self.deleted)
+
+    def _bypass(self, function, block):
+        """Route the predecessors of a block that only jumps past it."""
+        if (block is function.entry or block.phis or
+            len(block.instructions) != 1 or
+            block.instructions[0].op != 'br'):
+            return False
+
+        target = block.successors[0]
+        if target is block or target.phis:
+            return False
+
+        for pred in block.predecessors:
+            index = pred.successors.index(block)
+            pred.successors[index] = target
+            target.predecessors.append(pred)
+            if pred.successors.count(target) == 2:
+                # cbr with both edges into the target
+                terminator = pred.terminator
+                terminator.op = 'br'
+                terminator.drop_args()
+                pred.successors.pop()
+                target.predecessors.remove(pred)
+        block.predecessors = []
+        remove_edge(block, target)
+        self._delete(block)
+        return True
+
+    def _merge(self, function, block):
+        """Append the only successor to a block that jumps to it."""
+        if len(block.successors) != 1:
+            return False
+
+        succ = block.successors[0]
+        if (succ is block or succ is function.entry or
+            len(succ.predecessors) != 1):
+            return False
+
+        for phi in list(succ.phis):
+            value = phi.args[0]
+            phi.replace_uses(value)
+            succ.remove(phi)
+
+        block.instructions.pop().drop_args()
+        for instruction in succ.instructions:
+            instruction.block = block
+        block.instructions.extend(succ.instructions)
+        succ.instructions = []
+
+        block.successors = succ.successors
+        for next_block in succ.successors:
+            next_block.predecessors[
+                next_block.predecessors.index(succ)] = block
+        succ.successors = []
+        succ.predecessors = []
+        self._delete(succ)
+        return True
+
+    def _delete(self, block):
+        block.instructions = []
+        self.deleted.add(block)
+
+
+class SSAOptimizer(object):
+    """Runs SSA optimization passes over a list of functions."""
+
+    def __init__(self, passes=None):
+        if passes is None:
+            # value numbering forwards stored globals to loads,
+            # which gives constant propagation more to work with
+            passes = [GlobalValueNumbering(),
+                      ConstantPropagation(),
+                      DeadCodeElimination()]
+        self.passes = passes
+
+    def optimize(self, functions):
+        for function in functions:
+            for optimization in self.passes:
+                optimization.run(function)
+        return functions
+
+    def report(self):
+        return '\n'.join(optimization.report()
+                         for optimization in self.passes)
+
+
+class SSALowering(object):
+    """Translates SSA functions into compiler.FunctionCode.
+
+    Every value gets a virtual register. Phis are replaced with moves
+    at the end of the predecessor blocks, an edge from a conditional
+    branch into a block with phis gets a block of its own for the
+    moves. A phi shares the register of each argument whose live range
+    does not overlap its own, so most of those moves disappear. Blocks
+    are laid out in reverse postorder so that most jumps fall through.
+    """
+
+    def __init__(self, globals):
+        # name -> global memory index
+        self.globals = globals
+        self.label_count = 0
+
+    def lower(self, function):
+        code = self.code = FunctionCode(function.name, function.args)
+        self.registers = {}
+        self.classes = {}
+        self._coalesce(function)
+        self.labels = {}
+        self.used_labels = set()
+        # (label, pred, succ) of edges that need a block for the moves
+        self.edge_blocks = []
+
+        self.none = None
+        if function.name != 'main' and self._needs_none(function):
+            # r0 is None on entry but calls clobber it
+            self.none = code.new_register()
+            code.emit('move', self.none, code.ret)
+
+        order = reverse_postorder(function)
+        for position, block in enumerate(order):
+            following = order[position + 1] if position + 1 < len(
+                order) else None
+            if block is not function.entry:
+                code.emit('label', self._label(block))
+            for instruction in block.instructions:
+                self._instruction(instruction, following)
+
+        for label, pred, succ in self.edge_blocks:
+            code.emit('label', label)
+            self._moves(pred, succ)
+            code.emit('br', self._use_label(succ))
+
+        code.instructions = [
+            instruction for instruction in code.instructions
+            if instruction[0] != 'label' or instruction[1] in self.used_labels]
+        return code
+
+    # Helper methods
+    def _needs_none(self, function):
+        has_call = has_empty_ret = False
+        for block in function.blocks:
+            for instruction in block.instructions:
+                if instruction.op == 'call':
+                    has_call = True
+                elif instruction.op == 'ret' and not instruction.args:
+                    has_empty_ret = True
+        return has_call and has_empty_ret
+
+    def _new_label(self):
+        self.label_count += 1
+        return 'L%d' % self.label_count
+
+    def _label(self, block):
+        label = self.labels.get(block)
+        if label is None:
+            label = self.labels[block] = self._new_label()
+        return label
+
+    def _use_label(self, block):
+        label = self._label(block)
+        self.used_labels.add(label)
+        return label
+
+    def _target(self, pred, succ):
+        """Return label a branch from pred to succ jumps to."""
+        if not succ.phis:
+            return self._use_label(succ)
+        label = self._new_label()
+        self.used_labels.add(label)
+        self.edge_blocks.append((label, pred, succ))
+        return label
+
+    def _coalesce(self, function):
+        live_in, live_out = liveness(function)
+        position = {}
+        # block -> value -> position of its last use in the block
+        last_use = {}
+        for block in function.blocks:
+            for phi in block.phis:
+                position[phi] = -1
+            uses = last_use[block] = {}
+            for index, instruction in enumerate(block.instructions):
+                position[instruction] = index
+                for arg in instruction.args:
+                    uses[arg] = index
+
+        def live_at(value, definition):
+            block = definition.block
+            if value.block is block and (
+                position[value] >= position[definition]):
+                return False
+            if definition.op == 'phi':
+                return value in live_in[block]
+            return (value in live_out[block] or
+                    last_use[block].get(value, -1) > position[definition])
+
+        def interfere(first, second):
+            if (first.op == 'phi' and second.op == 'phi' and
+                first.block is second.block):
+                return True
+            return live_at(first, second) or live_at(second, first)
+
+        members = {}
+        for block in function.blocks:
+            for phi in block.phis:
+                for arg in phi.args:
+                    if arg.op == 'undef':
+                        continue
+                    first = self._find(phi)
+                    second = self._find(arg)
+                    if first is second:
+                        continue
+                    first_members = members.get(first, [first])
+                    second_members = members.get(second, [second])
+                    params = [value for value in first_members +
+                              second_members if value.op == 'param']
+                    if len(params) > 1 or any(
+                        interfere(one, other)
+                        for one in first_members
+                        for other in second_members):
+                        continue
+                    # a parameter keeps its fixed register
+                    if params and params[0] in second_members:
+                        first, second = second, first
+                    self.classes[second] = first
+                    members[first] = first_members + second_members
+                    members.pop(second, None)
+
+    def _find(self, value):
+        while value in self.classes:
+            value = self.classes[value]
+        return value
+
+    def _reg(self, value):
+        value = self._find(value)
+        register = self.registers.get(value)
+        if register is None:
+            if value.op == 'param':
+                register = self.code.params[value.data]
+            else:
+                register = self.code.new_register()
+            self.registers[value] = register
+        return register
+
+    def _moves(self, pred, succ):
+        """Emit the parallel copy of phi arguments along an edge."""
+        index = succ.predecessors.index(pred)
+        moves = []
+        for phi in succ.phis:
+            arg = phi.args[index]
+            if arg.op == 'undef':
+                continue
+            dest, source = self._reg(phi), self._reg(arg)
+            if dest is not source:
+                moves.append((dest, source))
+
+        sources = set(source for _, source in moves)
+        if any(dest in sources for dest, _ in moves):
+            # a phi reads another phi of the block: copy through temps
+            temps = []
+            for dest, source in moves:
+                temp = self.code.new_register()
+                self.code.emit('move', temp, source)
+                temps.append((dest, temp))
+            moves = temps
+
+        for dest, source in moves:
+            self.code.emit('move', dest, source)
+
+    def _instruction(self, instruction, following):
+        code = self.code
+        op = instruction.op
+        args = instruction.args
+
+        if op == 'const':
+            code.emit('loadk', self._reg(instruction), instruction.data)
+
+        elif op in BINARY_OPS:
+            code.emit(op, self._reg(instruction),
+                      self._reg(args[0]), self._reg(args[1]))
+
+        elif op == 'gload':
+            code.emit('gload', self._reg(instruction),
+                      self.globals[instruction.data])
+
+        elif op == 'gstore':
+            code.emit('gstore', self.globals[instruction.data],
+                      self._reg(args[0]))
+
+        elif op == 'print':
+            code.emit('print', self._reg(args[0]))
+
+        elif op == 'call':
+            # arguments are passed in consecutive registers
+            registers = tuple(code.new_register() for _ in args)
+            for register, arg in zip(registers, args):
+                code.emit('move', register, self._reg(arg))
+            code.emit('call', instruction.data, registers)
+            if instruction.uses:
+                # the next call clobbers r0
+                code.emit('move', self._reg(instruction), code.ret)
+
+        elif op == 'br':
+            block = instruction.block
+            succ = block.successors[0]
+            self._moves(block, succ)
+            if succ is not following:
+                code.emit('br', self._use_label(succ))
+
+        elif op == 'cbr':
+            block = instruction.block
+            cond = self._reg(args[0])
+            if_true, if_false = block.successors
+            if if_true is following and not if_true.phis:
+                code.emit('brf', cond, self._target(block, if_false))
+            elif if_false is following and not if_false.phis:
+                code.emit('brt', cond, self._target(block, if_true))
+            else:
+                code.emit('brf', cond, self._target(block, if_false))
+                code.emit('br', self._target(block, if_true))
+
+        elif op == 'ret':
+            if args:
+                code.emit('move', code.ret, self._reg(args[0]))
+            elif self.none is not None:
+                code.emit('move', code.ret, self.none)
+            code.emit('ret')
+
+        elif op == 'halt':
+            code.emit('halt')
+
+        # param, undef and phi define registers without instructions
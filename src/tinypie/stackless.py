@@ -0,0 +1,225 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.interpreter import (
+    Interpreter,
+    FunctionSpace,
+    InterpreterException,
+    )
+from tinypie.memo import make_key, MISSING
+
+# Work stack operations
+(OP_EXEC,      # execute statement
+ OP_EVAL,      # evaluate expression and push its value
+ OP_PRINT,     # pop value and print it
+ OP_STORE,     # pop value and assign it to the ASSIGN node's variable
+ OP_DISCARD,   # pop value of a call statement
+ OP_BRANCH,    # pop IF predicate and schedule the chosen branch
+ OP_LOOP,      # pop WHILE predicate and schedule the next iteration
+ OP_BINOP,     # pop two operands and push the result
+ OP_INVOKE,    # pop arguments and enter the function
+ OP_LEAVE,     # function body ended without 'return'
+ OP_RETURN,    # pop return value and unwind to the caller
+ OP_MEMO,      # store return value on top of the value stack in memo table
+ ) = range(12)
+
+
+class StacklessInterpreter(Interpreter):
+    """Interpreter driven by an explicit work stack.
+
+    The AST is walked by a single loop that pops (operation, node)
+    pairs off a work stack and pushes intermediate results onto a
+    value stack, so TinyPie recursion does not consume Python
+    frames. Recursion depth is limited only by memory: a TinyPie
+    call costs one FunctionSpace, one entry in the frame stack and
+    the handful of pending work items of the caller.
+
+    Uses the same memory spaces and slot resolution as the
+    tree-walking Interpreter.
+    """
+
+    def execute(self, tree):
+        """Execute AST using explicit work and value stacks."""
+        del self.func_stack[:]
+        self._run(tree)
+
+    def _run(self, tree):
+        tasks = [(OP_EXEC, tree)]
+        values = []
+        # work stack height at function entry, one per active call
+        frames = []
+        func_stack = self.func_stack
+        memoizer = self.memoizer
+
+        while tasks:
+            op, node = tasks.pop()
+
+            if op == OP_EVAL:
+                node_type = node.token.type
+
+                if node_type == tokens.ID:
+                    values.append(self._load(node))
+
+                elif node_type == tokens.INT:
+                    values.append(int(node.token.text))
+
+                elif node_type == tokens.STRING:
+                    values.append(node.token.text)
+
+                elif node_type == tokens.CALL:
+                    func_symbol = node.scope.resolve(node.children[0].text)
+                    args = node.children[1:len(func_symbol.formal_args) + 1]
+                    if len(args) != len(func_symbol.formal_args):
+                        raise InterpreterException(
+                            '%s() takes %s arguments' % (
+                                func_symbol.name,
+                                len(func_symbol.formal_args))
+                            )
+                    tasks.append((OP_INVOKE, node))
+                    for arg in reversed(args):
+                        tasks.append((OP_EVAL, arg))
+
+                else:
+                    # binary operator
+                    tasks.append((OP_BINOP, node))
+                    tasks.append((OP_EVAL, node.children[1]))
+                    tasks.append((OP_EVAL, node.children[0]))
+
+            elif op == OP_EXEC:
+                node_type = node.token.type
+
+                if node_type == tokens.BLOCK:
+                    for child in reversed(node.children):
+                        tasks.append((OP_EXEC, child))
+
+                elif node_type == tokens.ASSIGN:
+                    tasks.append((OP_STORE, node))
+                    tasks.append((OP_EVAL, node.children[1]))
+
+                elif node_type == tokens.CALL:
+                    tasks.append((OP_DISCARD, None))
+                    tasks.append((OP_EVAL, node))
+
+                elif node_type == tokens.PRINT:
+                    tasks.append((OP_PRINT, None))
+                    tasks.append((OP_EVAL, node.children[0]))
+
+                elif node_type == tokens.IF:
+                    tasks.append((OP_BRANCH, node))
+                    tasks.append((OP_EVAL, node.children[0]))
+
+                elif node_type == tokens.WHILE:
+                    tasks.append((OP_LOOP, node))
+                    tasks.append((OP_EVAL, node.children[0]))
+
+                elif node_type == tokens.RETURN:
+                    tasks.append((OP_RETURN, None))
+                    tasks.append((OP_EVAL, node.children[0]))
+
+            elif op == OP_BINOP:
+                right = values.pop()
+                left = values.pop()
+                node_type = node.token.type
+
+                if node_type == tokens.ADD:
+                    values.append(left + right)
+                elif node_type == tokens.SUB:
+                    values.append(left - right)
+                elif node_type == tokens.MUL:
+                    values.append(left * right)
+                elif node_type == tokens.LT:
+                    values.append(left < right)
+                else:
+                    values.append(left == right)
+
+            elif op == OP_STORE:
+                self._store(node, values.pop())
+
+            elif op == OP_LOOP:
+                if values.pop():
+                    tasks.append((OP_LOOP, node))
+                    tasks.append((OP_EVAL, node.children[0]))
+                    tasks.append((OP_EXEC, node.children[1]))
+
+            elif op == OP_BRANCH:
+                if values.pop():
+                    tasks.append((OP_EXEC, node.children[1]))
+                elif len(node.children) == 3:
+                    tasks.append((OP_EXEC, node.children[2]))
+
+            elif op == OP_INVOKE:
+                func_symbol = node.scope.resolve(node.children[0].text)
+                nargs = len(func_symbol.formal_args)
+
+                if memoizer is not None:
+                    table = memoizer.get_table(func_symbol)
+                    if table is not None:
+                        key = make_key(values[len(values) - nargs:])
+                        value = table.lookup(key)
+                        if value is not MISSING:
+                            del values[len(values) - nargs:]
+                            values.append(value)
+                            continue
+                        # runs after the function returned
+                        tasks.append((OP_MEMO, (table, key)))
+
+                func_space = FunctionSpace(func_symbol)
+                if nargs:
+                    # formal arguments occupy the first slots
+                    func_space.values[:nargs] = values[-nargs:]
+                    del values[-nargs:]
+
+                # push local scope
+                func_stack.append(func_space)
+                tasks.append((OP_LEAVE, None))
+                frames.append(len(tasks))
+                tasks.append((OP_EXEC, func_symbol.block_ast))
+
+            elif op == OP_LEAVE:
+                frames.pop()
+                func_stack.pop()
+                values.append(None)
+
+            elif op == OP_RETURN:
+                if not frames:
+                    # 'return' at the top level stops the program
+                    return
+
+                # unwind pending work of the function, OP_LEAVE included
+                del tasks[frames.pop() - 1:]
+                func_stack.pop()
+
+            elif op == OP_DISCARD:
+                values.pop()
+
+            elif op == OP_MEMO:
+                table, key = node
+                table.store(key, values[-1])
+
+            elif op == OP_PRINT:
+                print values.pop()
@@ -51,6 +51,9 @@ class FunctionSymbol(ScopedSymbol):
         super(FunctionSymbol, self).__init__(name, enclosing_scope)
         # self.formal_args = None
         self.block_ast = None
+        self.local_scope = None
+        # variable name -> FunctionSpace slot, filled in by SlotResolver
+        self.slots = {}
         self.symbols = {}
         self.ordered_symbols = []
 
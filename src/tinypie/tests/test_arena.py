@@ -0,0 +1,147 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie import tokens
+from tinypie.arena import ASTArena, ArenaNode, NO_NODE
+from tinypie.interpreter import Interpreter
+from tinypie.lexer import Lexer
+from tinypie.parser import Parser
+from tinypie.scope import GlobalScope
+from tinypie.tests.test_interpreter import redirected_output
+
+SOURCE = """
+def fact(n):
+    if n < 2 return 1
+    return n * fact(n - 1)
+.
+x = 'done'
+print fact(5)
+print x
+"""
+
+
+class StubInterpreter(object):
+
+    def __init__(self):
+        self.global_scope = GlobalScope()
+
+
+def parse(text, arena=None):
+    parser = Parser(Lexer(text), interpreter=StubInterpreter(), arena=arena)
+    parser.parse()
+    return parser.root
+
+
+class ASTArenaTestCase(unittest.TestCase):
+
+    def test_links(self):
+        arena = ASTArena()
+        parent = arena.add(tokens.BLOCK)
+        first = arena.add(tokens.ID, 'x')
+        second = arena.add(tokens.ID, 'y')
+        arena.add_child(parent, first)
+        arena.add_child(parent, second)
+        self.assertEqual(arena.first_child[parent], first)
+        self.assertEqual(arena.next_sibling[first], second)
+        self.assertEqual(arena.next_sibling[second], NO_NODE)
+        self.assertEqual(arena.first_child[first], NO_NODE)
+        self.assertEqual(list(arena.children(parent)), [first, second])
+
+    def test_shared_tables(self):
+        arena = ASTArena()
+        arena.add(tokens.ID, 'x')
+        arena.add(tokens.ID, 'x')
+        arena.add(tokens.INT, '1')
+        self.assertEqual(arena.types, [tokens.ID, tokens.INT])
+        self.assertEqual(arena.strings, ['x', '1'])
+        self.assertEqual(list(arena.texts), [0, 0, 1])
+
+    def test_parser_builds_arena(self):
+        arena = ASTArena()
+        root = parse(SOURCE, arena)
+        self.assertTrue(isinstance(root, ArenaNode))
+        self.assertEqual(root.to_string_tree(), parse(SOURCE).to_string_tree())
+        func_def = root.children[0]
+        self.assertEqual(func_def.type, tokens.FUNC_DEF)
+        self.assertEqual(func_def.symbol.name, 'fact')
+
+    def test_missing_symbol(self):
+        arena = ASTArena()
+        node = arena.node(tokens.BLOCK)
+        self.assertEqual(getattr(node, 'symbol', None), None)
+
+    def test_from_ast(self):
+        tree = parse(SOURCE)
+        arena = ASTArena.from_ast(tree)
+        self.assertEqual(arena.to_string_tree(0), tree.to_string_tree())
+
+    def test_from_ast_symbols(self):
+        tree = parse(SOURCE)
+        indexes = {}
+        arena = ASTArena.from_ast(tree, indexes)
+        func_def = tree.children[0]
+        index = indexes[id(func_def)]
+        self.assertTrue(arena.symbols[index] is func_def.symbol)
+        nodes = arena.to_ast_nodes()
+        self.assertTrue(nodes[index].symbol is func_def.symbol)
+        self.assertEqual(nodes[0].to_string_tree(), tree.to_string_tree())
+
+    def test_serialize(self):
+        arena = ASTArena()
+        root = parse(SOURCE + "print 'a\0b'\n", arena)
+        loaded = ASTArena.loads(arena.dumps())
+        self.assertEqual(loaded.to_string_tree(root.index),
+                         root.to_string_tree())
+        self.assertEqual(loaded.strings, arena.strings)
+
+    def test_serialize_empty(self):
+        loaded = ASTArena.loads(ASTArena().dumps())
+        self.assertEqual(len(loaded), 0)
+        self.assertEqual(loaded.types, [])
+
+    def test_visualizer(self):
+        from tinypie.astviz import ASTVisualizer
+        self.assertEqual(str(ASTVisualizer(parse(SOURCE, ASTArena()))),
+                         str(ASTVisualizer(parse(SOURCE))))
+
+    def test_interpreter(self):
+        interp = Interpreter()
+        tree = interp.parse(SOURCE, arena=ASTArena())
+        with redirected_output() as output:
+            interp.execute(tree)
+        self.assertEqual(output.getvalue(), '120\ndone\n')
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(ASTArenaTestCase),
+        doctest.DocFileSuite(
+            '../arena.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS),
+        ))
@@ -189,9 +189,91 @@ class BytecodeAssemblerTestCase(unittest.TestCase):
         self.assertEquals(func_symbol.address, 18)
 
 
+class DeadCodeStripperTestCase(unittest.TestCase):
+
+    def _strip(self, text):
+        from tinypie.asmutils import DeadCodeStripper
+        return DeadCodeStripper().strip(text)
+
+    def test_no_main(self):
+        text = """
+        .def foo: args=0, locals=0
+            ret
+            ret
+        """
+        self.assertEquals(self._strip(text), text)
+
+    def test_function_reached_by_falling_through(self):
+        text = """
+        .def main: args=0, locals=0
+            halt
+        .def first: args=0, locals=0
+            print r0
+        .def second: args=0, locals=0
+            ret
+        .def third: args=0, locals=0
+            ret
+        """
+        stripped = self._strip(text.replace('halt', 'call first, r0'))
+        self.assertTrue('.def second' in stripped)
+        self.assertFalse('.def third' in stripped)
+        self.assertFalse('.def first' in self._strip(text))
+
+    def test_function_reached_by_branch(self):
+        text = self._strip("""
+        .def main: args=0, locals=0
+            br label
+        .def other: args=0, locals=0
+            ret
+        label:
+            halt
+        """)
+        self.assertTrue('.def other' in text)
+        self.assertFalse('    ret' in text)
+
+    def test_unreachable_code_and_labels(self):
+        from tinypie.asmutils import DeadCodeStripper
+        stripper = DeadCodeStripper()
+        text = stripper.strip("""
+        .def main: args=0, locals=1
+        start:
+            loadk r1, 'a, b: c'
+            brf r1, skip
+        skip:
+            br end
+            print r1
+            br start
+        end:
+            print r1
+            halt
+        """)
+        self.assertEquals(text.split(), [
+            '.def', 'main:', 'args=0,', 'locals=1',
+            'loadk', 'r1,', "'a,", "b:", "c'",
+            'print', 'r1', 'halt'])
+        self.assertEquals(stripper.instructions, 4)
+        self.assertEquals(stripper.labels, 3)
+
+    def test_compiled_program(self):
+        from tinypie.compiler import compile_source
+        text = """
+        def f(x):
+            if x return 1
+            else return 2
+        .
+        def unused() return 3
+        print f(1)
+        """
+        self.assertTrue('unused' in compile_source(text))
+        asm = compile_source(text, optimize=True)
+        self.assertFalse('unused' in asm)
+        self.assertFalse('br' in asm.replace('brf', ''))
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(BytecodeAssemblerTestCase),
+        unittest.makeSuite(DeadCodeStripperTestCase),
         doctest.DocFileSuite(
             '../asmutils.py',
             optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS
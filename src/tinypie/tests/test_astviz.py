@@ -26,10 +26,68 @@ __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
 import doctest
 import unittest
+from cStringIO import StringIO
+
+from tinypie import tokens
+from tinypie.ast import AST
+from tinypie.astviz import ASTVisualizer, find_function
+from tinypie.interpreter import Interpreter
+from tinypie.lexer import Token
+
+SOURCE = """
+def f(x) return x
+print f('say "hi"')
+def f(x) return x + 1
+"""
+
+
+class ASTVisualizerTestCase(unittest.TestCase):
+
+    def _lines(self, visualizer):
+        output = StringIO()
+        visualizer.write(output)
+        return output.getvalue().splitlines()
+
+    def test_write(self):
+        visualizer = ASTVisualizer(Interpreter().parse(SOURCE))
+        output = StringIO()
+        visualizer.write(output)
+        self.assertEqual(output.getvalue(), str(visualizer) + '\n')
+
+    def test_escaped_label(self):
+        lines = self._lines(ASTVisualizer(Interpreter().parse(SOURCE)))
+        self.assertTrue(r'   node11 [label="STRING (say \"hi\")"];' in lines)
+
+    def test_deep_tree(self):
+        root = node = AST(tokens.BLOCK)
+        for _ in range(10000):
+            child = AST(Token(tokens.ADD, '+'))
+            node.add_child(child)
+            node = child
+        lines = self._lines(ASTVisualizer(root))
+        self.assertTrue('   node10001 [label="ADD (+)"];' in lines)
+        self.assertEqual(lines[-2], '   node1 -> node2')
+
+    def test_max_depth(self):
+        tree = Interpreter().parse(SOURCE)
+        lines = self._lines(ASTVisualizer(tree, max_depth=0))
+        self.assertEqual(lines[-3:], ['   node1 [label="BLOCK"];', '', '}'])
+
+        lines = self._lines(ASTVisualizer(tree, max_depth=1))
+        self.assertEqual(
+            [line for line in lines if '->' in line],
+            ['   node1 -> node2', '   node1 -> node3', '   node1 -> node4'])
+
+    def test_find_function(self):
+        tree = Interpreter().parse(SOURCE)
+        function = find_function(tree, 'f')
+        self.assertTrue(function is tree.children[2])
+        self.assertTrue(find_function(tree, 'g') is None)
 
 
 def test_suite():
     return unittest.TestSuite((
+        unittest.makeSuite(ASTVisualizerTestCase),
         doctest.DocFileSuite(
             '../astviz.py',
             optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS
@@ -0,0 +1,83 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import unittest
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class ClosureInterpreterTestCase(test_interpreter.InterpreterTestCase):
+    """Runs the interpreter test suite against closure compiled code."""
+
+    def _get_interpreter(self):
+        from tinypie.closure import ClosureInterpreter
+        interp = ClosureInterpreter()
+        return interp
+
+
+class ClosureCompilerTestCase(unittest.TestCase):
+
+    def _compile(self, text):
+        from tinypie.closure import ClosureCompiler, ClosureInterpreter
+        interp = ClosureInterpreter()
+        tree = interp.parse(text)
+        return interp, ClosureCompiler(interp).compile(tree)
+
+    def test_expression_closure(self):
+        interp, code = self._compile('print 2 + 3 * 4\n')
+        with redirected_output() as output:
+            code()
+        self.assertEquals(output.getvalue().strip(), '14')
+
+    def test_closure_is_reusable(self):
+        interp, code = self._compile("""
+        x = 0
+        x = x + 1
+        """)
+        code()
+        code()
+        self.assertEquals(interp.get_global('x'), 1)
+
+    def test_function_body_compiled_once(self):
+        from tinypie.closure import ClosureCompiler
+
+        interp, code = self._compile("""
+        def fact(x):
+            if x < 2 return 1
+            return x * fact(x - 1)
+        .
+        result = fact(6)
+        """)
+        compiler = ClosureCompiler(interp)
+        compiler.compile(interp.parse('result = fact(6)\n'))()
+        self.assertEquals(len(compiler.functions), 1)
+        self.assertEquals(interp.get_global('result'), 720)
+
+    def test_empty_block(self):
+        interp, code = self._compile('\n\n')
+        self.assertTrue(code() is None)
@@ -0,0 +1,177 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class VMRunner(object):
+    """Interpreter look-alike that compiles source and runs it in the VM."""
+
+    def __init__(self, allocator=None, ssa=False):
+        self.allocator = allocator
+        self.ssa = ssa
+
+    def interpret(self, text):
+        from tinypie.compiler import run_source
+        run_source(text, allocator=self.allocator, ssa=self.ssa)
+
+
+class CompiledProgramTestCase(test_interpreter.InterpreterTestCase):
+    """Runs the interpreter test suite on compiled code in the VM."""
+
+    def _get_interpreter(self):
+        return VMRunner()
+
+    def test_name_lookup_error(self):
+        from tinypie.compiler import CompilerException
+
+        interp = self._get_interpreter()
+        self.assertRaises(CompilerException, interp.interpret, 'print x\n')
+
+
+class BytecodeCompilerTestCase(unittest.TestCase):
+
+    def _compile(self, text):
+        from tinypie.compiler import compile_source
+        return compile_source(text)
+
+    def test_globals(self):
+        asm = self._compile("""
+        x = 1
+        y = 2
+        """)
+        self.assertTrue(asm.startswith('.globals 2\n'))
+        self.assertTrue('gstore 0, r1' in asm)
+        self.assertTrue('gstore 1, r1' in asm)
+
+    def test_function_arguments(self):
+        asm = self._compile("""
+        def add(x, y) return x + y
+        print add(1, 2)
+        """)
+        self.assertTrue('.def add: args=2, locals=0\n' in asm)
+        self.assertTrue('    iadd r0, r1, r2\n' in asm)
+
+    def test_while_labels(self):
+        asm = self._compile("""
+        i = 0
+        while i < 3 i = i + 1
+        """)
+        self.assertTrue('L1:\n' in asm)
+        self.assertTrue('brf' in asm)
+        self.assertTrue('    br L1\n' in asm)
+
+    def test_undefined_function(self):
+        from tinypie.compiler import CompilerException
+        self.assertRaises(CompilerException, self._compile, 'foo()\n')
+
+    def test_reserved_function_name(self):
+        from tinypie.compiler import CompilerException
+        self.assertRaises(
+            CompilerException, self._compile, 'def main() print 1\n')
+
+    def test_missing_arguments(self):
+        from tinypie.compiler import CompilerException
+        self.assertRaises(
+            CompilerException, self._compile, """
+            def foo(x, y) return x
+            foo(1)
+            """)
+
+    def test_string_constant(self):
+        from tinypie.compiler import run_source
+
+        with redirected_output() as output:
+            run_source("print 'hello' + ' world'\n")
+        self.assertEquals(output.getvalue().strip(), 'hello world')
+
+    def test_comparison_yields_integer(self):
+        from tinypie.compiler import run_source
+
+        with redirected_output() as output:
+            run_source('print 1 < 2\n')
+        self.assertEquals(output.getvalue().strip(), '1')
+
+    def test_nested_global_assignment(self):
+        from tinypie.compiler import run_source
+
+        with redirected_output() as output:
+            run_source("""
+            x = 1
+            if x < 2:
+                y = 5
+            .
+            print y
+            """)
+        self.assertEquals(output.getvalue().strip(), '5')
+
+    def test_negative_constant(self):
+        from tinypie.compiler import compile_source, run_source
+
+        self.assertTrue('loadk r1, -4' in
+                        compile_source('x = 1 - 5\n', optimize=True))
+        with redirected_output() as output:
+            run_source('print 1 - 5\n', optimize=True)
+        self.assertEquals(output.getvalue().strip(), '-4')
+
+    def test_integer_instructions(self):
+        asm = self._compile("""
+        def foo(x, s):
+            if x < 3 print s + 'a'
+            y = x < 3
+            return y
+        .
+        print foo(1, 'b')
+        """)
+        self.assertTrue('ilt ' in asm)
+        # value of a comparison must be 1 or 0
+        self.assertTrue('    lt ' in asm)
+        self.assertFalse('iadd ' in asm)
+        self.assertTrue('    add ' in asm)
+
+    def test_unproven_operands(self):
+        asm = self._compile("""
+        def add(x, y) return x + y
+        print add(1, 2)
+        print add('a', 'b')
+        """)
+        self.assertTrue('    add r0, r1, r2\n' in asm)
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(CompiledProgramTestCase),
+        unittest.makeSuite(BytecodeCompilerTestCase),
+        doctest.DocFileSuite(
+            '../compiler.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS
+            ),
+        ))
@@ -0,0 +1,139 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie.incremental import IncrementalParser
+from tinypie.interpreter import Interpreter
+from tinypie.parser import ParserException
+from tinypie.tests.test_interpreter import redirected_output
+
+SOURCE = """
+def fact(n):
+    if n < 2 return 1
+    return n * fact(n - 1)
+.
+def double(x) return x * 2
+x = fact(5)
+print double(x)
+"""
+
+
+class IncrementalParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.interp = Interpreter()
+        self.parser = IncrementalParser(self.interp)
+        self.parser.parse(SOURCE)
+
+    def _run(self, text):
+        tree = self.parser.parse(text)
+        with redirected_output() as output:
+            self.interp.execute(tree)
+        return output.getvalue()
+
+    def _names(self):
+        return sorted(self.interp.global_scope.symbols)
+
+    def _tree(self, text):
+        return Interpreter().parse(text).to_string_tree()
+
+    def test_first_parse(self):
+        self.assertTrue(self.parser.full)
+        self.assertEqual(self.parser.reparsed, 4)
+        self.assertEqual(self._run(SOURCE), '240\n')
+
+    def test_changed_function(self):
+        text = SOURCE.replace('x * 2', 'x * 3')
+        self.assertEqual(self._run(text), '360\n')
+        self.assertFalse(self.parser.full)
+        self.assertEqual(self.parser.reparsed, 1)
+        self.assertEqual(self.parser.root.to_string_tree(), self._tree(text))
+
+    def test_unchanged(self):
+        root = self.parser.root
+        nodes = list(root.children)
+        self.assertTrue(self.parser.parse(SOURCE) is root)
+        self.assertEqual(self.parser.reparsed, 0)
+        self.assertEqual(root.children, nodes)
+
+    def test_insert(self):
+        text = SOURCE.replace('x = fact(5)\n', 'y = 1\nx = fact(5) + y\n')
+        self.assertEqual(self._run(text), '242\n')
+        self.assertFalse(self.parser.full)
+        self.assertEqual(len(self.parser.items), 5)
+        self.assertTrue('y' in self._names())
+        self.assertEqual(self.parser.root.to_string_tree(), self._tree(text))
+
+    def test_delete(self):
+        text = SOURCE.replace('def double(x) return x * 2\n', '')
+        text = text.replace('double(x)', 'x')
+        self.parser.parse(text)
+        self.assertFalse(self.parser.full)
+        self.assertFalse('double' in self._names())
+        self.assertEqual(self._names(), ['fact', 'x'])
+
+    def test_redefined_function(self):
+        text = SOURCE + 'def double(x) return x * 4\nprint double(1)\n'
+        self.assertEqual(self._run(text), '480\n4\n')
+        symbol = self.interp.global_scope.symbols['double']
+        self.assertTrue(symbol is self.parser.items[-2].node.symbol)
+
+        # removing the second definition binds the name to the first one
+        self.assertEqual(self._run(SOURCE), '240\n')
+        symbol = self.interp.global_scope.symbols['double']
+        self.assertTrue(symbol is self.parser.items[1].node.symbol)
+
+    def test_invalid_text(self):
+        items = list(self.parser.items)
+        names = self._names()
+        self.assertRaises(
+            ParserException, self.parser.parse,
+            SOURCE.replace('x * 2', 'x * )'))
+        self.assertEqual(self.parser.items, items)
+        self.assertEqual(self._names(), names)
+        self.assertEqual(self._run(SOURCE), '240\n')
+
+    def test_trailing_comment(self):
+        text = SOURCE.replace('x = fact(5)\n', 'x = fact(5) # five\n')
+        self.assertEqual(self._run(text), '240\n')
+        self.assertFalse(self.parser.full)
+
+        # a comment without a new line swallows the next item
+        text = SOURCE.replace('x = fact(5)\n', 'x = fact(5)\n# ')
+        self.assertEqual(self._run(text), '')
+        self.assertTrue(self.parser.full)
+        self.assertEqual(self.parser.root.to_string_tree(), self._tree(text))
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(IncrementalParserTestCase),
+        doctest.DocFileSuite(
+            '../incremental.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS),
+        ))
@@ -206,6 +206,37 @@ class InterpreterTestCase(unittest.TestCase):
             """)
         self.assertEquals(output.getvalue().strip(), '120')
 
+    def test_return_from_while_loop(self):
+        interp = self._get_interpreter()
+        with redirected_output() as output:
+            interp.interpret("""
+            def find(limit):
+                i = 0
+                while i < limit:
+                    if i * i == 16:
+                        return i
+                    .
+                    i = i + 1
+                .
+                return 'none'
+            .
+
+            print find(10)
+            print find(3)
+            """)
+        self.assertEquals(output.getvalue().split(), ['4', 'none'])
+
+    def test_function_without_return(self):
+        interp = self._get_interpreter()
+        with redirected_output() as output:
+            interp.interpret("""
+            def inner() return 7
+            def outer() inner()
+
+            print outer()
+            """)
+        self.assertEquals(output.getvalue().strip(), 'None')
+
     def test_forward_reference(self):
         interp = self._get_interpreter()
         with redirected_output() as output:
@@ -120,3 +120,190 @@ class LexerTestCase(unittest.TestCase):
     def test_nl(self):
         token = self._get_token(' \n')
         self.assertEquals(token.type, tokens.NL)
+
+    def test_comment_and_whitespace_skipped(self):
+        token = self._get_token(' # comment\t\n')
+        self.assertEquals(token.type, tokens.NL)
+
+
+class LexerTablesTestCase(unittest.TestCase):
+
+    def test_shared_between_instances(self):
+        from tinypie.lexer import Lexer
+        first, second = Lexer('x'), Lexer('y')
+        self.assertTrue(first.regexp is second.regexp)
+        self.assertTrue(first.keywords is second.keywords)
+
+    def test_keywords(self):
+        from tinypie.lexer import Lexer
+        keywords = Lexer.get_tables()[2]
+        self.assertEquals(keywords['while'], tokens.WHILE)
+        self.assertFalse(tokens.ID in keywords.values())
+
+    def test_subclass_gets_own_tables(self):
+        from tinypie.lexer import Lexer, AssemblerLexer
+
+        class WordLexer(Lexer):
+            RULES = [(r'\w+', 'WORD')]
+
+        self.assertFalse(
+            AssemblerLexer.get_tables()[0] is Lexer.get_tables()[0])
+        self.assertEquals(WordLexer.get_tables()[2], {})
+        self.assertEquals(WordLexer('abc').token().type, 'WORD')
+        self.assertEquals(Lexer('abc').token().type, tokens.ID)
+
+
+class KeywordLookupTestCase(unittest.TestCase):
+
+    def _get_tokens(self, text, lexer_class=None):
+        from tinypie.lexer import Lexer
+        lexer = (lexer_class or Lexer)(text)
+        result = []
+        token = lexer.token()
+        while token.type != tokens.EOF:
+            result.append((token.type, token.text))
+            token = lexer.token()
+        return result
+
+    def test_keyword(self):
+        self.assertEquals(
+            self._get_tokens('if while'),
+            [(tokens.IF, 'if'), (tokens.WHILE, 'while')])
+
+    def test_identifier_with_keyword_prefix(self):
+        self.assertEquals(
+            self._get_tokens('define iffy printer return1'),
+            [(tokens.ID, 'define'), (tokens.ID, 'iffy'),
+             (tokens.ID, 'printer'), (tokens.ID, 'return1')])
+
+    def test_keywords_not_in_master_regexp(self):
+        from tinypie.lexer import Lexer
+        self.assertFalse('(?P<DEF>' in Lexer.get_tables()[0].pattern)
+
+    def test_alternation_order(self):
+        from tinypie.lexer import Lexer
+
+        class OrderedLexer(Lexer):
+            LOOKUP_KEYWORDS = False
+
+        self.assertEquals(
+            self._get_tokens('iffy', OrderedLexer),
+            [(tokens.IF, 'if'), (tokens.ID, 'fy')])
+
+    def test_assembler_mnemonics(self):
+        from tinypie.lexer import AssemblerLexer
+        self.assertEquals(
+            self._get_tokens('call caller, r1', AssemblerLexer),
+            [(tokens.CALL, 'call'), (tokens.ID, 'caller'),
+             (tokens.COMMA, ','), (tokens.REG, 'r1')])
+
+
+class TokenizeTestCase(unittest.TestCase):
+
+    TEXT = """
+def define(x, y):  # comment
+    if x < y print 'x < y'
+    return x * (y + 10)
+.
+print define(1, 2)
+"""
+
+    def test_same_tokens_as_token(self):
+        from tinypie.lexer import Lexer
+        self.assertEquals(list(Lexer(self.TEXT).tokenize()),
+                          list(Lexer(self.TEXT)))
+
+    def test_assembler_same_tokens_as_token(self):
+        from tinypie.lexer import AssemblerLexer
+        text = '.def main: args=0, locals=1\n  loadk r1, -5\n  call f, r1\n'
+        self.assertEquals(list(AssemblerLexer(text).tokenize()),
+                          list(AssemblerLexer(text)))
+
+    def test_arrays(self):
+        from tinypie.lexer import Lexer
+        stream = Lexer("x = 'abc'").tokenize()
+        self.assertEquals(len(stream), 4)
+        self.assertEquals(stream.kinds.typecode, 'B')
+        self.assertEquals(list(stream.starts), [0, 2, 4, 9])
+        self.assertEquals(list(stream.ends), [1, 3, 9, 9])
+        self.assertEquals(stream.type(2), tokens.STRING)
+        self.assertEquals(stream.text(2), 'abc')
+        self.assertEquals(stream.text(3), 'EOF')
+
+    def test_invalid_token(self):
+        from tinypie.lexer import Lexer, LexerException
+        try:
+            Lexer('x = 1 $ 2').tokenize()
+        except LexerException as e:
+            self.assertEquals(e.pos, 6)
+        else:
+            self.fail('LexerException not raised')
+
+
+class StreamingTestCase(unittest.TestCase):
+
+    TEXT = ("def f(x):\r\n  return x == 10  # comment\n.\n"
+            "s = 'multi\nline'\nprint f(1)\n  \t# last line")
+
+    def _tokens(self, lexer):
+        return [(token.type, token.text) for token in lexer]
+
+    def test_chunks(self):
+        from StringIO import StringIO
+        from tinypie.lexer import Lexer
+        expected = self._tokens(Lexer(self.TEXT))
+        for chunk_size in range(1, 12):
+            lexer = Lexer(StringIO(self.TEXT), chunk_size=chunk_size)
+            self.assertEquals(self._tokens(lexer), expected)
+
+    def test_chunks_kept_small(self):
+        from StringIO import StringIO
+        from tinypie.lexer import Lexer
+        lexer = Lexer(StringIO('x = 1\n' * 1000), chunk_size=16)
+        while lexer.token().type != tokens.EOF:
+            self.assertTrue(len(lexer.buffer) < 32)
+
+    def test_tokenize_chunks(self):
+        from StringIO import StringIO
+        from tinypie.lexer import Lexer
+        lexer = Lexer(StringIO(self.TEXT), chunk_size=4)
+        lexer.token()
+        self.assertEquals(self._tokens(lexer.tokenize()),
+                          self._tokens(Lexer(self.TEXT))[1:])
+
+    def test_assembler_chunks(self):
+        from StringIO import StringIO
+        from tinypie.lexer import AssemblerLexer
+        text = '.def main: args=0, locals=1\n  loadk r1, -5\n  print r1\n'
+        self.assertEquals(
+            self._tokens(AssemblerLexer(StringIO(text), chunk_size=3)),
+            self._tokens(AssemblerLexer(text)))
+
+    def test_error_position(self):
+        from StringIO import StringIO
+        from tinypie.lexer import Lexer, LexerException
+        lexer = Lexer(StringIO("x = 1\ny = 'abc\n"), chunk_size=3)
+        try:
+            list(lexer)
+        except LexerException as e:
+            self.assertEquals(e.pos, 10)
+        else:
+            self.fail('LexerException not raised')
+
+    def test_map_file(self):
+        import tempfile
+        from tinypie.lexer import Lexer, map_file
+        with tempfile.NamedTemporaryFile() as source:
+            source.write(self.TEXT)
+            source.flush()
+            mapped = map_file(source.name)
+            expected = self._tokens(Lexer(self.TEXT))
+            self.assertEquals(self._tokens(Lexer(mapped)), expected)
+            self.assertEquals(self._tokens(Lexer(mapped).tokenize()),
+                              expected)
+
+    def test_map_empty_file(self):
+        import tempfile
+        from tinypie.lexer import map_file
+        with tempfile.NamedTemporaryFile() as source:
+            self.assertEquals(map_file(source.name), '')
@@ -0,0 +1,180 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import unittest
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class MemoizedInterpreterTestCase(test_interpreter.InterpreterTestCase):
+    """Runs the interpreter test suite with memoization enabled."""
+
+    def _get_interpreter(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(memoize=True)
+        return interp
+
+
+class MemoTableTestCase(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        from tinypie.memo import MemoTable, MISSING
+        table = MemoTable('foo', size=2)
+        table.store((1,), 'a')
+        table.store((2,), 'b')
+        self.assertEquals(table.lookup((1,)), 'a')
+        # (2,) is now the least recently used entry
+        table.store((3,), 'c')
+        self.assertEquals(len(table), 2)
+        self.assertEquals(table.evictions, 1)
+        self.assertTrue(table.lookup((2,)) is MISSING)
+        self.assertEquals(table.lookup((3,)), 'c')
+
+    def test_stats(self):
+        from tinypie.memo import MemoTable
+        table = MemoTable('foo')
+        table.lookup((1,))
+        table.store((1,), 1)
+        table.lookup((1,))
+        table.lookup((1,))
+        table.lookup((2,))
+        self.assertEquals((table.hits, table.misses), (2, 2))
+        self.assertEquals(table.hit_rate, 0.5)
+        self.assertEquals(
+            table.report(),
+            'foo: 2 hits, 2 misses, 50.0% hit rate, 0 evictions')
+
+    def test_key_includes_types(self):
+        from tinypie.memo import make_key
+        self.assertNotEquals(make_key([1]), make_key([True]))
+        self.assertEquals(make_key([1, 'a']), make_key([1, 'a']))
+
+
+class MemoizerTestCase(unittest.TestCase):
+
+    FIB = """
+    def fib(n):
+        if n < 2 return n
+        return fib(n - 1) + fib(n - 2)
+    .
+    def show(x):
+        print x
+        return x
+    .
+    def get() return g
+    g = 1
+    """
+
+    def _engines(self):
+        from tinypie.interpreter import Interpreter
+        from tinypie.closure import ClosureInterpreter
+        from tinypie.stackless import StacklessInterpreter
+        return [Interpreter, ClosureInterpreter, StacklessInterpreter]
+
+    def test_pure_functions_get_tables(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(memoize=True)
+        interp.parse(self.FIB)
+        names = sorted(table.name for table in interp.memoizer.tables.values())
+        self.assertEquals(names, ['fib'])
+
+    def test_disabled_by_default(self):
+        from tinypie.interpreter import Interpreter
+        self.assertEquals(Interpreter().memoizer, None)
+
+    def test_memoized_calls(self):
+        for engine in self._engines():
+            interp = engine(memoize=True)
+            with redirected_output() as output:
+                interp.interpret(self.FIB + """
+                print fib(20)
+                print fib(20)
+                show(2)
+                show(2)
+                """)
+            self.assertEquals(output.getvalue().split(),
+                              ['6765', '6765', '2', '2'])
+            table = interp.memoizer.tables.values()[0]
+            # every fib(n) for n in 0..20 is computed once, fib(n - 2)
+            # is found in the table for n in 3..20 and so is fib(20)
+            self.assertEquals(table.misses, 21)
+            self.assertEquals(table.hits, 18 + 1)
+
+    def test_exceptions_are_not_cached(self):
+        for engine in self._engines():
+            interp = engine(memoize=True)
+            text = """
+            def inc(x) return x + 1
+            y = inc(1)
+            """
+            interp.interpret(text)
+            self.assertRaises(TypeError, interp.interpret, "inc('a')\n")
+            table = interp.memoizer.tables.values()[0]
+            self.assertEquals(len(table), 1)
+
+    def test_redefined_callee(self):
+        for engine in self._engines():
+            interp = engine(memoize=True)
+            with redirected_output() as output:
+                interp.interpret("""
+                def sq(x) return x * x
+                def g(y) return sq(y) + 1
+                print g(3)
+                """)
+                interp.interpret("""
+                def sq(x) return x + x
+                print g(3)
+                """)
+            self.assertEquals(output.getvalue().split(), ['10', '7'])
+
+    def test_new_global(self):
+        for engine in self._engines():
+            interp = engine(memoize=True)
+            with redirected_output() as output:
+                interp.interpret("""
+                def f(a):
+                    x = a
+                    return a
+                .
+                print f(1)
+                """)
+                interp.interpret("""
+                x = 5
+                f(1)
+                print x
+                """)
+            self.assertEquals(output.getvalue().split(), ['1', '1'])
+
+    def test_report(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(memoize=True)
+        with redirected_output():
+            interp.interpret(self.FIB + 'print fib(3)\n')
+        self.assertEquals(
+            interp.memoizer.report(),
+            'memo fib: 1 hits, 4 misses, 20.0% hit rate, 0 evictions')
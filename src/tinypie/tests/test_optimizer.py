@@ -0,0 +1,701 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import unittest
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+def tree_string(node):
+    """Render AST as s-expression using token text or node type."""
+    text = node.text or node.type
+    if not node.children:
+        return text
+    children = ' '.join(tree_string(child) for child in node.children)
+    return '(%s %s)' % (text, children)
+
+
+class OptimizedInterpreterTestCase(test_interpreter.InterpreterTestCase):
+    """Runs the interpreter test suite against optimized AST."""
+
+    def _get_interpreter(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        return interp
+
+
+class ConstantFolderTestCase(unittest.TestCase):
+
+    def _optimize(self, text):
+        from tinypie.interpreter import Interpreter
+        from tinypie.lexer import Lexer
+        from tinypie.parser import Parser
+        from tinypie.optimizer import ConstantFolder
+        parser = Parser(Lexer(text), interpreter=Interpreter())
+        parser.parse()
+        folder = ConstantFolder()
+        tree = folder.optimize(parser.root)
+        return folder, tree
+
+    def _render(self, tree):
+        return ' '.join(tree_string(child) for child in tree.children)
+
+    def _run(self, text):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        with redirected_output() as output:
+            interp.interpret(text)
+        return output.getvalue().strip()
+
+    def test_fold_arithmetic(self):
+        folder, tree = self._optimize('x = 2 + 3 * 4 - 20\n')
+        self.assertEquals(self._render(tree), '(ASSIGN x -6)')
+        self.assertEquals(folder.eliminated, 6)
+
+    def test_fold_strings(self):
+        folder, tree = self._optimize("x = 'ab' + 'c' * 2\n")
+        self.assertEquals(self._render(tree), '(ASSIGN x abcc)')
+
+    def test_negative_constant_execution(self):
+        self.assertEquals(self._run('print 1 - 5\n'), '-4')
+
+    def test_no_fold_of_type_errors(self):
+        from tinypie.interpreter import Interpreter
+        folder, tree = self._optimize("x = 1 + 'a'\n")
+        self.assertEquals(self._render(tree), '(ASSIGN x (+ 1 a))')
+        self.assertEquals(folder.eliminated, 0)
+        self.assertRaises(TypeError, Interpreter(optimize=True).interpret,
+                          "print 1 + 'a'\n")
+
+    def test_no_fold_of_large_strings(self):
+        folder, tree = self._optimize("x = 'a' * 100000\n")
+        self.assertEquals(self._render(tree), '(ASSIGN x (* a 100000))')
+
+    def test_identities(self):
+        folder, tree = self._optimize("""
+        x = (y - 1) + 0
+        x = 1 * (y - 1)
+        x = (y - 1) * 0
+        x = y * 1
+        """)
+        # y may hold a string, the operations can fail at run time
+        self.assertEquals(
+            self._render(tree),
+            '(ASSIGN x (+ (- y 1) 0)) (ASSIGN x (* 1 (- y 1))) '
+            '(ASSIGN x (* (- y 1) 0)) (ASSIGN x (* y 1))')
+
+    def test_identities_of_typed_variables(self):
+        folder, tree = self._optimize("""
+        x = 2
+        s = 'a'
+        print x * 1 + 0
+        print (s + '') * 1
+        print (x - 1) * 0
+        def f(a) return a * 1
+        print f(x - 0)
+        """)
+        # reading x may fail, the multiplication by zero stays
+        self.assertEquals(
+            self._render(tree),
+            '(ASSIGN x 2) (ASSIGN s a) (print x) (print s) '
+            '(print (* (- x 1) 0)) (FUNC_DEF f a (BLOCK (return (* a 1)))) '
+            '(print (CALL f x))')
+
+    def test_no_identity_for_later_types(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        with redirected_output() as output:
+            interp.interpret("""
+            def inc(a) return a + 0
+            def set() x = 'a'
+            x = 1
+            print inc(x) + x * 1
+            """)
+        self.assertEquals(output.getvalue().strip(), '2')
+        self.assertRaises(TypeError, interp.interpret, "inc('a')\n")
+        # x is only assigned an integer here, but set stores a string
+        self.assertRaises(TypeError, interp.interpret,
+                          "x = 1\nset()\nprint x - 0\n")
+
+    def test_no_identity_for_failing_sub(self):
+        from tinypie.interpreter import Interpreter
+        folder, tree = self._optimize("x = ('a' - 1) * 0\n")
+        self.assertEquals(self._render(tree), '(ASSIGN x (* (- a 1) 0))')
+        self.assertRaises(TypeError, Interpreter(optimize=True).interpret,
+                          "print ('a' - 1) * 0\n")
+        self.assertRaises(TypeError, Interpreter(optimize=True).interpret,
+                          "x = 'a'\nprint (x - 1) * 0\n")
+
+    def test_no_identity_for_call(self):
+        folder, tree = self._optimize("""
+        x = (1 - foo()) * 0
+        """)
+        self.assertEquals(self._render(tree),
+                          '(ASSIGN x (* (- 1 (CALL foo)) 0))')
+
+    def test_prune_if(self):
+        folder, tree = self._optimize("""
+        if 1 < 2 print 'yes'
+        else print 'no'
+        if 'a' == 'b' print 'never'
+        """)
+        self.assertEquals(self._render(tree), '(print yes)')
+        self.assertEquals(folder.eliminated, 15)
+
+    def test_prune_while(self):
+        folder, tree = self._optimize("""
+        while 0:
+            print 1
+        .
+        x = 3
+        """)
+        self.assertEquals(self._render(tree), '(ASSIGN x 3)')
+
+    def test_keep_nonconstant_predicate(self):
+        folder, tree = self._optimize("""
+        while x < 2 + 3:
+            x = x + 1
+        .
+        """)
+        self.assertEquals(self._render(tree),
+                          '(while (< x 5) (BLOCK (ASSIGN x (+ x 1))))')
+
+    def test_fold_function_body(self):
+        output = self._run("""
+        def foo(x):
+            if 2 == 2:
+                return x * (4 - 3)
+            .
+            return 0
+        .
+        print foo(5)
+        """)
+        self.assertEquals(output, '5')
+
+    def test_report(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        interp.parse('print 1 + 2\n')
+        self.assertEquals(interp.optimizer.report(),
+                          'constant folding: 2 nodes eliminated\n'
+                          'inlining: 0 call sites inlined\n'
+                          'loop-invariant code motion: 0 expressions hoisted\n'
+                          'dead code elimination: 0 functions, '
+                          '0 assignments removed')
+
+
+class PurityAnalysisTestCase(unittest.TestCase):
+
+    def _analyze(self, text):
+        from tinypie.interpreter import Interpreter
+        from tinypie.optimizer import PurityAnalysis, global_names
+        interp = Interpreter()
+        tree = interp.parse(text)
+        analysis = PurityAnalysis(tree, global_names(tree))
+        return dict((node.symbol.name, analysis.is_pure(node.symbol))
+                    for node in tree.children
+                    if node.type == 'FUNC_DEF')
+
+    def test_purity(self):
+        result = self._analyze("""
+        def sq(x):
+            y = x * x
+            return y
+        .
+        def show(x) print x
+        def get() return g
+        def put(x):
+            g = x
+        .
+        def fact(n):
+            if n < 2 return 1
+            return n * fact(n - 1)
+        .
+        def loud(n) return sq(n) + show(n)
+        def missing() return nowhere()
+        g = 1
+        """)
+        self.assertEquals(result, {
+            'sq': True, 'show': False, 'get': False, 'put': False,
+            'fact': True, 'loud': False, 'missing': False})
+
+    def test_mutual_recursion(self):
+        result = self._analyze("""
+        def even(n):
+            if n == 0 return 1
+            return odd(n - 1)
+        .
+        def odd(n):
+            if n == 0 return 0
+            print n
+            return even(n - 1)
+        .
+        """)
+        self.assertEquals(result, {'even': False, 'odd': False})
+
+
+class FunctionInlinerTestCase(unittest.TestCase):
+
+    def _optimize(self, text, **kwargs):
+        from tinypie.interpreter import Interpreter
+        from tinypie.optimizer import FunctionInliner
+        interp = Interpreter()
+        tree = interp.parse(text)
+        inliner = FunctionInliner(**kwargs)
+        inliner.optimize(tree)
+        return inliner, ' '.join(tree_string(child)
+                                 for child in tree.children
+                                 if child.type != 'FUNC_DEF')
+
+    def test_inline_variable_arguments(self):
+        inliner, tree = self._optimize("""
+        def sq(x) return x * x
+        def add(x, y) return x + y
+        print add(sq(a), b)
+        """)
+        self.assertEquals(tree, '(print (+ (* a a) b))')
+        self.assertEquals(inliner.inlined, 2)
+
+    def test_inline_folds_constants(self):
+        inliner, tree = self._optimize("""
+        def sq(x) return x * x
+        y = sq(3) + 1
+        """)
+        self.assertEquals(tree, '(ASSIGN y 10)')
+
+    def test_expression_argument_used_once(self):
+        inliner, tree = self._optimize("""
+        def inc(x) return x + 1
+        def sq(x) return x * x
+        print inc(a * 2)
+        print sq(a * 2)
+        """)
+        self.assertEquals(
+            tree, '(print (+ (* a 2) 1)) (print (CALL sq (* a 2)))')
+
+    def test_impure_argument(self):
+        inliner, tree = self._optimize("""
+        def show(x):
+            print x
+            return x
+        .
+        def inc(x) return x + 1
+        print inc(show(1))
+        """)
+        self.assertEquals(tree, '(print (CALL inc (CALL show 1)))')
+
+    def test_unused_name_argument(self):
+        from tinypie.interpreter import Interpreter, InterpreterException
+        text = """
+        def k(a) return 1
+        print k(undefined) + k(2)
+        """
+        inliner, tree = self._optimize(text)
+        self.assertEquals(tree, '(print (+ (CALL k undefined) 1))')
+        self.assertRaises(InterpreterException,
+                          Interpreter(optimize=True).interpret, text)
+
+    def test_recursive_function(self):
+        inliner, tree = self._optimize("""
+        def even(n) return odd(n)
+        def odd(n) return even(n)
+        def fact(n):
+            if n < 2 return 1
+            return n * fact(n - 1)
+        .
+        print even(1) + fact(3)
+        """)
+        self.assertEquals(inliner.inlined, 0)
+
+    def test_arity_mismatch(self):
+        inliner, tree = self._optimize("""
+        def sq(x) return x * x
+        print sq(1, 2)
+        """)
+        self.assertEquals(tree, '(print (CALL sq 1 2))')
+
+    def test_size_threshold(self):
+        text = """
+        def poly(x) return x * x * x + x * x + x + 1
+        print poly(a)
+        """
+        inliner, tree = self._optimize(text, max_size=5)
+        self.assertEquals(tree, '(print (CALL poly a))')
+        inliner, tree = self._optimize(text)
+        self.assertEquals(inliner.inlined, 1)
+
+    def test_no_capture_of_caller_locals(self):
+        from tinypie.interpreter import Interpreter
+        from tinypie.optimizer import FunctionInliner
+        interp = Interpreter()
+        tree = interp.parse("""
+        def scaled(x) return x * k
+        def foo(k) return scaled(2)
+        def bar(a) return scaled(a)
+        k = 3
+        """)
+        FunctionInliner().optimize(tree)
+        foo, bar = tree.children[1:3]
+        # k in scaled is the global variable, not the argument of foo
+        self.assertEquals(tree_string(foo.children[-1]),
+                          '(BLOCK (return (CALL scaled 2)))')
+        self.assertEquals(tree_string(bar.children[-1]),
+                          '(BLOCK (return (* a k)))')
+        output = LoopInvariantMotionTestCase('_run')._run("""
+        def scaled(x) return x * k
+        def foo(k) return scaled(2)
+        k = 3
+        print foo(5)
+        """)
+        self.assertEquals(output, ['6'])
+
+    def test_redefined_callee(self):
+        from tinypie.interpreter import Interpreter
+        from tinypie.closure import ClosureInterpreter
+        from tinypie.stackless import StacklessInterpreter
+        for engine in (Interpreter, ClosureInterpreter, StacklessInterpreter):
+            interp = engine(optimize=True)
+            with redirected_output() as output:
+                interp.interpret("""
+                def sq(x) return x * x
+                def g(y) return sq(y) + 1
+                def h(z) return g(z) * 2
+                print g(3)
+                """)
+                interp.interpret("""
+                def sq(x) return x + x
+                print g(3)
+                print h(3)
+                """)
+                # g is not called here and the next run puts it back
+                interp.interpret('def sq(x) return x - 1\n')
+                interp.interpret('print h(3)\n')
+            self.assertEquals(output.getvalue().split(),
+                              ['10', '7', '14', '6'])
+
+    def test_report(self):
+        inliner, tree = self._optimize("""
+        def sq(x) return x * x
+        print sq(2) + sq(b)
+        """)
+        self.assertEquals(inliner.report(), 'inlining: 2 call sites inlined')
+
+
+class LoopInvariantMotionTestCase(unittest.TestCase):
+
+    def _optimize(self, text):
+        from tinypie.interpreter import Interpreter
+        from tinypie.optimizer import LoopInvariantMotion
+        interp = Interpreter()
+        tree = interp.parse(text)
+        licm = LoopInvariantMotion(interp.global_scope)
+        licm.optimize(tree)
+        return licm, ' '.join(tree_string(child) for child in tree.children)
+
+    def _run(self, text):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        with redirected_output() as output:
+            interp.interpret(text)
+        return output.getvalue().split()
+
+    def test_hoist_from_predicate_and_body(self):
+        licm, tree = self._optimize("""
+        i = 0
+        while i < n * 2:
+            x = limit * 2
+            i = i + x
+        .
+        """)
+        self.assertEquals(
+            tree,
+            '(ASSIGN i 0) '
+            '(if (< i (* n 2)) (BLOCK '
+            '(ASSIGN licm$1 (* n 2)) (ASSIGN licm$2 (* limit 2)) '
+            '(while (< i licm$1) (BLOCK '
+            '(ASSIGN x licm$2) (ASSIGN i (+ i x))))))')
+        self.assertEquals(licm.hoisted, 2)
+
+    def test_same_expression_hoisted_once(self):
+        licm, tree = self._optimize("""
+        while i < n * 2:
+            i = i + n * 2
+        .
+        """)
+        self.assertEquals(
+            tree,
+            '(if (< i (* n 2)) (BLOCK (ASSIGN licm$1 (* n 2)) '
+            '(while (< i licm$1) (BLOCK (ASSIGN i (+ i licm$1))))))')
+
+    def test_variant_expression_stays(self):
+        licm, tree = self._optimize("""
+        while i < 10:
+            j = i * 2
+            i = i + 1
+        .
+        """)
+        self.assertEquals(licm.hoisted, 0)
+
+    def test_no_hoist_after_control_flow(self):
+        licm, tree = self._optimize("""
+        while i < 10:
+            print i
+            x = limit * 2
+            if i == 5 x = n * 3
+            i = i + 1
+        .
+        """)
+        self.assertEquals(licm.hoisted, 0)
+
+    def test_hoist_pure_call(self):
+        licm, tree = self._optimize("""
+        def sq(x) return x * x
+        i = 0
+        while i < 3:
+            i = i + sq(4)
+        .
+        """)
+        self.assertEquals(licm.hoisted, 1)
+        self.assertTrue('(ASSIGN licm$1 (CALL sq 4))' in tree)
+
+    def test_impure_call_makes_globals_variant(self):
+        licm, tree = self._optimize("""
+        def bump():
+            n = n + 1
+        .
+        n = 1
+        i = 0
+        while i < 3:
+            x = n * 2
+            bump()
+            i = i + 1
+        .
+        """)
+        self.assertEquals(licm.hoisted, 0)
+        output = self._run("""
+        def bump():
+            n = n + 1
+        .
+        n = 1
+        i = 0
+        while i < 3:
+            x = n * 2
+            print x
+            bump()
+            i = i + 1
+        .
+        """)
+        self.assertEquals(output, ['2', '4', '6'])
+
+    def test_impure_call_keeps_arguments_invariant(self):
+        licm, tree = self._optimize("""
+        def bump():
+            n = n + 1
+        .
+        def foo(a):
+            i = 0
+            while i < 3:
+                x = a * 2
+                bump()
+                i = i + 1
+            .
+            return x
+        .
+        """)
+        self.assertEquals(licm.hoisted, 1)
+
+    def test_impure_predicate(self):
+        licm, tree = self._optimize("""
+        def more(i):
+            print i
+            return i < 3
+        .
+        while more(i):
+            x = n * 2
+            i = i + 1
+        .
+        """)
+        self.assertEquals(licm.hoisted, 0)
+
+    def test_loop_not_entered(self):
+        # hoisted code must not run if the loop body does not
+        output = self._run("""
+        def fail(x) return x + 'a'
+        i = 5
+        while i < 3:
+            x = fail(1)
+            i = i + 1
+        .
+        print i
+        """)
+        self.assertEquals(output, ['5'])
+
+    def test_nested_loops(self):
+        output = self._run("""
+        def count(n, m):
+            total = 0
+            i = 0
+            while i < n:
+                j = 0
+                while j < m:
+                    total = total + n * m
+                    j = j + 1
+                .
+                i = i + 1
+            .
+            return total
+        .
+        print count(3, 4)
+        """)
+        self.assertEquals(output, ['144'])
+
+
+class DeadCodeEliminatorTestCase(unittest.TestCase):
+
+    def _optimize(self, text, interp=None):
+        from tinypie.interpreter import Interpreter
+        from tinypie.optimizer import DeadCodeEliminator
+        if interp is None:
+            interp = Interpreter()
+        tree = interp.parse(text)
+        dce = DeadCodeEliminator(interp.global_scope)
+        dce.optimize(tree)
+        return dce, ' '.join(tree_string(child) for child in tree.children)
+
+    def _run(self, text, interp=None):
+        from tinypie.interpreter import Interpreter
+        if interp is None:
+            interp = Interpreter(optimize=True)
+        with redirected_output() as output:
+            interp.interpret(text)
+        return output.getvalue().split()
+
+    def test_unreachable_functions(self):
+        dce, tree = self._optimize("""
+        def used(x) return helper(x)
+        def helper(x) return x
+        def unused(x) return helper(x)
+        def recursive(x) return recursive(x)
+        print used(1)
+        """)
+        self.assertEquals(dce.functions, 2)
+        self.assertEquals(
+            tree,
+            '(FUNC_DEF used x (BLOCK (return (CALL helper x)))) '
+            '(FUNC_DEF helper x (BLOCK (return x))) '
+            '(print (CALL used 1))')
+
+    def test_redefined_function(self):
+        dce, tree = self._optimize("""
+        def f() return 1
+        def f() return 2
+        print f()
+        """)
+        self.assertEquals(dce.functions, 1)
+        self.assertEquals(
+            tree, '(FUNC_DEF f (BLOCK (return 2))) (print (CALL f))')
+
+    def test_function_called_by_later_program(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        self._run('def f(x) return x * 2\n', interp)
+        self.assertEquals(self._run('print f(21)\n', interp), ['42'])
+
+    def test_dead_argument_stores(self):
+        dce, tree = self._optimize("""
+        def f(x, y):
+            y = x == 2
+            x = 3
+            unused = 1
+            return 4
+        .
+        print f(1, 2)
+        """)
+        self.assertEquals(dce.stores, 2)
+        self.assertEquals(
+            tree,
+            '(FUNC_DEF f x y (BLOCK (ASSIGN unused 1) (return 4))) '
+            '(print (CALL f 1 2))')
+
+    def test_store_read_by_later_program(self):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter(optimize=True)
+        self.assertEquals(self._run("""
+        def f(x):
+            y = x
+            return 0
+        .
+        print f(5)
+        """, interp), ['0'])
+        # y is a global variable now, f assigns it
+        self.assertEquals(self._run("""
+        y = 1
+        print f(7)
+        print y
+        """, interp), ['0', '7'])
+
+    def test_live_stores_stay(self):
+        dce, tree = self._optimize("""
+        def g() return 1
+        def f(x):
+            total = 1
+            failing = 'a' + x
+            undefined = y
+            called = g()
+            if x maybe = 1
+            later = maybe
+            if x:
+                total = total + 1
+            .
+            return total
+        .
+        total = 0
+        print f(1)
+        """)
+        self.assertEquals(dce.stores, 0)
+        self.assertEquals(
+            tree.split(' (ASSIGN total 0)')[0],
+            '(FUNC_DEF g (BLOCK (return 1))) '
+            '(FUNC_DEF f x (BLOCK (ASSIGN total 1) (ASSIGN failing (+ a x)) '
+            '(ASSIGN undefined y) (ASSIGN called (CALL g)) '
+            '(if x (BLOCK (ASSIGN maybe 1))) (ASSIGN later maybe) '
+            '(if x (BLOCK (ASSIGN total (+ total 1)))) (return total)))')
+
+    def test_call_is_kept(self):
+        output = self._run("""
+        def g(x):
+            print x
+            return x
+        .
+        def f(x):
+            x = g(x)
+            return 2
+        .
+        print f(1)
+        """)
+        self.assertEquals(output, ['1', '2'])
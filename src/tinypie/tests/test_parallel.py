@@ -0,0 +1,143 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie.interpreter import Interpreter
+from tinypie.lexer import LexerException
+from tinypie.parallel import ParallelParser, split_source
+from tinypie.parser import ParserException
+from tinypie.tests.test_interpreter import redirected_output
+
+SOURCE = """
+x = 3
+def fact(n):
+    if n < 2 return 1
+    return n * fact(n - 1)
+.
+print fact(x)
+def fact2(n) return fact(n) * 2
+# def fact3(n) return fact(n) * 3
+def greet(name) print 'hello
+def ' + name
+print fact2(x + 1)
+greet('pie')
+def fact(n) return n
+print fact(5)
+"""
+
+
+class SplitSourceTestCase(unittest.TestCase):
+
+    def test_single_piece(self):
+        self.assertEqual(split_source(SOURCE, 1), [0])
+        self.assertEqual(split_source('x = 1\nprint x\n', 4), [0])
+
+    def test_top_level_definitions(self):
+        offsets = split_source(SOURCE, 100)
+        self.assertEqual(
+            [SOURCE[offset:].split('(')[0] for offset in offsets[1:]],
+            ['def fact', 'def fact2', 'def greet', 'def fact'])
+
+    def test_size(self):
+        offsets = split_source(SOURCE, 2)
+        self.assertEqual(len(offsets), 2)
+        self.assertTrue(offsets[1] >= len(SOURCE) / 2)
+
+
+class ParallelParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = ParallelParser(processes=2, min_chunk_size=1)
+
+    def tearDown(self):
+        self.parser.close()
+
+    def _run(self, text, parallel_parser=None):
+        interp = Interpreter(parallel_parser=parallel_parser)
+        with redirected_output() as output:
+            interp.interpret(text)
+        return output.getvalue(), interp
+
+    def test_same_as_serial(self):
+        output, interp = self._run(SOURCE, self.parser)
+        expected, serial = self._run(SOURCE)
+        self.assertTrue(self.parser.chunks > 1)
+        self.assertEqual(output, expected)
+        self.assertEqual(output, '3\n8\nhello\ndef pie\n5\n')
+        self.assertEqual(sorted(interp.global_scope.symbols),
+                         sorted(serial.global_scope.symbols))
+
+    def test_tree(self):
+        tree = Interpreter(parallel_parser=self.parser).parse(SOURCE)
+        expected = Interpreter().parse(SOURCE)
+        self.assertEqual(tree.to_string_tree(), expected.to_string_tree())
+
+    def test_later_definition_wins(self):
+        interp = Interpreter(parallel_parser=self.parser)
+        interp.parse(SOURCE)
+        symbol = interp.global_scope.symbols['fact']
+        self.assertEqual(symbol.block_ast.to_string_tree(),
+                         '(<\'\', BLOCK> (<\'return\', RETURN> '
+                         '<\'n\', ID>))')
+
+    def test_lexer_error_position(self):
+        text = SOURCE + 'def broken() return $\n'
+        try:
+            Interpreter().parse(text)
+        except LexerException as e:
+            expected = e.pos
+        self.assertEqual(text[expected], '$')
+        try:
+            Interpreter(parallel_parser=self.parser).parse(text)
+        except LexerException as e:
+            self.assertEqual(e.pos, expected)
+        else:
+            self.fail('LexerException not raised')
+
+    def test_parser_error(self):
+        self.assertRaises(
+            ParserException, Interpreter(parallel_parser=self.parser).parse,
+            SOURCE.replace('return n\n', 'return n)\n'))
+
+    def test_small_source(self):
+        parser = ParallelParser(processes=2)
+        self.assertEqual(self._run(SOURCE, parser)[0],
+                         '3\n8\nhello\ndef pie\n5\n')
+        self.assertEqual(parser.chunks, 1)
+        self.assertTrue(parser.pool is None)
+        parser.close()
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(SplitSourceTestCase),
+        unittest.makeSuite(ParallelParserTestCase),
+        doctest.DocFileSuite(
+            '../parallel.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS),
+        ))
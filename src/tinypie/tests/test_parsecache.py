@@ -0,0 +1,154 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import os
+import time
+import shutil
+import doctest
+import tempfile
+import unittest
+
+from tinypie.interpreter import Interpreter
+from tinypie.parsecache import ParseCache
+from tinypie.tests.test_interpreter import redirected_output
+
+SOURCE = """
+def fact(n):
+    if n < 2 return 1
+    return n * fact(n - 1)
+.
+x = fact(5)
+print x
+"""
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, text, cache, interp=None):
+        interp = interp or Interpreter(parse_cache=cache)
+        with redirected_output() as output:
+            interp.interpret(text)
+        return output.getvalue()
+
+    def _entries(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_hit(self):
+        cache = ParseCache(self.directory)
+        self.assertEqual(self._run(SOURCE, cache), '120\n')
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(self._run(SOURCE, cache), '120\n')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(self._entries()), 1)
+
+    def test_global_symbols(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        interp = Interpreter(parse_cache=cache)
+        self._run('y = 1\n', cache, interp)
+        self.assertEqual(self._run(SOURCE, cache, interp), '120\n')
+        self.assertEqual(cache.hits, 1)
+        symbols = interp.global_scope.symbols
+        self.assertEqual(sorted(symbols), ['fact', 'x', 'y'])
+        self.assertTrue(symbols['fact'].enclosing_scope is interp.global_scope)
+        self.assertTrue(symbols['x'].scope is interp.global_scope)
+
+    def test_other_interpreters(self):
+        from tinypie.closure import ClosureInterpreter
+        from tinypie.stackless import StacklessInterpreter
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        for interp_class in (ClosureInterpreter, StacklessInterpreter):
+            interp = interp_class(optimize=True, parse_cache=cache)
+            self.assertEqual(self._run(SOURCE, cache, interp), '120\n')
+        self.assertEqual(cache.hits, 2)
+
+    def test_changed_source(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        self.assertEqual(self._run(SOURCE + 'print 1\n', cache), '120\n1\n')
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_corrupt_entry(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        path = os.path.join(self.directory, self._entries()[0])
+        with open(path, 'wb') as output:
+            output.write('garbage')
+        self.assertEqual(self._run(SOURCE, cache), '120\n')
+        self.assertEqual(cache.hits, 0)
+
+    def test_untrusted_entry(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        path = os.path.join(self.directory, self._entries()[0])
+        os.chmod(path, 0666)
+        self.assertEqual(self._run(SOURCE, cache), '120\n')
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        # the entry is written again by the current user
+        self.assertEqual(self._run(SOURCE, cache), '120\n')
+        self.assertEqual(cache.hits, 1)
+
+    def test_private_directory(self):
+        directory = os.path.join(self.directory, 'cache')
+        self._run(SOURCE, ParseCache(directory))
+        self.assertEqual(os.stat(directory).st_mode & 0777, 0700)
+
+    def test_eviction(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        size = os.path.getsize(
+            os.path.join(self.directory, self._entries()[0]))
+        cache.max_size = 2 * size + 100
+        first = self._entries()
+        for index in range(4):
+            # distinct modification times for the LRU order
+            time.sleep(0.01)
+            self._run(SOURCE + 'print %d\n' % index, cache)
+        entries = self._entries()
+        self.assertEqual(len(entries), 2)
+        self.assertFalse(first[0] in entries)
+
+    def test_clear(self):
+        cache = ParseCache(self.directory)
+        self._run(SOURCE, cache)
+        cache.clear()
+        self.assertEqual(self._entries(), [])
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(ParseCacheTestCase),
+        doctest.DocFileSuite(
+            '../parsecache.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS),
+        ))
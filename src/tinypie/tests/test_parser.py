@@ -26,6 +26,8 @@ __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
 import unittest
 
+from tinypie import tokens
+
 
 class ParserTestCase(unittest.TestCase):
 
@@ -328,3 +330,92 @@ class ASTTestCase(unittest.TestCase):
         tree.add_child(ifstat_node)
 
         self._compare_tree(tree, parser.root)
+
+    def _expr_tree(self, text):
+        parser = self._get_parser('print %s\n' % text)
+        parser.parse()
+        return parser.root.children[0].children[0].to_string_tree()
+
+    def test_expr_precedence(self):
+        self.assertEquals(
+            self._expr_tree('a + b * c < d - e'),
+            "(<'<', LT> (<'+', ADD> <'a', ID> "
+            "(<'*', MUL> <'b', ID> <'c', ID>)) "
+            "(<'-', SUB> <'d', ID> <'e', ID>))")
+        self.assertEquals(
+            self._expr_tree('(a + b) * c == 1'),
+            "(<'==', EQ> (<'*', MUL> (<'+', ADD> <'a', ID> <'b', ID>) "
+            "<'c', ID>) <'1', INT>)")
+
+    def test_expr_left_associative(self):
+        self.assertEquals(
+            self._expr_tree('a - b + c'),
+            "(<'+', ADD> (<'-', SUB> <'a', ID> <'b', ID>) <'c', ID>)")
+        self.assertEquals(
+            self._expr_tree('a * b * f(c)'),
+            "(<'*', MUL> (<'*', MUL> <'a', ID> <'b', ID>) "
+            "(<'', CALL> <'f', ID> <'c', ID>))")
+
+    def test_expr_comparison_does_not_chain(self):
+        from tinypie.parser import ParserException
+        parser = self._get_parser('print a < b < c\n')
+        self.assertRaises(ParserException, parser.parse)
+        self.assertEquals(
+            self._expr_tree('(a < b) == c'),
+            "(<'==', EQ> (<'<', LT> <'a', ID> <'b', ID>) <'c', ID>)")
+
+
+class TokenStreamASTTestCase(ASTTestCase):
+
+    def _get_parser(self, text):
+        from tinypie.lexer import Lexer
+        from tinypie.parser import TokenStreamParser
+        from tinypie.scope import GlobalScope
+
+        class Interpreter(object):
+            global_scope = GlobalScope()
+
+        parser = TokenStreamParser(
+            Lexer(text).tokenize(), interpreter=Interpreter())
+        return parser
+
+    def test_parser_exception(self):
+        from tinypie.parser import ParserException
+        parser = self._get_parser('x = (1\n')
+        self.assertRaises(ParserException, parser.parse)
+
+
+class SlotsTestCase(unittest.TestCase):
+
+    def test_no_instance_dict(self):
+        from tinypie.ast import AST
+        from tinypie.lexer import Token
+        node = AST(Token(tokens.ID, 'x'))
+        self.assertFalse(hasattr(node, '__dict__'))
+        self.assertFalse(hasattr(node.token, '__dict__'))
+        self.assertRaises(AttributeError, setattr, node, 'unknown', 1)
+
+    def test_leaves_share_empty_children(self):
+        from tinypie.ast import AST
+        first, second = AST(tokens.INT), AST(tokens.INT)
+        self.assertTrue(first.children is second.children)
+        first.add_child(AST(tokens.ID))
+        first.add_child(AST(tokens.ID))
+        self.assertEquals(len(first.children), 2)
+        self.assertEquals(second.children, ())
+
+    def test_copy(self):
+        import copy
+        from tinypie.ast import AST
+        from tinypie.lexer import Token
+        node = AST(Token(tokens.ID, 'x'))
+        node.slot = 1
+        clone = copy.copy(node)
+        self.assertEquals(clone.slot, 1)
+        self.assertTrue(clone.token is node.token)
+
+    def test_interned_types(self):
+        from tinypie.lexer import Lexer
+        lexer = Lexer('define(x) + 1')
+        self.assertTrue(lexer.token().type is tokens.ID)
+        self.assertTrue(lexer.token().type is tokens.LPAREN)
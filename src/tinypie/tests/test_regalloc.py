@@ -0,0 +1,133 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import unittest
+
+from tinypie.tests import test_compiler
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class NaiveAllocatorProgramTestCase(test_compiler.CompiledProgramTestCase):
+    """Runs the interpreter test suite on code with naive allocation."""
+
+    def _get_interpreter(self):
+        from tinypie.compiler import NaiveAllocator
+        return test_compiler.VMRunner(allocator=NaiveAllocator())
+
+
+class LinearScanAllocatorTestCase(unittest.TestCase):
+
+    def _compile(self, text, allocator):
+        from tinypie.interpreter import Interpreter
+        from tinypie.compiler import BytecodeCompiler
+
+        interp = Interpreter()
+        tree = interp.parse(text)
+        compiler = BytecodeCompiler(interp.global_scope, allocator=allocator)
+        return dict((code.name, code) for code in compiler.generate(tree))
+
+    def _locals(self, text, name):
+        from tinypie.compiler import NaiveAllocator
+        from tinypie.regalloc import LinearScanAllocator
+
+        naive = self._compile(text, NaiveAllocator())
+        linear = self._compile(text, LinearScanAllocator())
+        return (NaiveAllocator().allocate(naive[name])[1],
+                LinearScanAllocator().allocate(linear[name])[1])
+
+    def _run(self, text):
+        from tinypie.compiler import run_source
+        with redirected_output() as output:
+            run_source(text)
+        return output.getvalue().split()
+
+    def test_fewer_locals(self):
+        naive, linear = self._locals("""
+        def poly(x):
+            a = x * x + 2 * x + 1
+            b = a * a - 3 * x
+            return a + b
+        .
+        """, 'poly')
+        self.assertEquals(linear, 3)
+        self.assertTrue(naive > linear)
+
+    def test_move_coalescing(self):
+        from tinypie.compiler import BytecodeCompiler
+        from tinypie.interpreter import Interpreter
+        from tinypie.regalloc import LinearScanAllocator
+
+        interp = Interpreter()
+        tree = interp.parse("""
+        def foo(x):
+            y = x
+            return y + 1
+        .
+        """)
+        allocator = LinearScanAllocator()
+        asm = BytecodeCompiler(
+            interp.global_scope, allocator=allocator).compile(tree)
+        self.assertEquals(allocator.coalesced, 1)
+        self.assertTrue('.def foo: args=1, locals=1\n' in asm)
+        self.assertTrue('move' not in asm)
+
+    def test_call_arguments_are_consecutive(self):
+        output = self._run("""
+        def sub(x, y) return x - y
+        def one() return 1
+        def three(a, b, c) return a * 100 + b * 10 + c
+        print three(sub(9, one()), one() + 1, sub(one() + 5, 3))
+        """)
+        self.assertEquals(output, ['823'])
+
+    def test_value_live_across_loop(self):
+        output = self._run("""
+        def sum(n):
+            total = 0
+            step = 2
+            i = 0
+            while i < n:
+                tmp = i * step
+                total = total + tmp
+                i = i + 1
+            .
+            return total + step
+        .
+        print sum(5)
+        """)
+        self.assertEquals(output, ['22'])
+
+    def test_dead_registers_reused(self):
+        naive, linear = self._locals("""
+        def foo(x):
+            y = x + 1
+            z = y * 2
+            return z
+        .
+        """, 'foo')
+        self.assertEquals(naive, 4)
+        self.assertEquals(linear, 1)
@@ -0,0 +1,107 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import unittest
+
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class SlotResolverTestCase(unittest.TestCase):
+
+    def _parse(self, text):
+        from tinypie.interpreter import Interpreter
+        interp = Interpreter()
+        tree = interp.parse(text)
+        return interp, tree
+
+    def test_global_slots(self):
+        interp, tree = self._parse("""
+        x = 1
+        y = x
+        """)
+        assign_x, assign_y = tree.children
+        self.assertEquals(interp.global_slots, {'x': 0, 'y': 1})
+        self.assertEquals(assign_x.slot, None)
+        self.assertEquals(assign_x.global_slot, 0)
+        self.assertEquals(assign_y.children[1].global_slot, 0)
+        self.assertEquals(len(interp.globals.values), 2)
+
+    def test_function_slots(self):
+        interp, tree = self._parse("""
+        def foo(x, y):
+            z = x + y
+            return z
+        .
+        """)
+        func_symbol = tree.children[0].symbol
+        self.assertEquals(func_symbol.slots, {'x': 0, 'y': 1, 'z': 2})
+
+        assign, ret = func_symbol.block_ast.children
+        self.assertEquals(assign.slot, 2)
+        self.assertEquals(assign.children[1].children[0].slot, 0)
+        self.assertEquals(assign.children[1].children[1].slot, 1)
+        self.assertEquals(ret.children[0].slot, 2)
+
+    def test_non_local_name(self):
+        interp, tree = self._parse("""
+        def foo() return g
+        """)
+        func_symbol = tree.children[0].symbol
+        load = func_symbol.block_ast.children[0].children[0]
+        self.assertEquals(load.slot, None)
+        self.assertEquals(load.global_slot, interp.global_slots['g'])
+
+    def test_global_slots_persist_between_runs(self):
+        from tinypie.interpreter import Interpreter
+
+        interp = Interpreter()
+        interp.interpret("""
+        def foo() return g
+        """)
+        with redirected_output() as output:
+            interp.interpret("""
+            g = 42
+            print foo()
+            """)
+        self.assertEquals(output.getvalue().strip(), '42')
+
+    def test_local_assign_before_global_exists(self):
+        from tinypie.interpreter import Interpreter
+
+        interp = Interpreter()
+        with redirected_output() as output:
+            interp.interpret("""
+            def foo():
+                x = 3
+                print x
+            .
+            foo()
+            x = 1
+            foo()
+            print x
+            """)
+        self.assertEquals(output.getvalue().split(), ['3', '3', '3'])
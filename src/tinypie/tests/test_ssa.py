@@ -0,0 +1,430 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie.compiler import run_source
+from tinypie.tests import test_compiler
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class SSAProgramTestCase(test_compiler.CompiledProgramTestCase):
+    """Runs the interpreter test suite on code compiled through SSA."""
+
+    def _get_interpreter(self):
+        return test_compiler.VMRunner(ssa=True)
+
+
+def build(text, passes=()):
+    """Return name -> SSA function of the program after the passes."""
+    from tinypie.compiler import global_indexes
+    from tinypie.interpreter import Interpreter
+    from tinypie.ssa import SSABuilder, verify
+    from tinypie.typeinfer import TypeInference
+
+    interp = Interpreter()
+    tree = interp.parse(text)
+    TypeInference().infer(tree)
+    functions = SSABuilder(interp.global_scope, global_indexes(tree)).build(
+        tree)
+    for function in functions:
+        verify(function)
+        for optimization in passes:
+            optimization.run(function)
+            verify(function)
+    return dict((function.name, function) for function in functions)
+
+
+def ops(function):
+    return [instruction.op
+            for block in function.blocks
+            for instruction in block.phis + block.instructions]
+
+
+class SSABuilderTestCase(unittest.TestCase):
+
+    def test_join_gets_phi_for_changed_variable(self):
+        function = build("""
+        def f(x):
+            y = 1
+            z = 2
+            if x < 3 y = 4
+            return y + z
+        .
+        """)['f']
+        phis = function.blocks[-1].phis
+        self.assertEqual(len(phis), 1)
+        self.assertEqual([arg.data for arg in phis[0].args], [4, 1])
+
+    def test_loop_header_phis(self):
+        function = build("""
+        def f(n):
+            i = 0
+            s = 0
+            while i < n:
+                s = s + i
+                i = i + 1
+            .
+            return s
+        .
+        """)['f']
+        header = function.blocks[1]
+        self.assertEqual(len(header.phis), 2)
+        self.assertEqual(header.predecessors,
+                         [function.entry, function.blocks[2]])
+
+    def test_loop_invariant_variable_has_no_phi(self):
+        function = build("""
+        def f(n):
+            k = 5
+            while n < k:
+                n = n + 1
+            .
+            return k
+        .
+        """)['f']
+        self.assertEqual(ops(function).count('phi'), 1)
+
+    def test_globals(self):
+        function = build("""
+        x = 1
+        x = x + 2
+        print x
+        """)['main']
+        self.assertEqual(ops(function), [
+            'const', 'gstore', 'gload', 'const', 'iadd', 'gstore',
+            'gload', 'print', 'halt'])
+
+    def test_read_before_assignment(self):
+        function = build("""
+        def f(x):
+            if x print y
+            y = 1
+        .
+        """)['f']
+        self.assertTrue('undef' in ops(function))
+
+    def test_unreachable_code_after_return(self):
+        function = build("""
+        def f(x):
+            return x
+            print x
+        .
+        """)['f']
+        self.assertEqual(ops(function), ['param', 'ret'])
+
+    def test_unreachable_code_after_top_level_return(self):
+        text = 'print 1\nreturn 2\nprint 3\nx = 4\n'
+        self.assertEqual(ops(build(text)['main']),
+                         ['const', 'print', 'const', 'halt'])
+
+        with redirected_output() as output:
+            run_source(text, ssa=True)
+        self.assertEqual(output.getvalue(), '1\n')
+
+    def test_undefined_name(self):
+        from tinypie.compiler import CompilerException
+
+        self.assertRaises(CompilerException, build, 'print x\n')
+
+
+class VerifyTestCase(unittest.TestCase):
+
+    def _function(self):
+        return build("""
+        def f(x):
+            if x < 2 x = x + 1
+            return x
+        .
+        """)['f']
+
+    def test_missing_terminator(self):
+        from tinypie.ssa import SSAException, verify
+
+        function = self._function()
+        function.blocks[-1].instructions.pop()
+        self.assertRaises(SSAException, verify, function)
+
+    def test_use_not_dominated_by_definition(self):
+        from tinypie.ssa import SSAException, verify
+
+        function = self._function()
+        then_block = function.blocks[1]
+        value = then_block.instructions[-2]
+        ret = function.blocks[-1].terminator
+        ret.drop_args()
+        ret.add_arg(value)
+        self.assertRaises(SSAException, verify, function)
+
+    def test_broken_def_use_chain(self):
+        from tinypie.ssa import SSAException, verify
+
+        function = self._function()
+        function.blocks[-1].terminator.args[0].uses = []
+        self.assertRaises(SSAException, verify, function)
+
+
+class ConstantPropagationTestCase(unittest.TestCase):
+
+    def _build(self, text):
+        from tinypie.ssa import ConstantPropagation
+
+        return build(text, [ConstantPropagation()])
+
+    def test_fold(self):
+        function = self._build("""
+        def f() return 1 + 2 * 3
+        """)['f']
+        self.assertTrue('const 7' in str(function))
+        self.assertFalse('iadd' in ops(function))
+
+    def test_resolve_branch(self):
+        function = self._build("""
+        def f(x):
+            y = 2
+            if y < 3 return x
+            else print x
+            return 1
+        .
+        """)['f']
+        self.assertEqual(len(function.blocks), 2)
+        self.assertFalse('print' in ops(function))
+
+    def test_conditional_constant(self):
+        # x stays 1: the else branch never executes and does not
+        # spoil the value merged in the loop header
+        function = self._build("""
+        def f(n):
+            x = 1
+            while n < 10:
+                if x == 1:
+                    x = 1
+                .
+                else:
+                    x = 2
+                .
+                n = n + 1
+            .
+            return x
+        .
+        """)['f']
+        self.assertFalse('const 2' in str(function))
+        ret = [block.terminator for block in function.blocks
+               if block.terminator.op == 'ret'][0]
+        self.assertEqual((ret.args[0].op, ret.args[0].data), ('const', 1))
+
+    def test_run_time_errors_are_kept(self):
+        function = self._build("""
+        def f() return 'a' + 1
+        """)['f']
+        self.assertTrue('add' in ops(function))
+
+    def test_long_strings_are_not_built(self):
+        from tinypie.optimizer import MAX_STRING_LENGTH
+
+        function = self._build("""
+        def f() return '%s' + 'a'
+        """ % ('a' * MAX_STRING_LENGTH))['f']
+        self.assertTrue('add' in ops(function))
+
+
+class GlobalValueNumberingTestCase(unittest.TestCase):
+
+    def _build(self, text):
+        from tinypie.ssa import GlobalValueNumbering
+
+        return build(text, [GlobalValueNumbering()])
+
+    def test_redundant_expression(self):
+        function = self._build("""
+        def f(x, y):
+            print x * y
+            if x print y * x
+        .
+        """)['f']
+        self.assertEqual(ops(function).count('mul'), 1)
+
+    def test_string_concatenation_is_not_commutative(self):
+        function = self._build("""
+        def f(x, y):
+            print x + y
+            print y + x
+        .
+        """)['f']
+        self.assertEqual(ops(function).count('add'), 2)
+
+    def test_not_dominated_expression_is_kept(self):
+        function = self._build("""
+        def f(x, y):
+            if x print x * y
+            else print y
+            print x * y
+        .
+        """)['f']
+        self.assertEqual(ops(function).count('mul'), 2)
+
+    def test_global_load_forwarding(self):
+        function = self._build("""
+        x = 1
+        print x
+        print x
+        """)['main']
+        self.assertEqual(ops(function),
+                         ['const', 'gstore', 'print', 'print', 'halt'])
+
+    def test_call_invalidates_loads(self):
+        function = self._build("""
+        def g() x = 2
+        x = 1
+        g()
+        print x
+        """)['main']
+        self.assertTrue('gload' in ops(function))
+
+
+class DeadCodeEliminationTestCase(unittest.TestCase):
+
+    def _build(self, text):
+        from tinypie.ssa import DeadCodeElimination
+
+        return build(text, [DeadCodeElimination()])
+
+    def test_unused_values(self):
+        function = self._build("""
+        def f(x):
+            y = 2 * 3
+            z = x == 1
+            return x
+        .
+        """)['f']
+        self.assertEqual(ops(function), ['param', 'ret'])
+
+    def test_failing_arithmetic_is_kept(self):
+        function = self._build("""
+        def f(x):
+            y = x + 1
+            return x
+        .
+        """)['f']
+        self.assertTrue('add' in ops(function))
+
+    def test_bypass_empty_block(self):
+        function = self._build("""
+        def f(x):
+            if x print 1
+            print 2
+        .
+        """)['f']
+        # the empty else block is gone
+        self.assertEqual(len(function.blocks), 3)
+        self.assertEqual(function.entry.successors[1], function.blocks[-1])
+
+    def test_merge_blocks(self):
+        from tinypie.ssa import ConstantPropagation, DeadCodeElimination
+
+        function = build("""
+        def f(x):
+            if 1 < 2 print 1
+            print 2
+        .
+        """, [ConstantPropagation(), DeadCodeElimination()])['f']
+        self.assertEqual(len(function.blocks), 1)
+        self.assertEqual(ops(function),
+                         ['const', 'print', 'const', 'print', 'ret'])
+
+
+class LoweringTestCase(unittest.TestCase):
+
+    def test_loop_has_no_moves(self):
+        from tinypie.compiler import compile_source
+
+        asm = compile_source("""
+        def f(n):
+            i = 0
+            s = 0
+            while i < n:
+                s = s + i * 2
+                i = i + 1
+            .
+            return s
+        .
+        print f(5)
+        """, ssa=True)
+        loop = asm[asm.index('L1:'):asm.index('br L1')]
+        self.assertFalse('move' in loop)
+
+    def test_swap(self):
+        # the phis read each other: moves go through temporaries
+        with redirected_output() as output:
+            run_source("""
+            def f(n):
+                a = 1
+                b = 2
+                while 0 < n:
+                    t = a
+                    a = b
+                    b = t
+                    n = n - 1
+                .
+                print a
+                print b
+            .
+            f(3)
+            """, ssa=True)
+        self.assertEqual(output.getvalue(), '2\n1\n')
+
+    def test_report(self):
+        from tinypie.compiler import BytecodeCompiler
+        from tinypie.interpreter import Interpreter
+
+        interp = Interpreter()
+        compiler = BytecodeCompiler(interp.global_scope, ssa=True)
+        compiler.compile(interp.parse("""
+        x = 2 * 3
+        if x == 6 print x
+        """))
+        self.assertEqual(compiler.ssa_optimizer.report(), '\n'.join([
+            'global value numbering: 1 redundant values removed',
+            'constant propagation: 2 values folded, 1 branches resolved',
+            'dead code elimination: 4 instructions, 2 blocks removed']))
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(SSAProgramTestCase),
+        unittest.makeSuite(SSABuilderTestCase),
+        unittest.makeSuite(VerifyTestCase),
+        unittest.makeSuite(ConstantPropagationTestCase),
+        unittest.makeSuite(GlobalValueNumberingTestCase),
+        unittest.makeSuite(DeadCodeEliminationTestCase),
+        unittest.makeSuite(LoweringTestCase),
+        doctest.DocFileSuite(
+            '../ssa.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS),
+        ))
@@ -0,0 +1,76 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class StacklessInterpreterTestCase(test_interpreter.InterpreterTestCase):
+    """Runs the interpreter test suite on the explicit work stack."""
+
+    def _get_interpreter(self):
+        from tinypie.stackless import StacklessInterpreter
+        interp = StacklessInterpreter()
+        return interp
+
+    def test_deep_recursion(self):
+        depth = 200000
+        interp = self._get_interpreter()
+        with redirected_output() as output:
+            interp.interpret("""
+            def count(n):
+                if n == 0 return 0
+                return 1 + count(n - 1)
+            .
+            print count(%d)
+            """ % depth)
+        self.assertEquals(output.getvalue().strip(), str(depth))
+        self.assertEquals(interp.func_stack, [])
+
+    def test_return_unwinds_pending_work(self):
+        interp = self._get_interpreter()
+        with redirected_output() as output:
+            interp.interpret("""
+            def first(n):
+                while 1:
+                    if n == 3 return 'done'
+                    n = n + 1
+                .
+            .
+            print first(0) + '!'
+            """)
+        self.assertEquals(output.getvalue().strip(), 'done!')
+
+    def test_wrong_number_of_arguments(self):
+        from tinypie.interpreter import InterpreterException
+
+        interp = self._get_interpreter()
+        self.assertRaises(
+            InterpreterException, interp.interpret, """
+            def foo(x, y) return x
+            foo(1)
+            """)
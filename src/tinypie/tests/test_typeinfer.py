@@ -0,0 +1,149 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+import doctest
+import unittest
+
+from tinypie.tests import test_interpreter
+from tinypie.tests.test_interpreter import redirected_output
+
+
+class TypeInferenceTestCase(unittest.TestCase):
+
+    def _infer(self, text, known_globals=()):
+        from tinypie.interpreter import Interpreter
+        from tinypie.typeinfer import TypeInference
+        tree = Interpreter().parse(text)
+        inference = TypeInference(known_globals)
+        inference.infer(tree)
+        return inference, tree
+
+    def _arg_types(self, inference):
+        return dict((name, arg_type)
+                    for (func_symbol, name), arg_type
+                    in inference.args.items())
+
+    def test_literals_and_operators(self):
+        inference, tree = self._infer("""
+        a = 1 + 2
+        b = 'x' * 3
+        c = 1 < 2
+        d = a + b
+        e = 'x' - 'y'
+        """)
+        self.assertEquals(inference.names, {
+            'a': int, 'b': str, 'c': bool, 'd': None, 'e': None})
+
+    def test_join_of_assignments(self):
+        inference, tree = self._infer("""
+        x = 1
+        x = 'a'
+        y = 1
+        y = y + 1
+        """)
+        self.assertEquals(inference.names, {'x': None, 'y': int})
+
+    def test_arguments_and_returns(self):
+        inference, tree = self._infer("""
+        def inc(x) return x + 1
+        def greet(name) return 'hi ' + name
+        def maybe(x):
+            if x < 1 return 1
+        .
+        a = inc(inc(1))
+        b = greet('bob')
+        c = maybe(2)
+        """)
+        self.assertEquals(self._arg_types(inference),
+                          {'x': int, 'name': str})
+        self.assertEquals(inference.names, {'a': int, 'b': str, 'c': None})
+
+    def test_function_writes_global(self):
+        # the assignment in foo writes the global x
+        inference, tree = self._infer("""
+        def foo():
+            x = 'a'
+        .
+        x = 1
+        foo()
+        y = x + 1
+        """)
+        self.assertEquals(inference.names['x'], None)
+        assign_y = tree.children[-1]
+        self.assertEquals(assign_y.children[1].static_type, None)
+
+    def test_known_globals(self):
+        inference, tree = self._infer("""
+        def inc(x) return x + 1
+        y = inc(1) + z
+        """, known_globals=['z'])
+        self.assertEquals(self._arg_types(inference), {'x': None})
+        self.assertEquals(inference.names, {'y': None})
+
+    def test_annotations(self):
+        from tinypie.typeinfer import is_int
+        inference, tree = self._infer("""
+        i = 0
+        while i < 10 i = i + 1
+        """)
+        loop = tree.children[1]
+        self.assertEquals(loop.children[0].static_type, bool)
+        self.assertTrue(is_int(loop.children[0].children[0]))
+
+
+class IntegerClosureTestCase(unittest.TestCase):
+
+    def test_specialized_closures(self):
+        from tinypie.closure import ClosureInterpreter
+        with redirected_output() as output:
+            ClosureInterpreter().interpret("""
+            def fact(n):
+                if n < 2 return 1
+                return n * fact(n - 1)
+            .
+            def rep(s, n) return s * n
+            i = 0
+            while 0 < 3 - i i = i + 1
+            print fact(10)
+            print 2 * i
+            print 10 - i
+            print i == 3
+            print rep('ab', 2)
+            """)
+        self.assertEquals(output.getvalue().split(),
+                          ['3628800', '6', '7', 'True', 'abab'])
+
+
+def test_suite():
+    return unittest.TestSuite((
+        unittest.makeSuite(TypeInferenceTestCase),
+        unittest.makeSuite(IntegerClosureTestCase),
+        doctest.DocFileSuite(
+            '../typeinfer.py',
+            optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS
+            ),
+        ))
@@ -291,9 +291,84 @@ class VMTestCase(unittest.TestCase):
         self.assertEquals(int(output.getvalue().strip()), 120)
 
 
+class QuickeningTestCase(unittest.TestCase):
+
+    # calls 'op' at a single address with the arguments in r1 and r2
+    PROGRAM = """
+    .def op: args=2, locals=0
+        %s r0, r1, r2
+        ret
+    .def main: args=0, locals=2
+    %s
+        halt
+    """
+
+    def _run(self, instruction, calls, quicken=True):
+        from tinypie.lexer import AssemblerLexer
+        from tinypie.assembler import BytecodeAssembler
+        from tinypie.vm import VM
+        lines = []
+        for left, right in calls:
+            lines.append('    loadk r1, %s' % left)
+            lines.append('    loadk r2, %s' % right)
+            lines.append('    call op, r1')
+            lines.append('    print r0')
+        assembler = BytecodeAssembler(AssemblerLexer(
+            self.PROGRAM % (instruction, '\n'.join(lines))))
+        assembler.parse()
+        vm = VM(assembler, quicken=quicken)
+        with redirected_output() as output:
+            vm.execute()
+        return vm, output.getvalue().split()
+
+    def test_quicken_int(self):
+        for instruction, result in (('add', '5'), ('sub', '-1'),
+                                    ('mul', '6'), ('lt', '1'), ('eq', '0')):
+            vm, output = self._run(instruction, [(2, 3), (2, 3)])
+            self.assertEquals(output, [result, result])
+            self.assertEquals(vm.instruction_name(0), instruction + '_int')
+            self.assertEquals(vm.quickenings, 1)
+
+    def test_quicken_str(self):
+        vm, output = self._run('add', [("'a'", "'b'"), ("'c'", "'d'")])
+        self.assertEquals(output, ['ab', 'cd'])
+        self.assertEquals(vm.instruction_name(0), 'add_str')
+
+    def test_deoptimize(self):
+        vm, output = self._run(
+            'add', [(1, 2), ("'a'", "'b'"), (3, 4), ("'c'", "'d'")])
+        self.assertEquals(output, ['3', 'ab', '7', 'cd'])
+        self.assertEquals(vm.instruction_name(0), 'add')
+        self.assertEquals((vm.quickenings, vm.deoptimizations), (1, 1))
+        self.assertEquals(vm.megamorphic, set([0]))
+
+    def test_deoptimize_comparison(self):
+        vm, output = self._run('lt', [(1, 2), ("'b'", "'a'"), (1, 2)])
+        self.assertEquals(output, ['1', '0', '1'])
+        self.assertEquals(vm.instruction_name(0), 'lt')
+
+    def test_mixed_operands_stay_generic(self):
+        vm, output = self._run('mul', [("'a'", 2), ("'b'", 3)])
+        self.assertEquals(output, ['aa', 'bbb'])
+        self.assertEquals(vm.instruction_name(0), 'mul')
+        self.assertEquals(vm.quickenings, 0)
+
+    def test_no_quicken(self):
+        vm, output = self._run('add', [(1, 2), (3, 4)], quicken=False)
+        self.assertEquals(output, ['3', '7'])
+        self.assertEquals(vm.instruction_name(0), 'add')
+
+    def test_integer_instructions(self):
+        vm, output = self._run('ilt', [(1, 2), (2, 1)])
+        self.assertEquals(output, ['True', 'False'])
+        vm, output = self._run('imul', [(4, 5)])
+        self.assertEquals(output, ['20'])
+
+
 def test_suite():
     return unittest.TestSuite((
         unittest.makeSuite(VMTestCase),
+        unittest.makeSuite(QuickeningTestCase),
         doctest.DocFileSuite(
             '../vm.py',
             optionflags=doctest.NORMALIZE_WHITESPACE|doctest.ELLIPSIS
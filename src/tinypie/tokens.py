@@ -24,6 +24,8 @@
 
 __author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
 
+# Token types are interned strings, the lexers hand out these very
+# objects so comparisons succeed on the identity check.
 
 DEF = 'DEF'
 BLOCK = 'BLOCK'
@@ -0,0 +1,257 @@
+###############################################################################
+#
+# Copyright (c) 2011 Ruslan Spivak
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+###############################################################################
+
+
+__author__ = 'Ruslan Spivak <ruslan.spivak@gmail.com>'
+
+from tinypie import tokens
+from tinypie.optimizer import called_function, global_names
+
+# Lattice element below every type: no value reaches the node
+NOTHING = object()
+# Lattice element above every type
+UNKNOWN = None
+
+
+def join(first, second):
+    if first is NOTHING:
+        return second
+    if second is NOTHING or first == second:
+        return first
+    return UNKNOWN
+
+
+def may_fall_through(block):
+    """Return True if executing the block may not end with 'return'."""
+    for statement in block.children:
+        if statement.type == tokens.RETURN:
+            return False
+        if (statement.type == tokens.IF and len(statement.children) == 3
+            and not may_fall_through(statement.children[1])
+            and not may_fall_through(statement.children[2])):
+            return False
+    return True
+
+
+class TypeInference(object):
+    """Flow-insensitive static type inference.
+
+    Infers one type for every variable name, formal argument and
+    function return value of the program and annotates expression
+    nodes with 'static_type': int, str, bool or None if the type is
+    not known. bool is kept apart from int because it prints
+    differently.
+
+    A variable assigned inside a function may be the global variable
+    of the same name, so all assignments to a name outside of formal
+    arguments share one type. A formal argument gets the types of the
+    arguments passed to it by the calls in the program, unless names
+    from earlier runs of the interpreter exist: their functions could
+    call the functions of this program with anything.
+
+    >>> from tinypie.interpreter import Interpreter
+    >>> from tinypie.typeinfer import TypeInference
+    >>>
+    >>> tree = Interpreter().parse('''
+    ... def fact(n):
+    ...     if n < 2 return 1
+    ...     return n * fact(n - 1)
+    ... .
+    ... x = fact(5)
+    ... s = 'a' + 'b'
+    ... ''')
+    >>> inference = TypeInference()
+    >>> inference.infer(tree)
+    >>> sorted(inference.names.items())
+    [('s', <type 'str'>), ('x', <type 'int'>)]
+    >>> fact = tree.children[0].symbol
+    >>> inference.returns[fact]
+    <type 'int'>
+
+    """
+
+    def __init__(self, known_globals=()):
+        # names of global variables from earlier runs
+        self.known_globals = set(known_globals)
+        # variable name -> type
+        self.names = {}
+        # (FunctionSymbol, argument name) -> type
+        self.args = {}
+        # FunctionSymbol -> type of the returned value
+        self.returns = {}
+        self.globals = set()
+        self.functions = set()
+        self.changed = False
+
+    def infer(self, tree):
+        self.globals = global_names(tree) | self.known_globals
+        self.functions = set(node.symbol for node in tree.children
+                             if node.type == tokens.FUNC_DEF)
+
+        if self.known_globals:
+            for func_symbol in self.functions:
+                for arg in func_symbol.formal_args:
+                    self.args[func_symbol, arg.name] = UNKNOWN
+
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            self._visit(tree, None)
+
+        self._annotate(tree, None)
+
+    def _update(self, table, key, value):
+        current = table.get(key, NOTHING)
+        new = join(current, value)
+        if new != current:
+            table[key] = new
+            self.changed = True
+
+    def _is_arg(self, name, func_symbol):
+        return (func_symbol is not None and
+                name in [arg.name for arg in func_symbol.formal_args])
+
+    def _visit(self, node, func_symbol):
+        node_type = node.type
+
+        if node_type == tokens.FUNC_DEF:
+            func_symbol = node.symbol
+            block = node.children[-1]
+            self._visit(block, func_symbol)
+            if may_fall_through(block):
+                self._update(self.returns, func_symbol, UNKNOWN)
+
+        elif node_type == tokens.ASSIGN:
+            name = node.children[0].text
+            value_type = self._type(node.children[1], func_symbol)
+            if self._is_arg(name, func_symbol):
+                self._update(self.args, (func_symbol, name), value_type)
+            if not self._is_arg(name, func_symbol) or name in self.globals:
+                self._update(self.names, name, value_type)
+
+        elif node_type == tokens.RETURN:
+            value_type = self._type(node.children[0], func_symbol)
+            if func_symbol is not None:
+                self._update(self.returns, func_symbol, value_type)
+
+        elif node_type in (tokens.PRINT, tokens.CALL):
+            self._type(node.children[0] if node_type == tokens.PRINT
+                       else node, func_symbol)
+
+        elif node_type in (tokens.IF, tokens.WHILE):
+            self._type(node.children[0], func_symbol)
+            for child in node.children[1:]:
+                self._visit(child, func_symbol)
+
+        else:
+            for child in node.children:
+                self._visit(child, func_symbol)
+
+    def _type(self, node, func_symbol):
+        """Return type of expression, record types of call arguments."""
+        node_type = node.type
+
+        if node_type == tokens.INT:
+            return int
+
+        if node_type == tokens.STRING:
+            return str
+
+        if node_type == tokens.ID:
+            return self._name_type(node.text, func_symbol)
+
+        if node_type == tokens.CALL:
+            arg_types = [self._type(child, func_symbol)
+                         for child in node.children[1:]]
+            callee = called_function(node)
+            if callee is None or callee not in self.functions:
+                return UNKNOWN
+            for arg, arg_type in zip(callee.formal_args, arg_types):
+                self._update(self.args, (callee, arg.name), arg_type)
+            return self.returns.get(callee, NOTHING)
+
+        left = self._type(node.children[0], func_symbol)
+        right = self._type(node.children[1], func_symbol)
+        if left is NOTHING or right is NOTHING:
+            return NOTHING
+
+        if node_type in (tokens.LT, tokens.EQ):
+            return bool
+
+        if left is int and right is int:
+            return int
+
+        if node_type == tokens.ADD and left is str and right is str:
+            return str
+
+        if (node_type == tokens.MUL and
+            (left, right) in ((str, int), (int, str))):
+            return str
+
+        return UNKNOWN
+
+    def _name_type(self, name, func_symbol):
+        if name in self.known_globals:
+            return UNKNOWN
+
+        if self._is_arg(name, func_symbol):
+            arg_type = self.args.get((func_symbol, name), NOTHING)
+            if name in self.globals:
+                # every engine reads the argument, not the global: the
+                # join only widens the type, the same way an assignment
+                # to the argument widens the type of the global in _visit
+                arg_type = join(arg_type, self.names.get(name, NOTHING))
+            return arg_type
+
+        return self.names.get(name, NOTHING)
+
+    def _annotate(self, node, func_symbol):
+        node_type = node.type
+
+        if node_type == tokens.FUNC_DEF:
+            func_symbol = node.symbol
+
+        if node_type in (tokens.INT, tokens.STRING, tokens.ID, tokens.CALL,
+                         tokens.ADD, tokens.SUB, tokens.MUL,
+                         tokens.LT, tokens.EQ):
+            static_type = self._type(node, func_symbol)
+            if static_type is NOTHING:
+                static_type = UNKNOWN
+            node.static_type = static_type
+
+        children = node.children
+        if node_type in (tokens.ASSIGN, tokens.CALL):
+            # skip the assigned variable and the function name
+            children = children[1:]
+        for child in children:
+            self._annotate(child, func_symbol)
+
+
+def static_type(node):
+    """Return type TypeInference proved for the node or None."""
+    return getattr(node, 'static_type', None)
+
+
+def is_int(node):
+    return static_type(node) is int
@@ -32,6 +32,28 @@ from tinypie import bytecode
 from tinypie import asmutils
 from tinypie.lexer import AssemblerLexer
 from tinypie.assembler import FunctionSymbol, BytecodeAssembler
+from tinypie.bytecode import (
+    INSTR_ADD, INSTR_SUB, INSTR_MUL, INSTR_LT, INSTR_EQ,
+    INSTR_LOADK, INSTR_GLOAD, INSTR_GSTORE, INSTR_RET, INSTR_HALT,
+    INSTR_BR, INSTR_BRT, INSTR_BRF, INSTR_MOVE, INSTR_PRINT, INSTR_CALL,
+    INSTR_IADD, INSTR_ISUB, INSTR_IMUL, INSTR_ILT, INSTR_IEQ,
+    INSTR_ADD_INT, INSTR_ADD_STR, INSTR_SUB_INT, INSTR_MUL_INT,
+    INSTR_LT_INT, INSTR_EQ_INT,
+    )
+
+# (generic opcode, operand type) -> quickened opcode
+QUICKENED = {
+    (INSTR_ADD, int): INSTR_ADD_INT,
+    (INSTR_ADD, str): INSTR_ADD_STR,
+    (INSTR_SUB, int): INSTR_SUB_INT,
+    (INSTR_MUL, int): INSTR_MUL_INT,
+    (INSTR_LT, int): INSTR_LT_INT,
+    (INSTR_EQ, int): INSTR_EQ_INT,
+    }
+
+# quickened opcode -> generic opcode
+GENERIC = dict((quickened, generic)
+               for (generic, _), quickened in QUICKENED.items())
 
 
 class StackFrame(object):
@@ -82,11 +104,23 @@ class VM(object):
     0058: PRINT   r0             main.registers=[13 | 13 7 0]  calls=[main]
     13
 
+    Bytecode is decoded once into a list of instructions that is
+    executed and can be rewritten in place. Quickening uses that: a
+    generic add, sub, mul, lt or eq instruction that sees two int
+    operands (add also two str operands) turns itself into add_int,
+    add_str, sub_int, mul_int, lt_int or eq_int. Those check that the
+    operands still have the type they expect and take the fast path,
+    otherwise the instruction is turned back into the generic one for
+    good and the site stays generic.
+
+    >>> vm.instruction_name(18)
+    'lt_int'
+
     """
 
     CALL_STACK_SIZE = 1000
 
-    def __init__(self, assembler, trace=False):
+    def __init__(self, assembler, trace=False, quicken=True):
         self.main_function = assembler.main_function
         self.code = assembler.code
         self.code_size = assembler.code_size
@@ -99,6 +133,14 @@ class VM(object):
         # frame pointer
         self.fp = -1
         self.trace = trace
+        # writable decoded instructions the VM executes
+        self.instructions = self._decode()
+        # rewrite generic instructions for the operand types they see
+        self.quicken = quicken
+        self.quickenings = 0
+        self.deoptimizations = 0
+        # addresses of instructions that saw different operand types
+        self.megamorphic = set()
         # initialize disassmbler
         self.disasm = asmutils.DisAssembler(
             self.code, self.code_size, self.constant_pool)
@@ -121,122 +163,242 @@ class VM(object):
     def disassemble(self):
         self.disasm.disassemble()
 
+    def _decode(self):
+        """Decode bytecode into a writable instruction stream.
+
+        Returns list indexed by code address. The entry for the address
+        an instruction starts at is [opcode, next address, operand...]
+        with constant pool operands replaced by the pool entries. The
+        entry at code_size halts the VM.
+        """
+        code = self.code
+        constant_pool = self.constant_pool
+        instructions = [None] * (self.code_size + 1)
+        instructions[self.code_size] = [bytecode.INSTR_HALT, self.code_size]
+
+        address = 0
+        while address < self.code_size:
+            opcode = code[address]
+            ip = address + 1
+            operands = []
+            for operand_type in bytecode.INSTRUCTIONS[opcode].operand_types:
+                operand = asmutils.get_int(code, ip)
+                if operand_type in (bytecode.POOL, bytecode.FUNC):
+                    operand = constant_pool[operand]
+                operands.append(operand)
+                ip += 4
+            instructions[address] = [opcode, ip] + operands
+            address = ip
+
+        return instructions
+
+    def _quicken(self, instruction, address, left, right):
+        """Rewrite generic instruction for the operand types just seen."""
+        if address in self.megamorphic:
+            return
+
+        kind = type(left)
+        if kind is not type(right) or kind not in (int, str):
+            return
+
+        quickened = QUICKENED.get((instruction[0], kind))
+        if quickened is not None:
+            instruction[0] = quickened
+            self.quickenings += 1
+
+    def _deoptimize(self, instruction, address):
+        """Rewrite quickened instruction back to the generic one.
+
+        The site is not quickened again, it has seen several types.
+        """
+        instruction[0] = GENERIC[instruction[0]]
+        self.megamorphic.add(address)
+        self.deoptimizations += 1
+
     def _cpu(self):
-        """Simulate fetch-decode-execute cycle."""
-        opcode = self.code[self.ip]
-        while opcode != bytecode.INSTR_HALT and self.ip < self.code_size:
-            if self.trace:
+        """Simulate fetch-decode-execute cycle on decoded instructions."""
+        instructions = self.instructions
+        calls = self.calls
+        globals_ = self.globals
+        trace = self.trace
+        quicken = self.quicken
+
+        ip = self.ip
+        fp = self.fp
+        regs = calls[fp].registers
+
+        while True:
+            instruction = instructions[ip]
+            opcode = instruction[0]
+
+            if opcode == INSTR_HALT:
+                break
+
+            if trace:
+                self.ip, self.fp = ip, fp
                 self._trace()
-            # first operand of an instruction
-            self.ip += 1
-            # shortcut to current registers
-            regs = self.calls[self.fp].registers
-
-            if opcode == bytecode.INSTR_ADD:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                c = self._get_reg_operand()
-                regs[a] = regs[b] + regs[c]
-
-            elif opcode == bytecode.INSTR_SUB:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                c = self._get_reg_operand()
-                regs[a] = regs[b] - regs[c]
-
-            elif opcode == bytecode.INSTR_MUL:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                c = self._get_reg_operand()
-                regs[a] = regs[b] * regs[c]
-
-            elif opcode == bytecode.INSTR_PRINT:
-                a = self._get_reg_operand()
-                print regs[a]
-
-            elif opcode == bytecode.INSTR_MOVE:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                regs[a] = regs[b]
-
-            elif opcode == bytecode.INSTR_LOADK:
-                a = self._get_reg_operand()
-                index = self._get_int_operand()
-                regs[a] = self.constant_pool[index]
-
-            elif opcode == bytecode.INSTR_LT:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                c = self._get_reg_operand()
-                regs[a] = int(regs[b] < regs[c])
-
-            elif opcode == bytecode.INSTR_EQ:
-                a = self._get_reg_operand()
-                b = self._get_reg_operand()
-                c = self._get_reg_operand()
-                regs[a] = int(regs[b] == regs[c])
-
-            elif opcode == bytecode.INSTR_BR:
-                address = self._get_int_operand()
-                self.ip = address
-
-            elif opcode == bytecode.INSTR_BRT:
-                a = self._get_reg_operand()
-                address = self._get_int_operand()
-                if bool(regs[a]):
-                    self.ip = address
-
-            elif opcode == bytecode.INSTR_BRF:
-                a = self._get_reg_operand()
-                address = self._get_int_operand()
-                if not bool(regs[a]):
-                    self.ip = address
-
-            elif opcode == bytecode.INSTR_GSTORE:
-                index = self._get_int_operand()
-                a = self.constant_pool[index]
-                b = self._get_reg_operand()
-                self.globals[a] = regs[b]
-
-            elif opcode == bytecode.INSTR_GLOAD:
-                a = self._get_reg_operand()
-                index = self._get_int_operand()
-                b = self.constant_pool[index]
-                regs[a] = self.globals[b]
-
-            elif opcode == bytecode.INSTR_CALL:
-                self._call()
-
-            elif opcode == bytecode.INSTR_RET:
-                stack_frame = self.calls[self.fp]
-                self.fp -= 1
-                self.calls[self.fp].registers[0] = stack_frame.registers[0]
-                self.ip = stack_frame.return_address
-
-            opcode = self.code[self.ip]
-
-    def _call(self):
-        calling_frame = self.calls[self.fp]
-        index = self._get_int_operand()
-        base_reg = self._get_int_operand()
-        func_symbol = self.constant_pool[index]
-        stack_frame = StackFrame(func_symbol, self.ip)
-
-        for a in range(func_symbol.args):
-            stack_frame.registers[a + 1] = \
-                                    calling_frame.registers[base_reg + a]
 
-        self.fp += 1
-        self.calls[self.fp] = stack_frame
-        self.ip = func_symbol.address
-
-    def _get_reg_operand(self):
-        return self._get_int_operand()
-
-    def _get_int_operand(self):
-        word = asmutils.get_int(self.code, self.ip)
-        self.ip += 4
-        return word
+            if opcode == INSTR_ADD_INT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is not int or type(right) is not int:
+                    self._deoptimize(instruction, ip)
+                regs[instruction[2]] = left + right
+
+            elif opcode == INSTR_LT_INT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is int and type(right) is int:
+                    regs[instruction[2]] = 1 if left < right else 0
+                else:
+                    self._deoptimize(instruction, ip)
+                    regs[instruction[2]] = int(left < right)
+
+            elif opcode == INSTR_BRF:
+                if not regs[instruction[2]]:
+                    ip = instruction[3]
+                    continue
+
+            elif opcode == INSTR_LOADK:
+                regs[instruction[2]] = instruction[3]
+
+            elif opcode == INSTR_MOVE:
+                regs[instruction[2]] = regs[instruction[3]]
+
+            elif opcode == INSTR_BR:
+                ip = instruction[2]
+                continue
+
+            elif opcode == INSTR_SUB_INT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is not int or type(right) is not int:
+                    self._deoptimize(instruction, ip)
+                regs[instruction[2]] = left - right
+
+            elif opcode == INSTR_MUL_INT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is not int or type(right) is not int:
+                    self._deoptimize(instruction, ip)
+                regs[instruction[2]] = left * right
+
+            elif opcode == INSTR_EQ_INT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is int and type(right) is int:
+                    regs[instruction[2]] = 1 if left == right else 0
+                else:
+                    self._deoptimize(instruction, ip)
+                    regs[instruction[2]] = int(left == right)
+
+            elif opcode == INSTR_ADD_STR:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                if type(left) is not str or type(right) is not str:
+                    self._deoptimize(instruction, ip)
+                regs[instruction[2]] = left + right
+
+            elif opcode == INSTR_GLOAD:
+                regs[instruction[2]] = globals_[instruction[3]]
+
+            elif opcode == INSTR_GSTORE:
+                globals_[instruction[2]] = regs[instruction[3]]
+
+            elif opcode == INSTR_CALL:
+                func_symbol = instruction[2]
+                base_reg = instruction[3]
+                stack_frame = StackFrame(func_symbol, instruction[1])
+                registers = stack_frame.registers
+                for a in range(func_symbol.args):
+                    registers[a + 1] = regs[base_reg + a]
+
+                fp += 1
+                calls[fp] = stack_frame
+                regs = registers
+                ip = func_symbol.address
+                continue
+
+            elif opcode == INSTR_RET:
+                stack_frame = calls[fp]
+                fp -= 1
+                regs = calls[fp].registers
+                regs[0] = stack_frame.registers[0]
+                ip = stack_frame.return_address
+                continue
+
+            elif opcode == INSTR_ADD:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                regs[instruction[2]] = left + right
+                if quicken:
+                    self._quicken(instruction, ip, left, right)
+
+            elif opcode == INSTR_SUB:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                regs[instruction[2]] = left - right
+                if quicken:
+                    self._quicken(instruction, ip, left, right)
+
+            elif opcode == INSTR_MUL:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                regs[instruction[2]] = left * right
+                if quicken:
+                    self._quicken(instruction, ip, left, right)
+
+            elif opcode == INSTR_LT:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                regs[instruction[2]] = int(left < right)
+                if quicken:
+                    self._quicken(instruction, ip, left, right)
+
+            elif opcode == INSTR_EQ:
+                left = regs[instruction[3]]
+                right = regs[instruction[4]]
+                regs[instruction[2]] = int(left == right)
+                if quicken:
+                    self._quicken(instruction, ip, left, right)
+
+            elif opcode == INSTR_BRT:
+                if regs[instruction[2]]:
+                    ip = instruction[3]
+                    continue
+
+            elif opcode == INSTR_PRINT:
+                print regs[instruction[2]]
+
+            # integer instructions, operands proved by the compiler
+            elif opcode == INSTR_IADD:
+                regs[instruction[2]] = (regs[instruction[3]] +
+                                        regs[instruction[4]])
+
+            elif opcode == INSTR_ISUB:
+                regs[instruction[2]] = (regs[instruction[3]] -
+                                        regs[instruction[4]])
+
+            elif opcode == INSTR_IMUL:
+                regs[instruction[2]] = (regs[instruction[3]] *
+                                        regs[instruction[4]])
+
+            elif opcode == INSTR_ILT:
+                # the result only feeds a branch, no conversion to int
+                regs[instruction[2]] = (regs[instruction[3]] <
+                                        regs[instruction[4]])
+
+            elif opcode == INSTR_IEQ:
+                regs[instruction[2]] = (regs[instruction[3]] ==
+                                        regs[instruction[4]])
+
+            ip = instruction[1]
+
+        self.ip, self.fp = ip, fp
+
+    def instruction_name(self, address):
+        """Return current name of the instruction at the address."""
+        return bytecode.INSTRUCTIONS[self.instructions[address][0]].name
 
     def _trace(self):
         _, instr_text = self.disasm.disassemble_instruction(self.code, self.ip)
@@ -291,16 +453,32 @@ def main():
                       help='Print disassembled code to standard output.')
     parser.add_option('-t', '--trace', action='store_true', dest='trace',
                       help='Print execution trace.')
+    parser.add_option('-O', '--optimize', action='store_true',
+                      dest='optimize',
+                      help='Remove dead code before assembling.')
+    parser.add_option('--no-quicken', action='store_false', dest='quicken',
+                      default=True,
+                      help='Do not specialize instructions at run time.')
     options, args = parser.parse_args()
 
+    # without -O the assembly is lexed in chunks as it is read
     if options.file is not None:
-        text = open(options.file).read()
+        source = open(options.file, 'rb')
     else:
-        text = sys.stdin.read()
-
-    assembler = BytecodeAssembler(AssemblerLexer(text))
-    assembler.parse()
-    vm = VM(assembler, trace=options.trace)
+        source = sys.stdin
+
+    try:
+        if options.optimize:
+            assembler = BytecodeAssembler(AssemblerLexer(
+                asmutils.DeadCodeStripper().strip(source.read())))
+        else:
+            assembler = BytecodeAssembler(AssemblerLexer(source))
+        assembler.parse()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    vm = VM(assembler, trace=options.trace, quicken=options.quicken)
     vm.execute()
 
     if options.coredump: